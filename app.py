@@ -1,29 +1,35 @@
 # -*- coding: utf-8 -*-
 import streamlit as st
 import pandas as pd
-import matplotlib.pyplot as plt
 from datetime import datetime, date
+import functools
 import json
-from io import BytesIO
-from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle, Image
-from reportlab.lib.pagesizes import A4
-from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-from reportlab.lib.enums import TA_CENTER, TA_RIGHT
-from reportlab.lib.units import mm
-from reportlab.lib import colors
-from reportlab.pdfbase import pdfmetrics
-from reportlab.pdfbase.ttfonts import TTFont
-from reportlab.lib.utils import ImageReader
-import base64
 
-
-# === PDF 用 日本語フォント ===
-pdfmetrics.registerFont(TTFont('IPAexGothic', 'ipaexg.ttf'))
-
-# === Matplotlib 用 日本語フォント ===
-from matplotlib import font_manager, rcParams
-font_manager.fontManager.addfont("ipaexg.ttf")
-rcParams["font.family"] = "IPAexGothic"
+from graphs import (
+    thermal_graph_png, fuel_cell_graph_png, water_treatment_graph_png,
+    thermal_chart_data, fuel_cell_chart_data, water_treatment_chart_data,
+    THERMAL_SPEC, FUEL_CELL_SPEC, WATER_TREATMENT_SPEC,
+)
+from photos import ingest_photo, get_renditions, json_default, PhotoStore, collect_photo_refs, is_photo_ref, PHOTO_REF_PREFIX
+from archive import write_archive, read_save_header, load_save_file, materialize_exp_state
+from autosave import get_autosave_store
+from caching import content_hash
+from derived import derive_table, discharge_summary_rows, thermal_fit_rows, apply_editor_edits, edited_columns
+from perf import measure_cpu, begin_run, end_run
+from scoring import QUESTION_DICT, achievement_rate
+from tables import TABLE_SCHEMAS, empty_table, coerce_table, table_records
+from logger_import import LOG_KEYS, LoggerImportError, import_logger_csv, full_table
+from report_pdf import EXP_DATA_KEYS, ReportState, report_filename, resolve_report_input, cached_report_pdf, PDF_OUTPUT_ACTION
+from pdf_jobs import submit_pdf_job, get_pdf_scheduler
+
+
+# 日本語フォント（PDF・グラフ用）の登録と ReportLab / Matplotlib の読み込みは、
+# 起動を速くするため、それぞれを最初に使うとき（report_layout.py・graphs.py）に行う
+
+# 全体の再実行のCPU時間計測（セクション単位の部分再実行と比較するため）
+_run_timer = begin_run()
+# 全体の再実行の通し番号（セクション単独の再実行ではここは実行されない。report_section で使う）
+st.session_state["_full_run_seq"] = st.session_state.get("_full_run_seq", 0) + 1
 
 
 # -----------------------
@@ -37,26 +43,31 @@ def get_academic_year(d):
     else:
         return d.year - 1
 
-# テーマごとに管理するデータキー
-EXP_DATA_KEYS = [
-    "tools_list", "references_list", "evaluation_method",
-    "melting_point_df", "result_df", "lit_cu", "lit_al", "lit_sus", "thermal_conductivity_ref", "comparison_text", "apparatus_photo_data",
-    "fc_charge_df", "fc_discharge_1", "fc_discharge_2", "fc_discharge_3", "fc_comparison_text",
-    "wt_original_water_photo", "wt_proto1_dev_photo", "wt_proto1_water_photo", "wt_proto1_text", "wt_proto2_dev_photo", "wt_proto2_water_photo", "wt_proto2_text", "wt_clarity_df", "wt_coagulation_photo", "wt_coagulation_text", "wt_comparison_text"
-]
+# テーマごとに管理するデータキーは report_pdf.EXP_DATA_KEYS（保存ファイルからPDFを作るときも同じ一覧を使う）
 
 # 共同実験者と共有するデータキー（①実験方法、②実験結果入力）
 SHARE_DATA_KEYS = [
     "tools_list", "evaluation_method", "apparatus_photo_data",
-    "melting_point_df", "result_df",
+    "melting_point_df", "result_df", "result_df_log",
     "fc_charge_df", "fc_discharge_1", "fc_discharge_2", "fc_discharge_3",
+    "fc_discharge_1_log", "fc_discharge_2_log", "fc_discharge_3_log",
     "wt_original_water_photo", "wt_proto1_dev_photo", "wt_proto1_water_photo", "wt_proto1_text",
     "wt_proto2_dev_photo", "wt_proto2_water_photo", "wt_proto2_text", "wt_clarity_df",
     "wt_coagulation_photo", "wt_coagulation_text"
 ]
 
-def add_history_log(action, detail=""):
-    """更新履歴にエントリを追加する"""
+# 写真データのキー（session_stateには縮小済み画像のバイト列を保持する）
+PHOTO_KEYS = [
+    "apparatus_photo_data",
+    "wt_original_water_photo", "wt_proto1_dev_photo", "wt_proto1_water_photo",
+    "wt_proto2_dev_photo", "wt_proto2_water_photo", "wt_coagulation_photo"
+]
+
+# 写真ストアに実体を置く項目（写真と、データロガーから取り込んだ全点の記録）
+BLOB_KEYS = PHOTO_KEYS + list(LOG_KEYS.values())
+
+def add_history_log(action, detail="", **extra):
+    """更新履歴にエントリを追加する（extra はエントリにそのまま追加する項目）"""
     if "history_log" not in st.session_state:
         st.session_state.history_log = []
     
@@ -67,7 +78,8 @@ def add_history_log(action, detail=""):
         "timestamp": timestamp,
         "user": user_info,
         "action": action,
-        "detail": detail
+        "detail": detail,
+        **extra
     }
     st.session_state.history_log.append(entry)
 
@@ -77,9 +89,9 @@ def get_current_exp_state():
     for k in EXP_DATA_KEYS:
         if k in st.session_state:
             val = st.session_state[k]
-            # DataFrameは辞書に変換
+            # DataFrameは辞書に変換（空欄のNaNはnull）
             if isinstance(val, pd.DataFrame):
-                state[k] = val.to_dict(orient="records")
+                state[k] = table_records(val)
             else:
                 state[k] = val
     # 設問データと確認チェックも追加
@@ -100,14 +112,18 @@ def apply_exp_state(state):
             df_cols = {
                 "tools_list": ["器具・装置・薬品名", "用途・役割など"],
                 "references_list": ["書籍名・サイト名", "著者・発行者", "発行年・URL"],
-                "fc_discharge_1": None, "fc_discharge_2": None, "fc_discharge_3": None,
-                "melting_point_df": None, "result_df": None, "fc_charge_df": None, "wt_clarity_df": None
             }
-            if k in df_cols:
+            if k in TABLE_SCHEMAS:
+                # 測定表は数値の型にそろえ（以前の文字列の保存データもここで変換）、派生列を計算し直す
+                st.session_state[k] = derive_table(k, coerce_table(k, v))
+            elif k in df_cols:
                 df = pd.DataFrame(v)
                 if df_cols[k] and df.empty:
                     df = pd.DataFrame(columns=df_cols[k])
                 st.session_state[k] = df
+            elif k in PHOTO_KEYS:
+                # 写真は参照で保持（旧形式のbase64文字列は縮小してストアに登録）
+                st.session_state[k] = st.session_state.photo_store.import_value(v)
             else:
                 if k.startswith("check_") and not isinstance(v, bool):
                     st.session_state[k] = False
@@ -118,7 +134,9 @@ def apply_exp_state(state):
     for k in EXP_DATA_KEYS:
         if k not in state:
             # 各キーごとのデフォルト処理（簡易化のためresetの一部を流用）
-            pass # 必要なら個別実装
+            if k in BLOB_KEYS and k not in PHOTO_KEYS:
+                # ロガーの記録のない（以前の）保存データでは、表は手入力の値として扱う
+                st.session_state[k] = None
 
 @st.dialog("⚠️ 実験タイトルの切り替え")
 def confirm_exp_title_change_dialog(new_title):
@@ -137,7 +155,8 @@ def confirm_exp_title_change_dialog(new_title):
         
         # 新しいタイトルのデータを復元（なければ初期化）
         if new_title in st.session_state.experiment_registry:
-            apply_exp_state(st.session_state.experiment_registry[new_title])
+            # 復元直後で未展開のテーマはここで初めて展開する
+            apply_exp_state(materialize_exp_state(st.session_state.experiment_registry[new_title]))
         else:
             reset_experiment_data()
 
@@ -158,12 +177,11 @@ def confirm_exp_title_change_dialog(new_title):
             st.session_state.exp_title_selector = st.session_state.exp_title
         st.rerun()
 
-@st.dialog("⚠️ JSONからの復元")
+@st.dialog("⚠️ 保存ファイルからの復元")
 def confirm_json_restore_dialog(uploaded_file):
     try:
-        # 情報を確認するために一度パース
-        uploaded_file.seek(0)
-        data = json.load(uploaded_file)
+        # 情報を確認するために一度パース（ZIPの場合は manifest.json のみ）
+        data = read_save_header(uploaded_file)
         
         g = data.get("global_info", {})
         saved_year = g.get("academic_year")
@@ -249,6 +267,9 @@ def confirm_collator_data_import_dialog(uploaded_file):
 
         col1, col2 = st.columns(2)
         if col1.button("上書きを実行", use_container_width=True):
+            # 写真の実体を先にストアへ読み込む
+            st.session_state.photo_store.load_blobs(data.get("photo_blobs"))
+
             # データの反映
             for k in SHARE_DATA_KEYS:
                 if k in data:
@@ -256,18 +277,22 @@ def confirm_collator_data_import_dialog(uploaded_file):
                     # DataFrameの復元
                     df_cols = {
                         "tools_list": ["器具・装置・薬品名", "用途・役割など"],
-                        "melting_point_df": None, "result_df": None,
-                        "fc_charge_df": None, "fc_discharge_1": None, 
-                        "fc_discharge_2": None, "fc_discharge_3": None,
-                        "wt_clarity_df": None
                     }
-                    if k in df_cols:
+                    if k in TABLE_SCHEMAS:
+                        st.session_state[k] = derive_table(k, coerce_table(k, v))
+                    elif k in df_cols:
                         df = pd.DataFrame(v)
                         if df_cols[k] and df.empty:
                             df = pd.DataFrame(columns=df_cols[k])
                         st.session_state[k] = df
+                    elif k in PHOTO_KEYS:
+                        st.session_state[k] = st.session_state.photo_store.import_value(v)
                     else:
                         st.session_state[k] = v
+            # ロガーの記録のない共有データで表を上書きしたら、前の記録との対応を外す
+            for table_key, log_key in LOG_KEYS.items():
+                if table_key in data and log_key not in data:
+                    st.session_state[log_key] = None
             
             # 安全確認チェックの反映
             for k, v in data.items():
@@ -281,6 +306,7 @@ def confirm_collator_data_import_dialog(uploaded_file):
                         "fc_d2_editor", "fc_d3_editor"]:
                 if key in st.session_state:
                     del st.session_state[key]
+            collect_photo_garbage()
             
             # 履歴の追加（誰のデータを取り込んだかを明記）
             add_history_log("共有用ファイルの読み込み", f"提供者: {shared_by} / ファイル: {uploaded_file.name}")
@@ -319,8 +345,11 @@ def show_history_dialog():
         st.rerun()
 
 def perform_json_restore(uploaded_file):
+    """復元用ファイル（新形式のZIP・旧形式のJSON）から全データを復元する"""
     try:
-        data = json.load(uploaded_file)
+        # 写真の実体（各写真1つずつ）はここでストアへ読み込まれる
+        # 現在のテーマ以外は未展開のまま保持し、切り替え時に展開する
+        data = load_save_file(uploaded_file, st.session_state.photo_store, eager_title=st.session_state.exp_title)
         
         # 基本情報
         if "global_info" in data:
@@ -350,7 +379,7 @@ def perform_json_restore(uploaded_file):
             # 現在のタイトルに合わせたデータをカレントに反映
             cur_title = st.session_state.exp_title
             if cur_title in st.session_state.experiment_registry:
-                apply_exp_state(st.session_state.experiment_registry[cur_title])
+                apply_exp_state(materialize_exp_state(st.session_state.experiment_registry[cur_title]))
         else:
             # 互換性維持：registryがない場合はトップレベルのデータをカレントとして扱う
             apply_exp_state(data)
@@ -361,7 +390,8 @@ def perform_json_restore(uploaded_file):
         if "exp_title_selector" in st.session_state:
             st.session_state.exp_title_selector = st.session_state.exp_title
 
-        st.success("JSONを読み込みました")
+        collect_photo_garbage()
+        st.success("保存ファイルを読み込みました")
     except Exception as e:
         st.error(f"読み込みエラー: {e}")
 
@@ -375,30 +405,25 @@ def reset_experiment_data():
     })
     st.session_state.evaluation_method = ""
     # Exp 1
-    st.session_state.melting_point_df = pd.DataFrame({
-        "1回目(℃)": [""], "2回目(℃)": [""], "3回目(℃)": [""], "平均(℃)": [""]
-    }, index=["融解温度(℃)"])
-    st.session_state.result_df = pd.DataFrame({
-        "距離(cm)": [2, 4, 6, 8, 10, 12],
-        "銅(sec)": [""]*6, "アルミ(sec)": [""]*6, "ステンレス(sec)": [""]*6
-    })
+    st.session_state.melting_point_df = empty_table("melting_point_df")
+    st.session_state.result_df = empty_table("result_df")
     st.session_state.lit_cu = ""; st.session_state.lit_al = ""; st.session_state.lit_sus = ""
     st.session_state.thermal_conductivity_ref = ""; st.session_state.comparison_text = ""
     st.session_state.apparatus_photo_data = None
     # Exp 2
-    st.session_state.fc_charge_df = pd.DataFrame({
-        "充電時間(sec)": ["","",""], "充電電圧(V)": ["","",""], "開回路電圧(V)": ["","",""]
-    }, index=["1回目", "2回目", "3回目"])
-    st.session_state.fc_discharge_1 = init_discharge_df()
-    st.session_state.fc_discharge_2 = init_discharge_df()
-    st.session_state.fc_discharge_3 = init_discharge_df()
+    st.session_state.fc_charge_df = empty_table("fc_charge_df")
+    st.session_state.fc_discharge_1 = empty_table("fc_discharge_1")
+    st.session_state.fc_discharge_2 = empty_table("fc_discharge_2")
+    st.session_state.fc_discharge_3 = empty_table("fc_discharge_3")
+    for log_key in LOG_KEYS.values():
+        st.session_state[log_key] = None
     st.session_state.fc_comparison_text = ""
     # Exp 3
     st.session_state.wt_original_water_photo = None; st.session_state.wt_proto1_dev_photo = None
     st.session_state.wt_proto1_water_photo = None; st.session_state.wt_proto1_text = ""
     st.session_state.wt_proto2_dev_photo = None; st.session_state.wt_proto2_water_photo = None
     st.session_state.wt_proto2_text = ""
-    st.session_state.wt_clarity_df = pd.DataFrame({"浄化対象の水": [""], "試作検討①": [""], "試作検討②": [""]}, index=["清澄度"])
+    st.session_state.wt_clarity_df = empty_table("wt_clarity_df")
     st.session_state.wt_coagulation_photo = None; st.session_state.wt_coagulation_text = ""
     st.session_state.wt_comparison_text = ""
     # Questions & Checks
@@ -410,140 +435,338 @@ def reset_experiment_data():
         if key in st.session_state: del st.session_state[key]
 
 
-def create_proportional_image(img_io, max_width=100*mm, max_height=75*mm):
-    """アスペクト比を維持しつつ、指定の枠内に収まるReportLab Imageを作成する"""
+def collect_photo_garbage():
+    """現在の入力・実験レジストリのどこからも参照されていない写真をストアから削除する"""
+    live = collect_photo_refs({k: st.session_state.get(k) for k in BLOB_KEYS})
+    live |= collect_photo_refs(st.session_state.get("experiment_registry", {}))
+    st.session_state.photo_store.gc(live)
+
+def store_uploaded_photo(uploaded, state_key):
+    """アップロードされた写真を縮小・再圧縮してsession_stateに保存する（アップロードごとに1回だけ）"""
+    marker = f"_photo_upload_id_{state_key}"
+    if st.session_state.get(marker) == uploaded.file_id:
+        return
     try:
-        img_reader = ImageReader(img_io)
-        iw, ih = img_reader.getSize()
-        aspect = ih / float(iw)
-        
-        width = max_width
-        height = width * aspect
-        
-        if height > max_height:
-            height = max_height
-            width = height / aspect
-            
-        return Image(img_io, width=width, height=height)
-    except:
-        # 失敗時はデフォルトサイズで返す
-        return Image(img_io, width=max_width, height=max_height)
+        result = ingest_photo(uploaded.getvalue())
+    except Exception as e:
+        st.error(f"画像読み込みエラー: {e}")
+        return
+    ref = st.session_state.photo_store.put(result.data)
+    st.session_state[state_key] = ref
+    st.session_state[marker] = uploaded.file_id
+    st.session_state[f"_photo_ingest_{state_key}"] = result.summary()
+    # 差し替え前の写真が不要になっていれば削除
+    collect_photo_garbage()
+    # プレビュー用サムネイルもアップロード時に作っておく
+    get_renditions(ref, st.session_state.photo_store)
+
+def show_photo_preview(state_key):
+    """写真のプレビュー（サムネイル）と最適化結果を表示する"""
+    renditions = get_renditions(st.session_state.get(state_key), st.session_state.photo_store)
+    if renditions is None:
+        return
+    st.image(renditions.thumbnail, width="stretch")
+    summary = st.session_state.get(f"_photo_ingest_{state_key}")
+    if summary:
+        st.caption(f"📉 写真を最適化しました: {summary}")
+
+def clear_photo(state_key, uploader_key):
+    """写真とアップローダーの状態を削除する"""
+    st.session_state[state_key] = None
+    st.session_state.pop(f"_photo_ingest_{state_key}", None)
+    st.session_state.pop(f"_photo_upload_id_{state_key}", None)
+    if uploader_key in st.session_state:
+        del st.session_state[uploader_key]
+    collect_photo_garbage()
 
 
 # -----------------------
-# 初期化関数
+# 自動保存（REPORT_AUTOSAVE_DIR 設定時のみ）
 # -----------------------
-def init_state(key, default):
-    if key not in st.session_state:
-        st.session_state[key] = default
+EDITOR_KEYS = ["tools_list_editor", "references_list_editor", "melting_point_editor", "result_df_editor",
+               "wt_clarity_editor", "fc_charge_editor", "fc_d1_editor", "fc_d2_editor", "fc_d3_editor"]
+
+def _autosave_snapshot():
+    """自動保存の対象（EXP_DATA_KEYS・設問・確認チェック）を key → JSON文字列 にする"""
+    return {k: json.dumps(v, ensure_ascii=False, sort_keys=True, default=json_default)
+            for k, v in get_current_exp_state().items()}
+
+def _autosave_enabled():
+    return get_autosave_store() is not None and st.session_state.get("student_id") not in ("", "00", None)
+
+def autosave_session():
+    """前回の再実行から変わったキーだけを自動保存に送る（書き込みは別スレッドで行う）"""
+    store = get_autosave_store()
+    if store is None:
+        return
+    snapshot = _autosave_snapshot()
+    digests = {k: hash(v) for k, v in snapshot.items()}
+    previous = st.session_state.get("_autosave_digests")
+    st.session_state["_autosave_digests"] = digests
+    # セッション開始直後は基準を記録するだけ（初期値で既存の自動保存を上書きしないため）
+    if previous is None or not _autosave_enabled():
+        return
+    changes = {k: v for k, v in snapshot.items() if previous.get(k) != digests[k]}
+    key = (st.session_state.student_id, st.session_state.exp_title)
+    if st.session_state.get("_autosave_key") != key:
+        # 保存先が変わった（出席番号の入力・テーマの切り替え）ときは差分ではなく全体を書く。
+        # 保存先に以前の自動保存があれば、復元できるように次の変更まで書かずに残す
+        if not changes and store.last_saved_at(*key) is not None:
+            return
+        changes = snapshot
+        st.session_state["_autosave_key"] = key
+    if not changes:
+        return
+    refs = {json.loads(v) for k, v in changes.items() if k in BLOB_KEYS}
+    photos = {ref: st.session_state.photo_store.get(ref) for ref in refs if is_photo_ref(ref)}
+    store.submit(st.session_state.student_id, st.session_state.exp_title, changes, photos)
+
+def restore_from_autosave():
+    """自動保存から現在のテーマの入力状態を復元する"""
+    store = get_autosave_store()
+    state, photos = store.load(st.session_state.student_id, st.session_state.exp_title)
+    st.session_state.photo_store.load_blobs({ref[len(PHOTO_REF_PREFIX):]: data for ref, data in photos.items()})
+    apply_exp_state(state)
+    for key in EDITOR_KEYS:
+        if key in st.session_state:
+            del st.session_state[key]
+    collect_photo_garbage()
+    add_history_log("自動保存からの復元", f"テーマ: {st.session_state.exp_title}")
+    # 復元した状態を基準にする（同じ内容を書き戻さない）
+    st.session_state["_autosave_digests"] = {k: hash(v) for k, v in _autosave_snapshot().items()}
+    st.session_state["_autosave_key"] = (st.session_state.student_id, st.session_state.exp_title)
+
 
 # -----------------------
-# グラフ作成関数
+# 測定表の入力
 # -----------------------
-def create_graph():
-    plt.rcParams["font.family"] = "IPAexGothic" # PDF用にもIPAフォントが安全だが、環境による。一旦汎用日本語フォント
-    # Streamlit Cloud等ではIPAexGothicがシステムに入っていない場合があるが、
-    # ここではローカル実行前提またはipaexg.ttf利用前提で進める
-    
-    # 既に登録済みのipaexg.ttfをMatplotlibで使うのは少々手間(FontProperties等)。
-    # 簡易的に "Yu Gothic" や "Meiryo" 等、Windows標準をトライしつつ、
-    # フォールバックする実装が望ましいが、今回は既存コードの "Yu Gothic" を踏襲。
-    plt.rcParams["font.family"] = "IPAexGothic"
-    
-    fig, ax = plt.subplots(figsize=(6,4))
-    
-    df = st.session_state.result_df
-    # X軸
-    x = pd.to_numeric(df["距離(cm)"], errors="coerce")
-    
-    # プロット
-    legend_labels = []
-    for col, label, color in zip(
-        ["銅(sec)", "アルミ(sec)", "ステンレス(sec)"],
-        ["銅", "アルミ", "ステンレス"],
-        ["#ff7f0e", "#1f77b4", "#7f7f7f"] # 簡易的な色指定(matplotlib default準拠)
-    ):
-        y = pd.to_numeric(df[col], errors="coerce")
-        mask = ~y.isna()
-        if mask.any() and (~x.isna()).any(): # xもvalidである必要あり
-             # xとyのindex整合性を取るため、df全体でmaskする方が安全だが
-             # ここでは簡易的に直列データとして扱う(df構造が保証されている前提)
-             # xのmaskも考慮
-             valid_indices = mask & ~x.isna()
-             if valid_indices.any():
-                ax.plot(x[valid_indices], y[valid_indices], marker="o", label=label, color=color)
-                legend_labels.append(label)
-    ax.set_xlabel("パイプ端からの距離(cm)")
-    ax.set_ylabel("融解時間 (sec)")
-    ax.grid(True)
-    if legend_labels:
-        ax.legend()
-    return fig
-
-def create_fuel_cell_graph():
-    plt.rcParams["font.family"] = "IPAexGothic"
-    fig, ax = plt.subplots(figsize=(6,4))
-    
-    # 3回分のデータをプロット
-    colors = ["#ff7f0e", "#1f77b4", "#2ca02c"]
-    labels = ["1回目", "2回目", "3回目"]
-    dfs = [st.session_state.fc_discharge_1, st.session_state.fc_discharge_2, st.session_state.fc_discharge_3]
-    
-    has_plot = False
-    for i, df in enumerate(dfs):
+def number_column_config(state_key, disabled=()):
+    """測定表（tables.TABLE_SCHEMAS）の列ごとの NumberColumn 設定
+
+    disabled: 自動計算する列など、入力できない列
+    """
+    return {
+        col: st.column_config.NumberColumn(
+            col, format="plain", step=spec.step, min_value=spec.min_value, max_value=spec.max_value,
+            disabled=col in disabled,
+        )
+        for col, spec in TABLE_SCHEMAS[state_key].columns.items()
+    }
+
+
+# -----------------------
+# データロガーのCSVの取り込み
+# -----------------------
+def detach_logger_log(state_key):
+    """表を手で編集したら、取り込んだ全点の記録との対応を外す（以後は表の値で計算する）"""
+    log_key = LOG_KEYS.get(state_key)
+    if log_key and st.session_state.get(log_key):
+        st.session_state[log_key] = None
+        st.session_state.pop(f"_log_import_{state_key}", None)
+
+def logger_csv_uploader(state_key, editor_key):
+    """データロガーのCSVを表に取り込むアップローダー（表の data_editor より前に置く）
+
+    全点の記録は写真ストアに置き、表には間引いた行を入れる（logger_import.py）。
+    """
+    log_key = LOG_KEYS[state_key]
+    uploader_key = f"u_log_{state_key}"
+    marker = f"_log_upload_id_{state_key}"
+    uploaded = st.file_uploader("データロガーのCSVを取り込む", type=["csv", "txt"], key=uploader_key)
+    if uploaded is not None and st.session_state.get(marker) != uploaded.file_id:
+        st.session_state[marker] = uploaded.file_id
         try:
-             # 時間(sec) vs 出力(mW)
-             t = pd.to_numeric(df["放電時間(sec)"], errors="coerce")
-             # 出力列は "出力(mW)" を使用
-             p = pd.to_numeric(df["出力(mW)"], errors="coerce")
-             
-             mask = ~t.isna() & ~p.isna()
-             if mask.any():
-                 ax.plot(t[mask], p[mask], marker="o", label=labels[i], color=colors[i])
-                 has_plot = True
-        except Exception:
-            pass
-
-    ax.set_xlabel("放電時間 (sec)")
-    ax.set_ylabel("出力 (mW)") # ≒ エネルギー的な指標として出力を使用
-    ax.grid(True)
-    if has_plot:
-        ax.legend()
-    return fig
-
-def create_water_treatment_graph():
-    plt.rcParams["font.family"] = "IPAexGothic"
-    fig, ax = plt.subplots(figsize=(6,4))
-    
-    df = st.session_state.wt_clarity_df
-    stages = ["浄化対象の水", "試作検討①", "試作検討②"]
-    values = []
-    
-    for s in stages:
-        if s in df.columns:
-            val = pd.to_numeric(df[s].iloc[0], errors="coerce")
-            values.append(val if not pd.isna(val) else 0)
+            with measure_cpu("ロガーCSVの取り込み"):
+                imported = import_logger_csv(uploaded, state_key)
+        except (LoggerImportError, ValueError) as e:
+            st.error(f"CSV読み込みエラー: {e}")
         else:
-            values.append(0)
-            
-    bars = ax.bar(stages, values, color=["#d62728", "#1f77b4", "#2ca02c"])
-    
-    ax.set_ylabel("清澄度[点]/1000点（水道水）")
-    ax.set_ylim(0, 1100)
-    ax.grid(True, axis='y', linestyle='--', alpha=0.7)
-    
-    for bar in bars:
-        height = bar.get_height()
-        ax.text(bar.get_x() + bar.get_width()/2., height + 5,
-                f'{int(height)}', ha='center', va='bottom')
-            
-    return fig
+            st.session_state[state_key] = imported.table
+            st.session_state[log_key] = st.session_state.photo_store.put(imported.log)
+            st.session_state[f"_log_import_{state_key}"] = imported.summary()
+            # 入力欄の編集状態は前の表に対するものなので捨てる
+            st.session_state.pop(editor_key, None)
+            collect_photo_garbage()
+            add_history_log("ロガーCSVの取り込み", f"{uploaded.name}: {imported.rows}行")
+
+    if st.session_state.get(log_key):
+        summary = st.session_state.get(f"_log_import_{state_key}") or "データロガーの記録を取り込んであります。"
+        st.caption(f"📈 {summary} 発生エネルギーなどは全点の記録で計算します（表を編集すると表の値で計算します）。")
+        if st.button("取り込んだ記録を削除", key=f"btn_del_log_{state_key}"):
+            st.session_state[state_key] = empty_table(state_key)
+            st.session_state[log_key] = None
+            st.session_state.pop(f"_log_import_{state_key}", None)
+            st.session_state.pop(marker, None)
+            st.session_state.pop(editor_key, None)
+            if uploader_key in st.session_state:
+                del st.session_state[uploader_key]
+            collect_photo_garbage()
+            st.rerun()
+
+
+# -----------------------
+# 派生列を持つ表の入力
+# -----------------------
+def derived_data_editor(state_key, **kwargs):
+    """派生列（平均・出力など）を持つ表の data_editor（行数固定の表用）
+
+    編集は on_change コールバック（スクリプト実行前）で表に反映して派生列まで計算するので、
+    st.rerun() をしなくても、その回の実行で派生列の表示が更新される。
+    派生列は derived.TABLE_FORMULAS の式で、編集された列に依存するものだけを計算し直す。
+    """
+    editor_key = kwargs["key"]
+
+    def _on_change():
+        editor_state = st.session_state.get(editor_key)
+        detach_logger_log(state_key)
+        edited = apply_editor_edits(st.session_state[state_key], editor_state)
+        st.session_state[state_key] = derive_table(state_key, edited, edited_columns(editor_state))
+
+    edited = st.data_editor(st.session_state[state_key], on_change=_on_change, **kwargs)
+    st.session_state[state_key] = derive_table(state_key, edited, edited_columns(st.session_state.get(editor_key)))
+    return st.session_state[state_key]
+
+
+# -----------------------
+# セクション単位の部分再実行（st.fragment）
+# -----------------------
+def summary_signature():
+    """自己評価・結果グラフなど、他のセクションの表示を左右する値"""
+    title = st.session_state.exp_title
+    if title == "実験① 熱の可視化":
+        graph_inputs = [st.session_state.result_df]
+    elif title == "実験② アルカリ型燃料電池の組み立て":
+        graph_inputs = [st.session_state.fc_discharge_1, st.session_state.fc_discharge_2, st.session_state.fc_discharge_3]
+    else:
+        graph_inputs = [st.session_state.wt_clarity_df]
+    return (
+        calculate_achievement_rate(),
+        content_hash(title, *graph_inputs),
+        st.session_state.student_id, st.session_state.student_name,
+    )
+
+def sync_after_fragment_run():
+    """セクション単独の再実行のあと、他のセクションに影響する変更があったときだけ全体を再実行する"""
+    with measure_cpu("セクション間の同期"):
+        autosave_session()
+        changed = summary_signature() != st.session_state.get("_summary_signature")
+    if changed:
+        st.rerun(scope="app")
+
+def report_section(name):
+    """レポートの1セクションを部分再実行の単位（st.fragment）にするデコレータ
+
+    セクション内の入力操作ではそのセクションだけが再実行される。
+    CPU時間は perf に name で記録する。
+    全体の再実行の中での呼び出しか、セクション単独の再実行かは、全体の再実行の通し番号で見分ける
+    （途中で止まった全体の再実行のあとも、フラグが残って同期が止まることはない）。
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper():
+            with measure_cpu(name):
+                func()
+            seen_key = f"_section_run_seq_{name}"
+            run_seq = st.session_state.get("_full_run_seq")
+            if st.session_state.get(seen_key) == run_seq:
+                # この全体の再実行ですでに描いたセクション → セクション単独の再実行
+                sync_after_fragment_run()
+            else:
+                # 全体の再実行の中での呼び出し（同期はスクリプトの末尾で行う）
+                st.session_state[seen_key] = run_seq
+        return st.fragment(wrapper)
+    return decorator
+
+
+# -----------------------
+# 提出用PDFの作成（バックグラウンド）
+# -----------------------
+# PDFに載せる基本情報のキー（テーマごとのデータは EXP_DATA_KEYS）
+REPORT_BASE_KEYS = [
+    "exp_title", "exp_date", "class_name", "seat_number", "student_id", "student_name",
+    "partner1_id", "partner1_name", "partner2_id", "partner2_name",
+]
+
+def report_snapshot():
+    """PDF作成用に現在の入力状態と写真を写し取る（作成中に入力が変わっても影響しないように）"""
+    state = ReportState()
+    for k in REPORT_BASE_KEYS + EXP_DATA_KEYS:
+        if k in st.session_state:
+            v = st.session_state[k]
+            state[k] = v.copy() if isinstance(v, pd.DataFrame) else v
+    for k, v in st.session_state.items():
+        if k.startswith("設問_") or k.startswith("check_"):
+            state[k] = v
+    state["origin_info"] = dict(st.session_state.get("origin_info", {"created_at": "-", "created_by_id": "-", "created_by_name": "-"}))
+    state["history_log"] = list(st.session_state.get("history_log", []))
+    store = st.session_state.photo_store
+    photos = {ref: store.get(ref) for ref in collect_photo_refs({k: state.get(k) for k in BLOB_KEYS})}
+    return state, photos
+
+def finish_pdf(pdf, filename, content_id, record_history):
+    """作成したPDFを session_state に置き、PDF出力の履歴を追加する"""
+    st.session_state["pdf_bytes"] = pdf
+    st.session_state["pdf_filename"] = filename
+    if record_history:
+        # content_id: 同じ内容で再度出力したときに履歴を重ねないための内容ハッシュ
+        add_history_log(PDF_OUTPUT_ACTION, f"ファイル: {filename}", content_id=content_id)
+    st.session_state["_pdf_message"] = ("success", "PDFを作成しました。ダウンロードボタンを押してください。")
+
+def start_pdf_job():
+    """PDF作成をバックグラウンドに投げ、ジョブを session_state に置く
+
+    前回から内容が変わっていなければ、作成済みのPDFをそのまま使う（作り直さない）。
+    """
+    state, photos = report_snapshot()
+    key, state, record_history = resolve_report_input(state)
+    filename = report_filename(state)
+    pdf = cached_report_pdf(key)
+    if pdf is not None:
+        finish_pdf(pdf, filename, key, record_history)
+        return
+    job = submit_pdf_job(state, photos, filename, cache_key=key)
+    job.record_history = record_history
+    st.session_state["pdf_job"] = job
+
+@st.fragment(run_every=1.0)
+def pdf_job_status():
+    """作成中のPDFの順番・進捗表示（このフラグメントだけが1秒ごとに再実行される）"""
+    job = st.session_state.get("pdf_job")
+    if job is None:
+        return
+    if not job.done():
+        pos = job.position()
+        if pos:
+            stats = get_pdf_scheduler().stats()
+            st.progress(0.0, text=f"順番待ち: {pos}番目（待ち時間 {job.queue_wait:.0f}秒）")
+            busy = f"（うち{stats['abandoned']}件は時間切れになったPDFの作成が終わるのを待っています）" if stats["abandoned"] else ""
+            st.caption(f"混雑しています。同時に作成できるのは{stats['workers']}件までです{busy}。このままお待ちください。")
+        else:
+            st.progress(job.progress, text=f"PDFを作成中… {job.section}（{job.render_time:.0f}秒）")
+        return
+
+    del st.session_state["pdf_job"]
+    try:
+        finish_pdf(job.result(), job.filename, job.cache_key, job.record_history)
+    except Exception as e:
+        st.session_state["_pdf_message"] = ("error", f"PDF作成エラー: {e}")
+    # ダウンロードボタンを表示し、進捗の定期更新を止めるため全体を再実行する
+    st.rerun(scope="app")
+
+
+# -----------------------
+# 初期化関数
+# -----------------------
+def init_state(key, default):
+    if key not in st.session_state:
+        st.session_state[key] = default
 
 # -----------------------
 # 初期化
 # -----------------------
 init_state("exp_title", "実験① 熱の可視化")
 init_state("experiment_registry", {})
+init_state("photo_store", PhotoStore()) # 写真の実体（SHA-256ごとに1つ）
 init_state("exp_date", date.today())
 init_state("class_name", "1年1組")
 init_state("seat_number", "00")
@@ -588,28 +811,18 @@ if current_user_full != st.session_state.last_logged_user:
     st.session_state.last_logged_user = current_user_full
 init_state("tools_list", pd.DataFrame(columns=["器具・装置・薬品名", "用途・役割など"]))
 init_state("evaluation_method", "")
-init_state("melting_point_df", pd.DataFrame({
-    "1回目(℃)": [""],
-    "2回目(℃)": [""],
-    "3回目(℃)": [""],
-    "平均(℃)": [""]
-}, index=["融解温度(℃)"]))
+init_state("melting_point_df", empty_table("melting_point_df"))
 init_state("references_list", pd.DataFrame({
     "書籍名・サイト名": ["物理基礎 改訂版", "国立天文台 理科年表オフィシャルサイト"],
     "著者・発行者": ["第一学習社", "国立天文台"],
     "発行年・URL": ["2023年", "https://official.rikanenpyo.jp/"]
 }))
-init_state("result_df", pd.DataFrame({
-    "距離(cm)": [2, 4, 6, 8, 10, 12],
-    "銅(sec)": [""]*6,
-    "アルミ(sec)": [""]*6,
-    "ステンレス(sec)": [""]*6
-}))
+init_state("result_df", empty_table("result_df"))
 init_state("literature_values", {"銅":"","アルミ":"","ステンレス":""})
 init_state("thermal_conductivity_ref", "")
 init_state("comparison_text", "")
 init_state("photos", [])
-init_state("apparatus_photo_data", None) # base64 string or bytes for persistence
+init_state("apparatus_photo_data", None) # photo_store への参照 ("sha256:...")
 
 # 文献値UI用
 init_state("lit_cu", st.session_state.literature_values.get("銅", ""))
@@ -618,25 +831,15 @@ init_state("lit_sus", st.session_state.literature_values.get("ステンレス",
 
 # 実験2用の状態初期化
 # 充電実験
-init_state("fc_charge_df", pd.DataFrame({
-    "充電時間(sec)": ["","",""],
-    "充電電圧(V)": ["","",""],
-    "開回路電圧(V)": ["","",""]
-}, index=["1回目", "2回目", "3回目"]))
-
-# 放電実験 (共通フォーマット)
-def init_discharge_df():
-    return pd.DataFrame({
-        "放電時間(分)": [0, 5, 10, 15],
-        "放電時間(sec)": [0, 300, 600, 900],
-        "端子電圧(V)": ["","","",""],
-        "電流(mA)": ["","","",""],
-        "出力(mW)": ["","","",""] # 「エネルギー(J)」列の代替として出力(mW)を使用し、面積でJを議論
-    })
-
-init_state("fc_discharge_1", init_discharge_df())
-init_state("fc_discharge_2", init_discharge_df())
-init_state("fc_discharge_3", init_discharge_df())
+init_state("fc_charge_df", empty_table("fc_charge_df"))
+
+# 放電実験 (共通フォーマット。列は tables.FC_DISCHARGE_SCHEMA)
+init_state("fc_discharge_1", empty_table("fc_discharge_1"))
+init_state("fc_discharge_2", empty_table("fc_discharge_2"))
+init_state("fc_discharge_3", empty_table("fc_discharge_3"))
+# データロガーから取り込んだ全点の記録（photo_store への参照。手入力の表なら None）
+for _log_key in LOG_KEYS.values():
+    init_state(_log_key, None)
 init_state("fc_comparison_text", "") # 実験2用の考察
 
 # 実験3用の状態初期化
@@ -647,11 +850,7 @@ init_state("wt_proto1_text", "")
 init_state("wt_proto2_dev_photo", None)
 init_state("wt_proto2_water_photo", None)
 init_state("wt_proto2_text", "")
-init_state("wt_clarity_df", pd.DataFrame({
-    "浄化対象の水": [""],
-    "試作検討①": [""],
-    "試作検討②": [""]
-}, index=["清澄度"]))
+init_state("wt_clarity_df", empty_table("wt_clarity_df"))
 init_state("wt_coagulation_photo", None)
 init_state("wt_coagulation_text", "")
 init_state("wt_comparison_text", "")
@@ -659,26 +858,8 @@ init_state("wt_comparison_text", "")
 
 
 # -----------------------
-# 設問辞書
+# 安全上の注意事項（設問辞書は scoring.py）
 # -----------------------
-QUESTION_DICT = {
-    "実験① 熱の可視化": {
-        "熱伝導って何？": ["高温","低温","エネルギー"],
-        "固体の中で熱が伝わる仕組みは？": ["原子","格子振動","自由電子"],
-        "物質による伝わりやすさの違いは？": ["熱伝導率","流体","断熱材"]
-    },
-    "実験② アルカリ型燃料電池の組み立て": {
-        "アルカリ型燃料電池って何？": ["水素","アルカリ","水"],
-        "電池で発電できる仕組みは？": ["材料の反応性の違い","起電力","電子やイオンの動き"],
-        "組み立てで大切な工夫は？": ["触媒","安全上気を付けること"]
-    },
-    "実験③ 水処理装置の設計と提案": {
-        "水の利用と機械の関係": ["浄水","下水","ポンプ"],
-        "水の汚れとは？水を綺麗にする仕組み": [],
-        "作製した装置で工夫したポイント": []
-    }
-}
-
 SAFETY_PRECAUTIONS = {
     "実験① 熱の可視化": {
         "clothing": "作業着または白衣（保護メガネ不要）",
@@ -729,185 +910,8 @@ SAFETY_PRECAUTIONS = {
 # 採点ロジック関数
 # -----------------------
 def calculate_achievement_rate():
-    score_home = 0.0
-    score_report = 0.0
-    
-    # 1. 自宅課題 (50%)
-    # 設問回答 (40%)
-    q_dict = QUESTION_DICT.get(st.session_state.exp_title, {})
-    if q_dict:
-        pts_per_q = 40.0 / len(q_dict)
-        for q, words in q_dict.items():
-            key_name = "設問_" + q.replace("？","").replace(" ","_")
-            ans = str(st.session_state.get(key_name, ""))
-            
-            # (1) 入力あり: 30%
-            if ans.strip():
-                score_home += pts_per_q * 0.3
-            
-            # (2) 200文字以上: 40%
-            if len(ans) >= 200:
-                score_home += pts_per_q * 0.4
-            elif len(ans) >= 100: # 部分点
-                score_home += pts_per_q * 0.2
-            
-            # (3) 必須語句: 30%
-            if words:
-                all_found = True
-                for w in words:
-                    if w not in ans:
-                        all_found = False
-                        break
-                if all_found:
-                    score_home += pts_per_q * 0.3
-
-    # 参考文献 (10%)
-    has_ref = False
-    default_titles = ["物理基礎 改訂版", "国立天文台 理科年表オフィシャルサイト"]
-    
-    if not st.session_state.references_list.empty:
-        for _, row in st.session_state.references_list.iterrows():
-             title = str(row.get("書籍名・サイト名", "")).strip()
-             # 空白でなく、かつデフォルト例そのままでない場合のみ加点対象とする
-             if title and (title not in default_titles):
-                 has_ref = True
-                 break
-    if has_ref:
-        score_home += 10.0
-
-    # 2. レポート点 (50%)
-    # 基本情報 (5%)
-    # デフォルト値の確認
-    is_default_basic = (st.session_state.student_id == "00") or (st.session_state.student_name == "高専 太郎")
-    
-    if st.session_state.class_name and st.session_state.student_id and st.session_state.student_name:
-        # デフォルトのままなら加点しない
-        if not is_default_basic:
-            score_report += 5.0
-    
-    # 実験方法 (10%)
-    # 器具 (4%)
-    has_tools = False
-    if not st.session_state.tools_list.empty:
-        for _, row in st.session_state.tools_list.iterrows():
-             if str(row.iloc[0]).strip():
-                 has_tools = True
-                 break
-    if has_tools: score_report += 4.0
-    
-    # 写真 (4%)
-    if st.session_state.exp_title == "実験③ 水処理装置の設計と提案":
-        # 試作①か②の装置写真があれば加点
-        if st.session_state.wt_proto1_dev_photo or st.session_state.wt_proto2_dev_photo:
-            score_report += 4.0
-    else:
-        if st.session_state.apparatus_photo_data:
-            score_report += 4.0
-    
-    # 評価方法 (2%)
-    if st.session_state.exp_title == "実験③ 水処理装置の設計と提案":
-        # 清澄度の入力があれば加点
-        c_df = st.session_state.wt_clarity_df
-        try:
-            # clean index issue using iloc
-            if str(c_df.iloc[0]["試作検討①"]).strip() or str(c_df.iloc[0]["試作検討②"]).strip():
-                score_report += 2.0
-        except: pass
-    else:
-        if st.session_state.evaluation_method:
-            score_report += 2.0
-
-    if st.session_state.exp_title == "実験① 熱の可視化":
-        # 実験結果 (20%)
-        # 融解平均 (5%)
-        try:
-            m_idx = st.session_state.melting_point_df.index[0]
-            if str(st.session_state.melting_point_df.at[m_idx, "平均(℃)"]).strip():
-                 score_report += 5.0
-        except:
-            pass
-            
-        # 結果データ (15%)
-        r_cols = ["銅(sec)", "アルミ(sec)", "ステンレス(sec)"]
-        total_cells = len(st.session_state.result_df) * 3
-        filled_cells = 0
-        for c in r_cols:
-            for v in st.session_state.result_df[c]:
-                if str(v).strip():
-                    filled_cells += 1
-        if total_cells > 0:
-            score_report += 15.0 * (filled_cells / total_cells)
-
-        # 考察 (15%)
-        # 文献値 (5%)
-        if st.session_state.lit_cu and st.session_state.lit_al and st.session_state.lit_sus:
-            score_report += 5.0
-        
-        # 引用 (2%)
-        if st.session_state.thermal_conductivity_ref:
-            score_report += 2.0
-        
-        # 本文 (8%)
-        if len(st.session_state.comparison_text) > 20: 
-            score_report += 8.0
-
-    elif st.session_state.exp_title == "実験② アルカリ型燃料電池の組み立て":
-        # 実験結果 (20%)
-        # 充電データあり (5%)
-        filled_charge = 0
-        for c in ["充電時間(sec)", "充電電圧(V)", "開回路電圧(V)"]:
-             for v in st.session_state.fc_charge_df[c]:
-                 if str(v).strip(): filled_charge += 1
-        if filled_charge > 5: # ある程度埋まっていれば
-             score_report += 5.0
-
-        # 放電データ (15%)
-        # 3回分、各4行。
-        filled_discharge = 0
-        total_slots = 3 * 4 * 2 # 電圧・電流の2項目 * 4行 * 3回
-        for df in [st.session_state.fc_discharge_1, st.session_state.fc_discharge_2, st.session_state.fc_discharge_3]:
-             for c in ["端子電圧(V)", "電流(mA)"]:
-                 for v in df[c]:
-                     if str(v).strip(): filled_discharge += 1
-        if total_slots > 0:
-            score_report += 15.0 * (filled_discharge / total_slots)
-
-        # 考察 (15%)
-        # 本文のみ (15%)
-        if len(st.session_state.fc_comparison_text) > 20:
-            score_report += 15.0
+    return achievement_rate(st.session_state)
 
-    elif st.session_state.exp_title == "実験③ 水処理装置の設計と提案":
-         # 実験結果 (20%)
-         # 写真の有無 (10%)
-         photo_count = 0
-         for k in ["wt_original_water_photo", "wt_proto1_dev_photo", "wt_proto1_water_photo", 
-                   "wt_proto2_dev_photo", "wt_proto2_water_photo", "wt_coagulation_photo"]:
-             if st.session_state.get(k): photo_count += 1
-         
-         if photo_count >= 6: score_report += 10.0
-         elif photo_count >= 3: score_report += 5.0
-         
-         # 記述とデータ (10%)
-         item_count = 0
-         if len(st.session_state.wt_proto1_text) > 10: item_count += 1
-         if len(st.session_state.wt_proto2_text) > 10: item_count += 1
-         if len(st.session_state.wt_coagulation_text) > 10: item_count += 1
-         
-         # 清澄度
-         c_df = st.session_state.wt_clarity_df
-         try:
-             if str(c_df.iloc[0]["試作検討①"]).strip() and str(c_df.iloc[0]["試作検討②"]).strip():
-                 item_count += 1
-         except: pass
-             
-         score_report += 10.0 * (item_count / 4.0)
-         
-         # 考察 (15%)
-         if len(st.session_state.wt_comparison_text) > 20:
-             score_report += 15.0
-
-    return int(score_home), int(score_report), int(score_home + score_report), is_default_basic
 
 def is_all_safety_confirmed():
     """現在の実験のすべての安全チェックが入っているか確認する"""
@@ -1035,25 +1039,34 @@ with st.sidebar:
         st.subheader("① 作業状態の保存・復元", help="""
         **中断・再開用の個人バックアップ**
         ・**範囲**: 全テーマの全データ、更新履歴
-        ・**保存**: ボタンでJSONをDL保存
+        ・**保存**: ボタンでZIPをDL保存（旧形式のJSONも復元可）
         ・**復元**: ファイルを上げ「復元」ボタンを押す
         ⚠️ 復元すると現在の入力は上書き消去されます。
         """)
         
-        # JSON復元
+        # 復元（ZIP / 旧形式JSON）
         st.markdown("**復元用ファイルの読み込み**")
-        uploaded_file = st.file_uploader("ファイルをアップロード", type="json", key="json_loader", label_visibility="collapsed")
+        uploaded_file = st.file_uploader("ファイルをアップロード", type=["zip", "json"], key="json_loader", label_visibility="collapsed")
 
         if uploaded_file is not None:
             if st.button("以前の入力状態を復元"):
                 confirm_json_restore_dialog(uploaded_file)
+
+        # サーバー側の自動保存（有効な場合のみ）
+        if _autosave_enabled():
+            saved_at = get_autosave_store().last_saved_at(st.session_state.student_id, st.session_state.exp_title)
+            if saved_at:
+                st.caption(f"💾 自動保存あり（最終: {datetime.fromtimestamp(saved_at).strftime('%Y-%m-%d %H:%M:%S')}）")
+                if st.button("自動保存から復元", help="出席番号と実験タイトルが同じ自動保存データで、現在のテーマの入力を上書きします。"):
+                    restore_from_autosave()
+                    st.rerun()
         
         # 元の復元ロジックは perform_json_restore に集約したため削除またはコメントアウト
         # ここでは perform_json_restore を通じた dialog 呼び出しのみ行う
 
         st.divider()
 
-        # JSON保存
+        # 保存（ZIP）
         st.markdown("**復元用ファイルの保存**")
         if st.button("現在の入力状態を保存"):
             # 現在のタイトルのデータを最新にするため、レジストリを更新
@@ -1061,6 +1074,15 @@ with st.sidebar:
                 st.session_state.experiment_registry = {}
             st.session_state.experiment_registry[st.session_state.exp_title] = get_current_exp_state()
 
+            # 未展開のテーマに旧形式の写真が残っていれば参照に置き換える
+            store = st.session_state.photo_store
+            for exp_state in st.session_state.experiment_registry.values():
+                if not isinstance(exp_state, dict):
+                    continue # 未展開のテーマ（新形式から読み込んだもので写真は参照済み）
+                for k in PHOTO_KEYS:
+                    if exp_state.get(k):
+                        exp_state[k] = store.import_value(exp_state[k])
+
             home_score, report_score, total_score, _ = calculate_achievement_rate()
 
             # 基本情報
@@ -1081,10 +1103,10 @@ with st.sidebar:
             title_safe = st.session_state.exp_title.replace(" ", "_").replace("　", "_")
             name_safe = st.session_state.student_name.replace(" ", "_").replace("　", "_")
             timestamp = datetime.now().strftime('%Y%m%d%H%M')
-            filename_json = f"{st.session_state.student_id}_{name_safe}_{timestamp}.json"
+            filename_save = f"{st.session_state.student_id}_{name_safe}_{timestamp}.zip"
 
             # 保存履歴の追加
-            add_history_log("復元用ファイルの保存", f"ファイル: {filename_json}")
+            add_history_log("復元用ファイルの保存", f"ファイル: {filename_save}")
 
             export_data = {
                 "global_info": global_info,
@@ -1096,19 +1118,20 @@ with st.sidebar:
                     "total": total_score
                 },
                 "experiment_registry": st.session_state.experiment_registry,
-
             }
 
-            st.session_state["json_export_data"] = json.dumps(export_data, ensure_ascii=False, indent=2)
-            st.session_state["json_file_name"] = filename_json
+            # 写真の実体は各1つだけ、バイナリのままZIPに格納（レジストリからはハッシュで参照）
+            photo_refs = collect_photo_refs(st.session_state.experiment_registry)
+            st.session_state["save_export_data"] = write_archive(export_data, store, photo_refs)
+            st.session_state["save_file_name"] = filename_save
             st.success("全てのテーマのデータ（レジストリ）を保存しました。別の実験に切り替えてもデータは保持されます。")
 
-        if "json_export_data" in st.session_state:
+        if "save_export_data" in st.session_state:
             st.download_button(
                 "保存状態のダウンロード",
-                data=st.session_state["json_export_data"],
-                file_name=st.session_state.get("json_file_name", "report.json"),
-                mime="application/json"
+                data=st.session_state["save_export_data"],
+                file_name=st.session_state.get("save_file_name", "report.zip"),
+                mime="application/zip"
             )
 
     # 2. 共有データの出力・復元
@@ -1142,7 +1165,7 @@ with st.sidebar:
                 if k in st.session_state:
                     val = st.session_state[k]
                     if isinstance(val, pd.DataFrame):
-                        share_data[k] = val.to_dict(orient="records")
+                        share_data[k] = table_records(val)
                     else:
                         share_data[k] = val
             
@@ -1150,8 +1173,11 @@ with st.sidebar:
             for k, v in st.session_state.items():
                 if k.startswith("check_"):
                     share_data[k] = v
+
+            # 写真の実体（共有範囲で参照されているもののみ）
+            share_data["photo_blobs"] = st.session_state.photo_store.export_blobs(collect_photo_refs(share_data))
             
-            st.session_state["share_json_data"] = json.dumps(share_data, ensure_ascii=False, indent=2)
+            st.session_state["share_json_data"] = json.dumps(share_data, ensure_ascii=False, indent=2, default=json_default)
             st.session_state["share_json_filename"] = filename_share
             st.success("共有用データを作成しました。下のボタンからダウンロードしてください。")
 
@@ -1191,428 +1217,20 @@ with st.sidebar:
             if not is_all_safety_confirmed():
                 st.error("❌ **エラー：安全上の注意事項の確認が完了していません。**\n「基本情報入力」セクションの注意事項をすべて読み、チェックを入れてから再度実行してください。")
             else:
-                try:
-                    buffer = BytesIO()
-                    doc = SimpleDocTemplate(buffer, pagesize=A4)
-                    elements = []
-                    styles = getSampleStyleSheet()
-
-                    # 日本語フォント設定
-                    styles['Normal'].fontName = 'IPAexGothic'
-                    styles['Title'].fontName = 'IPAexGothic'
-                    styles['Heading2'].fontName = 'IPAexGothic'
-                    
-                    # スコア計算
-                    home_score, report_score, total_score, _ = calculate_achievement_rate()
-                    score_text = f"簡易自己評価: {total_score}% (自宅課題: {home_score}% / レポート: {report_score}%)"
-                    score_style = ParagraphStyle('Score', parent=styles['Normal'], alignment=TA_RIGHT, textColor=colors.red)
-                    elements.append(Paragraph(score_text, score_style))
-                    elements.append(Spacer(1, 5*mm))
-
-                    # タイトル・基本情報
-                    elements.append(Paragraph(f"実験タイトル: {st.session_state.exp_title}", styles['Title']))
-                    elements.append(Paragraph(f"実験日: {st.session_state.exp_date}", styles['Normal']))
-                    
-                    # 安全確認ステータス
-                    safety_style = ParagraphStyle('Safety', parent=styles['Normal'], textColor=colors.green, fontName='IPAexGothic')
-                    elements.append(Paragraph("【安全上の注意事項：全項目確認済み】", safety_style))
-                    
-                    # 本人情報
-                    elements.append(Paragraph(
-                        f"クラス: {st.session_state.class_name} 席番号: {st.session_state.seat_number} "
-                        f"出席番号: {st.session_state.student_id} 氏名: {st.session_state.student_name}", 
-                        styles['Normal']
-                    ))
-                    
-                    # 共同実験者情報（入力がある場合のみ表示）
-                    partners = []
-                    if st.session_state.partner1_id or st.session_state.partner1_name:
-                        partners.append(f"共同実験者①: {st.session_state.partner1_id} {st.session_state.partner1_name}")
-                    if st.session_state.partner2_id or st.session_state.partner2_name:
-                        partners.append(f"共同実験者②: {st.session_state.partner2_id} {st.session_state.partner2_name}")
-                    
-                    if partners:
-                        elements.append(Paragraph(" / ".join(partners), styles['Normal']))
-                    
-                    elements.append(Spacer(1,5*mm))
-
-                    # 1. 調査レポート（自宅課題）
-                    elements.append(Paragraph("1. 調査レポート（自宅課題）", styles['Heading2']))
-                    for q in QUESTION_DICT[st.session_state.exp_title]:
-                        key_name = "設問_" + q.replace("？","").replace(" ","_")
-                        answer = st.session_state.get(key_name,"")
-                        elements.append(Paragraph(f"<b>Q. {q}</b>", styles['Normal']))
-                        elements.append(Paragraph(f"A. {answer}", styles['Normal']))
-                        elements.append(Spacer(1, 2*mm))
-                    
-                    # 参考文献
-                    elements.append(Paragraph("【参考文献】", styles['Normal']))
-                    if not st.session_state.references_list.empty:
-                        ref_data = [["書籍名・サイト名", "著者・発行者", "発行年・URL"]]
-                        ref_dict = st.session_state.references_list.to_dict(orient="records")
-                        # テーブル内での改行を有効にするためParagraphを使用
-                        table_cell_style = ParagraphStyle('TableCellStyle', parent=styles['Normal'], fontName='IPAexGothic', fontSize=9, leading=11)
-                        for item in ref_dict:
-                             ref_data.append([
-                                 Paragraph(str(item.get("書籍名・サイト名", "")), table_cell_style),
-                                 Paragraph(str(item.get("著者・発行者", "")), table_cell_style),
-                                 Paragraph(str(item.get("発行年・URL", "")), table_cell_style)
-                             ])
-                        
-                        if len(ref_data) > 1:
-                            rt = Table(ref_data, colWidths=[60*mm, 50*mm, 50*mm])
-                            rt.setStyle(TableStyle([
-                                ('FONT', (0,0), (-1,-1), 'IPAexGothic'),
-                                ('GRID', (0,0), (-1,-1), 0.5, colors.black),
-                                ('BACKGROUND', (0,0), (1,0), colors.lightgrey),
-                                ('ALIGN', (0,0), (-1,-1), 'LEFT'),
-                            ]))
-                            elements.append(rt)
-                        else:
-                            elements.append(Paragraph("なし", styles['Normal']))
-                    else:
-                        elements.append(Paragraph("なし", styles['Normal']))
-
-                    elements.append(Spacer(1, 4*mm))
-
-                    # 2. 実験方法
-                    elements.append(Paragraph("2. 実験方法", styles['Heading2']))
-                    elements.append(Paragraph("【使用器具】", styles['Normal']))
-                    tools_data = [["器具・装置・薬品名", "用途・役割など"]]
-                    tools_dict = st.session_state.tools_list.to_dict(orient="records")
-                    table_cell_style = ParagraphStyle('TableCellStyle', parent=styles['Normal'], fontName='IPAexGothic', fontSize=9, leading=11)
-                    for item in tools_dict:
-                        # 新旧カラム名の両対応（旧名がある場合はそちらを使用）
-                        name = item.get("器具・装置・薬品名", item.get("器具名", ""))
-                        role = item.get("用途・役割など", item.get("役割", ""))
-                        tools_data.append([
-                            Paragraph(str(name), table_cell_style),
-                            Paragraph(str(role), table_cell_style)
-                        ])
-                    
-                    if len(tools_data) > 1:
-                        t = Table(tools_data, colWidths=[60*mm, 100*mm])
-                        t.setStyle(TableStyle([
-                            ('FONT', (0,0), (-1,-1), 'IPAexGothic'),
-                            ('GRID', (0,0), (-1,-1), 0.5, colors.black),
-                            ('BACKGROUND', (0,0), (1,0), colors.lightgrey),
-                            ('ALIGN', (0,0), (-1,-1), 'LEFT'),
-                        ]))
-                        elements.append(t)
-                    else:
-                        elements.append(Paragraph("なし", styles['Normal']))
-                    elements.append(Spacer(1, 3*mm))
-
-                    if st.session_state.apparatus_photo_data:
-                        elements.append(Paragraph("【作成した実験装置】", styles['Normal']))
-                        try:
-                            img_data = base64.b64decode(st.session_state.apparatus_photo_data)
-                            img_io = BytesIO(img_data)
-                            img = create_proportional_image(img_io, max_width=120*mm, max_height=80*mm)
-                            elements.append(img)
-                        except Exception as e:
-                            elements.append(Paragraph(f"(画像読み込みエラー: {e})", styles['Normal']))
-                        elements.append(Spacer(1, 3*mm))
-
-                    elements.append(Paragraph(f"【評価方法】 {st.session_state.evaluation_method}", styles['Normal']))
-                    elements.append(Spacer(1, 5*mm))
-
-                    # 3. 実験結果
-                    elements.append(Paragraph("3. 実験結果", styles['Heading2']))
-                    
-                    if st.session_state.exp_title == "実験① 熱の可視化":
-                        # 融解温度テーブル
-                        elements.append(Paragraph("■ ロウの融解温度(℃)", styles['Normal']))
-                        m_df = st.session_state.melting_point_df
-                        m_table_data = [m_df.columns.tolist()] + m_df.values.tolist()
-                        mt = Table(m_table_data, colWidths=[30*mm]*4)
-                        mt.setStyle(TableStyle([
-                            ('FONT', (0,0), (-1,-1), 'IPAexGothic'),
-                            ('GRID', (0,0), (-1,-1), 0.5, colors.black),
-                            ('BACKGROUND', (0,0), (1,0), colors.lightgrey),
-                            ('ALIGN', (0,0), (-1,-1), 'CENTER'),
-                        ]))
-                        elements.append(mt)
-                        elements.append(Spacer(1, 3*mm))
-
-                        elements.append(Paragraph("■ 距離と融解時間", styles['Normal']))
-                        df = st.session_state.result_df
-                        table_data = [df.columns.tolist()] + df.values.tolist()
-                        col_w = 40*mm
-                        t = Table(table_data, colWidths=[col_w]*len(df.columns))
-                        t.setStyle(TableStyle([
-                            ('FONT', (0,0), (-1,-1), 'IPAexGothic'),
-                            ('GRID', (0,0), (-1,-1), 0.5, colors.black),
-                            ('BACKGROUND', (0,0), (1,0), colors.lightgrey),
-                            ('ALIGN', (0,0), (-1,-1), 'CENTER'),
-                        ]))
-                        elements.append(t)
-                        elements.append(Spacer(1, 2*mm))
-
-                        # 4. 結果グラフ
-                        elements.append(Paragraph("4. 結果グラフ", styles['Heading2']))
-                        try:
-                            fig = create_graph()
-                            img_buffer = BytesIO()
-                            fig.savefig(img_buffer, format='png', dpi=100)
-                            img_buffer.seek(0)
-                            img = create_proportional_image(img_buffer, max_width=140*mm, max_height=90*mm)
-                            img.hAlign = 'CENTER'
-                            elements.append(img)
-                            plt.close(fig)
-                        except Exception as e:
-                            elements.append(Paragraph(f"グラフ作成エラー: {e}", styles['Normal']))
-                        
-                        caption_style = ParagraphStyle('Caption', parent=styles['Normal'], alignment=TA_CENTER)
-                        elements.append(Paragraph("図：熱が伝導した距離とロウの融解時間の関係（溶け始めの時間）", caption_style))
-                        elements.append(Spacer(1, 5*mm))
-
-                        # 5. 比較検証・考察
-                        elements.append(Paragraph("5. 比較検証・考察", styles['Heading2']))
-                        lit_vals = f"熱伝導率の文献値: 銅={st.session_state.lit_cu}, アルミ={st.session_state.lit_al}, ステンレス={st.session_state.lit_sus} (W/m/K)"
-                        elements.append(Paragraph(lit_vals, styles['Normal']))
-                        elements.append(Spacer(1, 2*mm))
-                        elements.append(Paragraph("【考察】", styles['Normal']))
-                        elements.append(Paragraph(st.session_state.comparison_text, styles['Normal']))
-                        elements.append(Spacer(1, 2*mm))
-                        if st.session_state.thermal_conductivity_ref:
-                            elements.append(Paragraph(f"（熱伝導率の参考文献: {st.session_state.thermal_conductivity_ref}）", styles['Normal']))
-
-                    elif st.session_state.exp_title == "実験② アルカリ型燃料電池の組み立て":
-                        # 充電実験
-                        elements.append(Paragraph("■ 充電実験", styles['Normal']))
-                        c_df = st.session_state.fc_charge_df
-                        c_table_data = [c_df.columns.tolist()] + c_df.values.tolist()
-                        ct = Table(c_table_data, colWidths=[40*mm]*3)
-                        ct.setStyle(TableStyle([
-                            ('FONT', (0,0), (-1,-1), 'IPAexGothic'),
-                            ('GRID', (0,0), (-1,-1), 0.5, colors.black),
-                            ('BACKGROUND', (0,0), (1,0), colors.lightgrey),
-                            ('ALIGN', (0,0), (-1,-1), 'CENTER'),
-                        ]))
-                        elements.append(ct)
-                        elements.append(Spacer(1, 3*mm))
-
-                        # 放電実験
-                        elements.append(Paragraph("■ 放電実験", styles['Normal']))
-                        for i, df in enumerate([st.session_state.fc_discharge_1, st.session_state.fc_discharge_2, st.session_state.fc_discharge_3]):
-                            elements.append(Paragraph(f"【{i+1}回目】", styles['Normal']))
-                            d_table_data = [df.columns.tolist()] + df.values.tolist()
-                            dt = Table(d_table_data, colWidths=[25*mm]*5)
-                            dt.setStyle(TableStyle([
-                                ('FONT', (0,0), (-1,-1), 'IPAexGothic'),
-                                ('GRID', (0,0), (-1,-1), 0.5, colors.black),
-                                ('BACKGROUND', (0,0), (1,0), colors.lightgrey),
-                                ('ALIGN', (0,0), (-1,-1), 'CENTER'),
-                                ('FONTSIZE', (0,0), (-1,-1), 8),
-                            ]))
-                            elements.append(dt)
-                            elements.append(Spacer(1, 2*mm))
-
-                        # 4. 結果グラフ
-                        elements.append(Paragraph("4. 結果グラフ", styles['Heading2']))
-                        try:
-                            fig = create_fuel_cell_graph()
-                            img_buffer = BytesIO()
-                            fig.savefig(img_buffer, format='png', dpi=100)
-                            img_buffer.seek(0)
-                            img = create_proportional_image(img_buffer, max_width=140*mm, max_height=90*mm)
-                            img.hAlign = 'CENTER'
-                            elements.append(img)
-                            plt.close(fig)
-                        except Exception as e:
-                            elements.append(Paragraph(f"グラフ作成エラー: {e}", styles['Normal']))
-                        
-                        caption_style = ParagraphStyle('Caption', parent=styles['Normal'], alignment=TA_CENTER)
-                        elements.append(Paragraph("図：放電時の時間と出力の関係", caption_style))
-                        elements.append(Spacer(1, 5*mm))
-
-                        # 近似仕事量表
-                        elements.append(Paragraph("■ 発生エネルギー (J)", styles['Normal']))
-                        areas = []
-                        for df_raw in [st.session_state.fc_discharge_1, st.session_state.fc_discharge_2, st.session_state.fc_discharge_3]:
-                             try:
-                                 # 念のため DataFrame 変換
-                                 df = pd.DataFrame(df_raw) if not isinstance(df_raw, pd.DataFrame) else df_raw
-                                 t = pd.to_numeric(df["放電時間(sec)"], errors="coerce").fillna(0).values
-                                 p = pd.to_numeric(df["出力(mW)"], errors="coerce").fillna(0).values
-                                 area_mJ = 0
-                                 for k in range(len(t)-1):
-                                     dt = t[k+1] - t[k]
-                                     avg_p = (p[k+1] + p[k]) / 2.0
-                                     area_mJ += dt * avg_p
-                                 areas.append(f"{area_mJ/1000:.2f}")
-                             except Exception as e:
-                                 areas.append("-")
-                        
-                        area_table_data = [["1回目", "2回目", "3回目"], areas]
-                        at = Table(area_table_data, colWidths=[30*mm]*3)
-                        at.setStyle(TableStyle([
-                            ('FONT', (0,0), (-1,-1), 'IPAexGothic'),
-                            ('GRID', (0,0), (-1,-1), 0.5, colors.black),
-                            ('BACKGROUND', (0,0), (-1,0), colors.lightgrey),
-                            ('ALIGN', (0,0), (-1,-1), 'CENTER'),
-                        ]))
-                        elements.append(at)
-                        elements.append(Spacer(1, 5*mm))
-
-                        # 5. 比較検証・考察
-                        elements.append(Paragraph("5. 比較検証・考察", styles['Heading2']))
-                        elements.append(Paragraph("【充電条件の比較と考察】", styles['Normal']))
-                        elements.append(Paragraph(st.session_state.fc_comparison_text, styles['Normal']))
-
-                    elif st.session_state.exp_title == "実験③ 水処理装置の設計と提案":
-                        # 実験結果 - 写真とテキスト
-                        elements.append(Paragraph("■ 浄化対象の水", styles['Normal']))
-                        if st.session_state.wt_original_water_photo:
-                            try:
-                                img_data = base64.b64decode(st.session_state.wt_original_water_photo)
-                                img = create_proportional_image(BytesIO(img_data), max_width=100*mm, max_height=70*mm)
-                                elements.append(img)
-                            except: pass
-                        elements.append(Spacer(1, 3*mm))
-
-                        elements.append(Paragraph("■ 試作検討①", styles['Heading2']))
-                        # 写真並記
-                        p1_imgs = []
-                        if st.session_state.wt_proto1_dev_photo:
-                            try:
-                                 p1_imgs.append(create_proportional_image(BytesIO(base64.b64decode(st.session_state.wt_proto1_dev_photo)), max_width=75*mm, max_height=55*mm))
-                            except: pass
-                        if st.session_state.wt_proto1_water_photo:
-                            try:
-                                 p1_imgs.append(create_proportional_image(BytesIO(base64.b64decode(st.session_state.wt_proto1_water_photo)), max_width=75*mm, max_height=55*mm))
-                            except: pass
-                        
-                        if p1_imgs:
-                            t_data = [p1_imgs]
-                            t = Table(t_data)
-                            t.setStyle(TableStyle([('ALIGN', (0,0), (-1,-1), 'CENTER'), ('VALIGN', (0,0), (-1,-1), 'TOP')]))
-                            elements.append(t)
-
-                        elements.append(Paragraph("【原理や工夫】", styles['Normal']))
-                        elements.append(Paragraph(st.session_state.wt_proto1_text, styles['Normal']))
-                        elements.append(Spacer(1, 4*mm))
-
-                        elements.append(Paragraph("■ 試作検討②", styles['Heading2']))
-                        p2_imgs = []
-                        if st.session_state.wt_proto2_dev_photo:
-                            try:
-                                 p2_imgs.append(create_proportional_image(BytesIO(base64.b64decode(st.session_state.wt_proto2_dev_photo)), max_width=75*mm, max_height=55*mm))
-                            except: pass
-                        if st.session_state.wt_proto2_water_photo:
-                            try:
-                                 p2_imgs.append(create_proportional_image(BytesIO(base64.b64decode(st.session_state.wt_proto2_water_photo)), max_width=75*mm, max_height=55*mm))
-                            except: pass
-                        
-                        if p2_imgs:
-                            t_data = [p2_imgs]
-                            t = Table(t_data)
-                            t.setStyle(TableStyle([('ALIGN', (0,0), (-1,-1), 'CENTER'), ('VALIGN', (0,0), (-1,-1), 'TOP')]))
-                            elements.append(t)
-                            
-                        elements.append(Paragraph("【原理や工夫】", styles['Normal']))
-                        elements.append(Paragraph(st.session_state.wt_proto2_text, styles['Normal']))
-                        elements.append(Spacer(1, 4*mm))
-
-                        # 清澄度評価
-                        elements.append(Paragraph("■ 清澄度評価 (1000点満点)", styles['Heading2']))
-                        clarity_df = st.session_state.wt_clarity_df
-                        c_table_data = [clarity_df.columns.tolist()] + clarity_df.values.tolist()
-                        ct = Table(c_table_data, colWidths=[40*mm]*2)
-                        ct.setStyle(TableStyle([
-                            ('FONT', (0,0), (-1,-1), 'IPAexGothic'),
-                            ('GRID', (0,0), (-1,-1), 0.5, colors.black),
-                            ('BACKGROUND', (0,0), (1,0), colors.lightgrey),
-                            ('ALIGN', (0,0), (-1,-1), 'CENTER'),
-                        ]))
-                        elements.append(ct)
-                        elements.append(Spacer(1, 4*mm))
-
-                        # 4. 結果グラフ
-                        elements.append(Paragraph("4. 結果グラフ", styles['Heading2']))
-                        try:
-                            fig = create_water_treatment_graph()
-                            img_buffer = BytesIO()
-                            fig.savefig(img_buffer, format='png', dpi=100)
-                            img_buffer.seek(0)
-                            img = create_proportional_image(img_buffer, max_width=140*mm, max_height=90*mm)
-                            img.hAlign = 'CENTER'
-                            elements.append(img)
-                            plt.close(fig)
-                        except Exception as e:
-                            elements.append(Paragraph(f"グラフ作成エラー: {e}", styles['Normal']))
-                        
-                        caption_style = ParagraphStyle('Caption', parent=styles['Normal'], alignment=TA_CENTER)
-                        elements.append(Paragraph("図：水処理装置による浄化の効果", caption_style))
-                        elements.append(Spacer(1, 5*mm))
-
-                        # 凝集剤の効果
-                        elements.append(Paragraph("■ 凝集剤の効果", styles['Heading2']))
-                        if st.session_state.wt_coagulation_photo:
-                            try:
-                                img = create_proportional_image(BytesIO(base64.b64decode(st.session_state.wt_coagulation_photo)), max_width=100*mm, max_height=70*mm)
-                                elements.append(img)
-                            except: pass
-                        elements.append(Spacer(1, 2*mm))
-                        elements.append(Paragraph("【原理】", styles['Normal']))
-                        elements.append(Paragraph(st.session_state.wt_coagulation_text, styles['Normal']))
-                        elements.append(Spacer(1, 5*mm))
-
-                        # 5. 比較検証・考察
-                        elements.append(Paragraph("5. 比較検証・考察", styles['Heading2']))
-                        elements.append(Paragraph("【装置の比較（試作① vs 試作②）】", styles['Normal']))
-                        elements.append(Paragraph(st.session_state.wt_comparison_text, styles['Normal']))
-
-
-                    # -----------------------
-                    # 6. 更新履歴（コピペ防止・証跡）
-                    # -----------------------
-                    elements.append(Spacer(1, 10*mm))
-                    elements.append(Paragraph("6. レポート作成・更新履歴", styles['Heading2']))
-                    
-                    origin = st.session_state.get("origin_info", {"created_at": "-", "created_by_id": "-", "created_by_name": "-"})
-                    elements.append(Paragraph(f"【オリジナル作成情報】", styles['Normal']))
-                    elements.append(Paragraph(f"作成日時: {origin['created_at']}", styles['Normal']))
-                    elements.append(Paragraph(f"作成者: {origin['created_by_id']} {origin['created_by_name']}", styles['Normal']))
-                    elements.append(Spacer(1, 3*mm))
-
-                    elements.append(Paragraph(f"【履歴一覧】", styles['Normal']))
-                    table_history_style = ParagraphStyle('TableHistoryStyle', parent=styles['Normal'], fontName='IPAexGothic', fontSize=7, leading=8)
-                    history_data = [["日時", "操作内容", "詳細・備考", "実行ユーザー"]]
-                    for entry in st.session_state.get("history_log", []):
-                        history_data.append([
-                            Paragraph(str(entry.get("timestamp", "")), table_history_style),
-                            Paragraph(str(entry.get("action", "")), table_history_style),
-                            Paragraph(str(entry.get("detail", "")), table_history_style),
-                            Paragraph(str(entry.get("user", "")), table_history_style)
-                        ])
-                    
-                    if len(history_data) > 1:
-                        ht = Table(history_data, colWidths=[35*mm, 45*mm, 55*mm, 30*mm])
-                        ht.setStyle(TableStyle([
-                            ('FONT', (0,0), (-1,-1), 'IPAexGothic'),
-                            ('GRID', (0,0), (-1,-1), 0.5, colors.grey),
-                            ('BACKGROUND', (0,0), (-1,0), colors.whitesmoke),
-                            ('ALIGN', (0,0), (-1,-1), 'LEFT'),
-                            ('FONTSIZE', (0,0), (-1,-1), 7),
-                            ('VALIGN', (0,0), (-1,-1), 'MIDDLE'),
-                        ]))
-                        elements.append(ht)
-
-                    doc.build(elements)
-                    
-                    # PDF出力の履歴を追加
-                    filename_pdf = f"{st.session_state.student_id}_{st.session_state.student_name}_{st.session_state.exp_title}.pdf".replace(" ", "_").replace("　", "_")
-                    add_history_log("最終提出PDFの出力", f"ファイル: {filename_pdf}")
-
-                    st.session_state["pdf_bytes"] = buffer.getvalue()
-                    st.session_state["pdf_filename"] = filename_pdf
-                    st.success("PDFを作成しました。ダウンロードボタンを押してください。")
-                except Exception as e:
-                    st.error(f"PDF作成エラー: {e}")
-
-        if "pdf_bytes" in st.session_state:
+                if "pdf_job" not in st.session_state:
+                    start_pdf_job()
+
+        # 作成中は進捗だけを定期更新する（他の入力はそのまま操作できる）
+        if "pdf_job" in st.session_state:
+            pdf_job_status()
+        if "_pdf_message" in st.session_state:
+            kind, msg = st.session_state.pop("_pdf_message")
+            if kind == "success":
+                st.success(msg)
+            else:
+                st.error(msg)
+
+        if "pdf_bytes" in st.session_state and "pdf_job" not in st.session_state:
             st.download_button("提出用ファイルのダウンロード", st.session_state["pdf_bytes"], file_name=st.session_state.get("pdf_filename", "report.pdf"), mime="application/pdf")
 
     st.markdown("---")
@@ -1631,85 +1249,89 @@ with st.sidebar:
 # 基本情報入力
 # -----------------------
 st.markdown("### 基本情報入力")
-with st.expander("基本情報入力"):
-    # 1段目：実験タイトル、実験日、クラス
-    r1_col1, r1_col2, r1_col3 = st.columns([3, 1, 1])
-    with r1_col1:
-        current_title = st.session_state.exp_title
-        # exp_title_selector を事前に初期化
-        if "exp_title_selector" not in st.session_state:
-            st.session_state.exp_title_selector = st.session_state.exp_title
-
-        selected_title = st.selectbox(
-            "**実験タイトル**",
-            list(QUESTION_DICT.keys()),
-            key="exp_title_selector",
-            help="実験のテーマを選択してください"
-        )
-        if selected_title != current_title:
-            confirm_exp_title_change_dialog(selected_title)
-    with r1_col2:
-        st.date_input("実験日", key="exp_date", help="実験を実施した日付を入力してください")
-    with r1_col3:
-        st.selectbox(
-            "クラス",
-            ["1年1組","1年2組","1年3組","1年4組"],
-            key="class_name",
-            help="所属するクラスを選択してください"
-        )
+@report_section("基本情報")
+def basic_info_section():
+    with st.expander("基本情報入力"):
+        # 1段目：実験タイトル、実験日、クラス
+        r1_col1, r1_col2, r1_col3 = st.columns([3, 1, 1])
+        with r1_col1:
+            current_title = st.session_state.exp_title
+            # exp_title_selector を事前に初期化
+            if "exp_title_selector" not in st.session_state:
+                st.session_state.exp_title_selector = st.session_state.exp_title
+
+            selected_title = st.selectbox(
+                "**実験タイトル**",
+                list(QUESTION_DICT.keys()),
+                key="exp_title_selector",
+                help="実験のテーマを選択してください"
+            )
+            if selected_title != current_title:
+                confirm_exp_title_change_dialog(selected_title)
+        with r1_col2:
+            st.date_input("実験日", key="exp_date", help="実験を実施した日付を入力してください")
+        with r1_col3:
+            st.selectbox(
+                "クラス",
+                ["1年1組","1年2組","1年3組","1年4組"],
+                key="class_name",
+                help="所属するクラスを選択してください"
+            )
     
-    # 実験ごとの注意事項（重要）
-    # ステート修復（不適切な型によるTypeError防止）
-    for k in list(st.session_state.keys()):
-        if k.startswith("check_") and not isinstance(st.session_state[k], bool):
-            st.session_state[k] = False
-
-    prec = SAFETY_PRECAUTIONS.get(st.session_state.exp_title)
-    if prec:
-        with st.container(border=True):
-            st.markdown("#### ⚠️ 実験上の注意事項（すべて確認して✔を付けてください）")
-            c1, c2, c3 = st.columns(3)
-            with c1:
-                st.checkbox(f"**👕 服装**: {prec['clothing']}", key="check_cloth")
-                if "eyewear" in prec:
-                    st.caption("**🥽 保護メガネ着用基準**")
-                    for i, item in enumerate(prec['eyewear'], 1):
-                        st.checkbox(item, key=f"check_eye_{i}")
+        # 実験ごとの注意事項（重要）
+        # ステート修復（不適切な型によるTypeError防止）
+        for k in list(st.session_state.keys()):
+            if k.startswith("check_") and not isinstance(st.session_state[k], bool):
+                st.session_state[k] = False
+
+        prec = SAFETY_PRECAUTIONS.get(st.session_state.exp_title)
+        if prec:
+            with st.container(border=True):
+                st.markdown("#### ⚠️ 実験上の注意事項（すべて確認して✔を付けてください）")
+                c1, c2, c3 = st.columns(3)
+                with c1:
+                    st.checkbox(f"**👕 服装**: {prec['clothing']}", key="check_cloth")
+                    if "eyewear" in prec:
+                        st.caption("**🥽 保護メガネ着用基準**")
+                        for i, item in enumerate(prec['eyewear'], 1):
+                            st.checkbox(item, key=f"check_eye_{i}")
             
-            with c2:
-                st.checkbox(f"**⚡ 安全リスク**: {prec['safety_risks']}", key="check_s_risk")
-                st.checkbox(f"**💻 その他リスク**: {prec['other_risks']}", key="check_o_risk")
-                st.caption("**🛠️ 操作上の注意**")
-                for i, item in enumerate(prec['operational'], 1):
-                    st.checkbox(item, key=f"check_op_{i}")
+                with c2:
+                    st.checkbox(f"**⚡ 安全リスク**: {prec['safety_risks']}", key="check_s_risk")
+                    st.checkbox(f"**💻 その他リスク**: {prec['other_risks']}", key="check_o_risk")
+                    st.caption("**🛠️ 操作上の注意**")
+                    for i, item in enumerate(prec['operational'], 1):
+                        st.checkbox(item, key=f"check_op_{i}")
                 
-            with c3:
-                st.caption("**🚫 その他注意・制限事項**")
-                for i, item in enumerate(prec['restrictions'], 1):
-                    st.checkbox(item, key=f"check_res_{i}")
+                with c3:
+                    st.caption("**🚫 その他注意・制限事項**")
+                    for i, item in enumerate(prec['restrictions'], 1):
+                        st.checkbox(item, key=f"check_res_{i}")
     
-    st.divider()
-    st.markdown("**実験者情報**")
+        st.divider()
+        st.markdown("**実験者情報**")
     
-    # 2段目：本人の席番号、出席番号、氏名
-    r2_col1, r2_col2, r2_col3 = st.columns([1, 1, 3])
-    with r2_col1:
-        st.text_input("席番号", key="seat_number", help="自分の席番号を入力してください")
-    with r2_col2:
-        st.text_input("出席番号", key="student_id", help="自分の出席番号を入力してください")
-    with r2_col3:
-        st.text_input("氏名", key="student_name", help="自分の氏名を入力してください")
-
-    # 3段目：共同実験者①、②
-    r3_col1, r3_col2, r3_col3, r3_col4 = st.columns([1, 2, 1, 2])
-    with r3_col1:
-        st.text_input("共同実験者① 出席番号", key="partner1_id")
-    with r3_col2:
-        st.text_input("共同実験者① 氏名", key="partner1_name")
-    with r3_col3:
-        st.text_input("共同実験者② 出席番号", key="partner2_id")
-    with r3_col4:
-        st.text_input("共同実験者② 氏名", key="partner2_name")
+        # 2段目：本人の席番号、出席番号、氏名
+        r2_col1, r2_col2, r2_col3 = st.columns([1, 1, 3])
+        with r2_col1:
+            st.text_input("席番号", key="seat_number", help="自分の席番号を入力してください")
+        with r2_col2:
+            st.text_input("出席番号", key="student_id", help="自分の出席番号を入力してください")
+        with r2_col3:
+            st.text_input("氏名", key="student_name", help="自分の氏名を入力してください")
+
+        # 3段目：共同実験者①、②
+        r3_col1, r3_col2, r3_col3, r3_col4 = st.columns([1, 2, 1, 2])
+        with r3_col1:
+            st.text_input("共同実験者① 出席番号", key="partner1_id")
+        with r3_col2:
+            st.text_input("共同実験者① 氏名", key="partner1_name")
+        with r3_col3:
+            st.text_input("共同実験者② 出席番号", key="partner2_id")
+        with r3_col4:
+            st.text_input("共同実験者② 氏名", key="partner2_name")
+
+basic_info_section()
 
 
 # -----------------------
@@ -1718,39 +1340,43 @@ with st.expander("基本情報入力"):
 # -----------------------
 # 調査レポート（自宅課題）
 # -----------------------
-with st.expander("🏠 調査レポート（自宅課題）"):
-    st.info("※ 各設問へは、**指定された必須語句を含めて200文字以上**で記述してください。また、調査に使用した参考文献を下の表にまとめてください。")
-    for q, words in QUESTION_DICT[st.session_state.exp_title].items():
-        key_name = "設問_" + q.replace("？","").replace(" ","_")
-        if key_name not in st.session_state:
-            st.session_state[key_name] = ""
-
-        st.text_area(q, height=120, key=key_name, help="この設問について200文字以上で回答を記述してください。調査に使用した文献はページ下部の表に記入してください。")
-
-        if words:
-            check_list = []
-            for w in words:
-                if w in str(st.session_state[key_name]):
-                    check_list.append(f":green[✔ {w}]")
-                else:
-                    check_list.append(f":grey[✖ {w}]")
-            st.markdown("**必須語チェック** : " + "  ".join(check_list))
+@report_section("調査レポート")
+def research_report_section():
+    with st.expander("🏠 調査レポート（自宅課題）"):
+        st.info("※ 各設問へは、**指定された必須語句を含めて200文字以上**で記述してください。また、調査に使用した参考文献を下の表にまとめてください。")
+        for q, words in QUESTION_DICT[st.session_state.exp_title].items():
+            key_name = "設問_" + q.replace("？","").replace(" ","_")
+            if key_name not in st.session_state:
+                st.session_state[key_name] = ""
+
+            st.text_area(q, height=120, key=key_name, help="この設問について200文字以上で回答を記述してください。調査に使用した文献はページ下部の表に記入してください。")
+
+            if words:
+                check_list = []
+                for w in words:
+                    if w in str(st.session_state[key_name]):
+                        check_list.append(f":green[✔ {w}]")
+                    else:
+                        check_list.append(f":grey[✖ {w}]")
+                st.markdown("**必須語チェック** : " + "  ".join(check_list))
         
-        char_count = len(str(st.session_state[key_name]))
-        if char_count < 200:
-             st.caption(f"文字数：{char_count} / 200文字以上 (:red[あと {200 - char_count} 文字])")
-        else:
-             st.caption(f"文字数：{char_count} :green[✔ OK]")
+            char_count = len(str(st.session_state[key_name]))
+            if char_count < 200:
+                 st.caption(f"文字数：{char_count} / 200文字以上 (:red[あと {200 - char_count} 文字])")
+            else:
+                 st.caption(f"文字数：{char_count} :green[✔ OK]")
 
-    st.divider()
-    st.markdown("### 参考文献")
-    st.caption("調査に使用した書籍やウェブサイトを入力してください。")
-    edited_refs = st.data_editor(
-        st.session_state.references_list,
-        num_rows="dynamic",
-        key="references_list_editor"
-    )
-    st.session_state["references_list"] = edited_refs
+        st.divider()
+        st.markdown("### 参考文献")
+        st.caption("調査に使用した書籍やウェブサイトを入力してください。")
+        edited_refs = st.data_editor(
+            st.session_state.references_list,
+            num_rows="dynamic",
+            key="references_list_editor"
+        )
+        st.session_state["references_list"] = edited_refs
+
+research_report_section()
 
 # -----------------------
 # 実験方法
@@ -1759,45 +1385,46 @@ with st.expander("🏠 調査レポート（自宅課題）"):
 # 実験方法
 # -----------------------
 st.markdown("### 実験方法入力")
-with st.expander("実験方法"):
-    st.markdown("### 実験で用意したもの（装置・器具・薬品）")
-    st.caption("実験で使用した器具や材料を入力してください。行を追加ボタンで増やせます。")
-
-    edited_tools = st.data_editor(
-        st.session_state.tools_list,
-        num_rows="dynamic",
-        key="tools_list_editor"
-    )
-    st.session_state["tools_list"] = edited_tools
-
-    if st.session_state.exp_title != "実験③ 水処理装置の設計と提案":
-        st.markdown("### 作成した実験装置")
-        uploaded_camera = st.file_uploader(
-            "写真 (jpg, png)", 
-            type=["jpg","jpeg","png"], 
-            key="apparatus_photo_upload",
-            help="組み立てた実験装置の写真を撮影し、アップロードしてください。"
+@report_section("実験方法")
+def method_section():
+    with st.expander("実験方法"):
+        st.markdown("### 実験で用意したもの（装置・器具・薬品）")
+        st.caption("実験で使用した器具や材料を入力してください。行を追加ボタンで増やせます。")
+
+        edited_tools = st.data_editor(
+            st.session_state.tools_list,
+            num_rows="dynamic",
+            key="tools_list_editor"
         )
-        if uploaded_camera is not None:
-             # アップロードされたらsession_stateに保存(base64化)
-             bytes_data = uploaded_camera.getvalue()
-             st.session_state["apparatus_photo_data"] = base64.b64encode(bytes_data).decode()
+        st.session_state["tools_list"] = edited_tools
+
+        if st.session_state.exp_title != "実験③ 水処理装置の設計と提案":
+            st.markdown("### 作成した実験装置")
+            uploaded_camera = st.file_uploader(
+                "写真 (jpg, png)", 
+                type=["jpg","jpeg","png"], 
+                key="apparatus_photo_upload",
+                help="組み立てた実験装置の写真を撮影し、アップロードしてください。"
+            )
+            if uploaded_camera is not None:
+                 # アップロードされたらsession_stateに保存(縮小・再圧縮したバイト列)
+                 store_uploaded_photo(uploaded_camera, "apparatus_photo_data")
         
-        # 保存された画像の表示
-        if st.session_state["apparatus_photo_data"]:
-            st.image(base64.b64decode(st.session_state["apparatus_photo_data"]), use_container_width=True)
-            if st.button("装置の写真を削除", key="btn_del_apparatus"):
-                st.session_state["apparatus_photo_data"] = None
-                if "apparatus_photo_upload" in st.session_state:
-                    del st.session_state["apparatus_photo_upload"]
-                st.rerun()
-
-    if st.session_state.exp_title != "実験③ 水処理装置の設計と提案":
-        st.text_input(
-            "評価方法（100字程度）", 
-            key="evaluation_method",
-            help="どのような基準や方法で結果を測定・判定したか記述してください。"
-        )
+            # 保存された画像の表示
+            if st.session_state["apparatus_photo_data"]:
+                show_photo_preview("apparatus_photo_data")
+                if st.button("装置の写真を削除", key="btn_del_apparatus"):
+                    clear_photo("apparatus_photo_data", "apparatus_photo_upload")
+                    st.rerun()
+
+        if st.session_state.exp_title != "実験③ 水処理装置の設計と提案":
+            st.text_input(
+                "評価方法（100字程度）", 
+                key="evaluation_method",
+                help="どのような基準や方法で結果を測定・判定したか記述してください。"
+            )
+
+method_section()
 
 # -----------------------
 # -----------------------
@@ -1805,229 +1432,187 @@ with st.expander("実験方法"):
 # -----------------------
 st.markdown("### 実験結果入力")
 
-if st.session_state.exp_title == "実験① 熱の可視化":
-    with st.expander("実験結果（熱の可視化）"):
-        st.markdown("#### ロウ（流動パラフィン）の融解温度")
-        st.caption("前実験での測定値を入力してください。平均は自動計算されます。")
-        
-        # 融解温度データエディタ
-        edited_melting = st.data_editor(
-            st.session_state.melting_point_df,
-            num_rows="fixed",
-            key="melting_point_editor",
-            hide_index=True,
-            column_config={
-                "平均(℃)": st.column_config.TextColumn("平均(℃)", disabled=True)
-            }
-        )
+@report_section("実験結果")
+def result_section():
+    if st.session_state.exp_title == "実験① 熱の可視化":
+        with st.expander("実験結果（熱の可視化）"):
+            st.markdown("#### ロウ（流動パラフィン）の融解温度")
+            st.caption("前実験での測定値を入力してください。平均は自動計算されます。")
         
-        # 平均値の自動計算
-        st.session_state["melting_point_df"] = edited_melting
-
-        try:
-            idx_label = edited_melting.index[0]
-            vals = []
-            for col in ["1回目(℃)", "2回目(℃)", "3回目(℃)"]:
-                v = pd.to_numeric(edited_melting.at[idx_label, col], errors="coerce")
-                if not pd.isna(v):
-                    vals.append(v)
-            
-            should_rerun = False
-            if vals:
-                avg_val = round(sum(vals) / len(vals), 1)
-                current_avg_num = pd.to_numeric(edited_melting.at[idx_label, "平均(℃)"], errors="coerce")
-                if pd.isna(current_avg_num) or avg_val != current_avg_num:
-                    edited_melting.at[idx_label, "平均(℃)"] = str(avg_val)
-                    st.session_state["melting_point_df"] = edited_melting
-                    should_rerun = True
-            else:
-                if edited_melting.at[idx_label, "平均(℃)"] != "":
-                    edited_melting.at[idx_label, "平均(℃)"] = ""
-                    st.session_state["melting_point_df"] = edited_melting
-                    should_rerun = True
-            
-            if should_rerun:
-                if "melting_point_editor" in st.session_state:
-                    del st.session_state["melting_point_editor"]
-                st.rerun()
-        except Exception as e:
-            pass
+            # 融解温度データエディタ（平均は編集と同じ回の実行で計算される）
+            derived_data_editor(
+                "melting_point_df",
+                num_rows="fixed",
+                key="melting_point_editor",
+                hide_index=True,
+                column_config=number_column_config("melting_point_df", disabled=["平均(℃)"])
+            )
 
-        st.divider()
+            st.divider()
+
+            st.markdown("#### 金属パイプごとのロウの融解時間")
+            st.caption("※ 距離(cm)は、アルミパイプ、銅パイプ、ステンレスパイプ（SUS304）の加熱端からの距離です。")
+            st.caption("各距離におけるロウの融解時間を秒単位で入力してください。")
+            logger_csv_uploader("result_df", "result_df_editor")
+            edited_df = st.data_editor(
+                st.session_state.result_df,
+                num_rows="dynamic",
+                key="result_df_editor",
+                on_change=detach_logger_log,
+                args=("result_df",),
+                column_config=number_column_config("result_df")
+            )
+            st.session_state["result_df"] = edited_df
 
-        st.markdown("#### 金属パイプごとのロウの融解時間")
-        st.caption("※ 距離(cm)は、アルミパイプ、銅パイプ、ステンレスパイプ（SUS304）の加熱端からの距離です。")
-        st.caption("各距離におけるロウの融解時間を秒単位で入力してください。")
-        edited_df = st.data_editor(
-            st.session_state.result_df,
-            num_rows="dynamic",
-            key="result_df_editor"
-        )
-        st.session_state["result_df"] = edited_df
-
-elif st.session_state.exp_title == "実験② アルカリ型燃料電池の組み立て":
-    with st.expander("実験結果（アルカリ型燃料電池）"):
-        st.markdown("#### 充電実験")
-        st.caption("アルカリ水溶液を電解した際の電解条件（充電条件）を設定し、充電後に開回路電圧(V)を測定してください。")
-        st.session_state["fc_charge_df"] = st.data_editor(
-            st.session_state.fc_charge_df,
-            key="fc_charge_editor"
-        )
-        
-        # 自動計算ロジック
-        def update_fc_table(df):
-            if not isinstance(df, pd.DataFrame):
-                return df
-            for i in df.index:
-                try:
-                    v = pd.to_numeric(df.at[i, "端子電圧(V)"], errors="coerce")
-                    a = pd.to_numeric(df.at[i, "電流(mA)"], errors="coerce")
-                    if not pd.isna(v) and not pd.isna(a):
-                        df.at[i, "出力(mW)"] = str(round(v * a, 2))
-                except: pass
-            return df
-
-        st.markdown("#### 放電実験 (1回目)")
-        st.caption("端子電圧、電流を入力すると、エネルギー（≒出力）が計算されます。")
-        edited_d1 = st.data_editor(st.session_state.fc_discharge_1, key="fc_d1_editor")
-        st.session_state["fc_discharge_1"] = update_fc_table(edited_d1)
-
-        st.markdown("#### 放電実験 (2回目)")
-        edited_d2 = st.data_editor(st.session_state.fc_discharge_2, key="fc_d2_editor")
-        st.session_state["fc_discharge_2"] = update_fc_table(edited_d2)
-
-        st.markdown("#### 放電実験 (3回目)")
-        edited_d3 = st.data_editor(st.session_state.fc_discharge_3, key="fc_d3_editor")
-        st.session_state["fc_discharge_3"] = update_fc_table(edited_d3)
-
-elif st.session_state.exp_title == "実験③ 水処理装置の設計と提案":
-    with st.expander("実験結果（水処理装置）"):
-        # 浄化対象の水
-        st.markdown("#### 浄化対象の水")
-        u_orig = st.file_uploader("浄化対象の水の写真", type=["jpg","png"], key="u_orig")
-        if u_orig:
-            st.session_state.wt_original_water_photo = base64.b64encode(u_orig.getvalue()).decode()
-        if st.session_state.wt_original_water_photo:
-            st.image(base64.b64decode(st.session_state.wt_original_water_photo), use_container_width=True)
-            if st.button("浄化前の写真を削除", key="btn_del_wt_orig"):
-                st.session_state.wt_original_water_photo = None
-                if "u_orig" in st.session_state: del st.session_state["u_orig"]
-                st.rerun()
-        
-        st.divider()
-        # 試作検討①
-        st.markdown("#### 試作検討①")
-        c1, c2 = st.columns(2)
-        with c1:
-            u_p1_d = st.file_uploader("作成した実験装置の写真 (試作①)", type=["jpg","png"], key="u_p1_d")
-            if u_p1_d: st.session_state.wt_proto1_dev_photo = base64.b64encode(u_p1_d.getvalue()).decode()
-            if st.session_state.wt_proto1_dev_photo: 
-                st.image(base64.b64decode(st.session_state.wt_proto1_dev_photo), use_container_width=True)
-                if st.button("装置①を削除", key="btn_del_p1d"):
-                    st.session_state.wt_proto1_dev_photo = None
-                    if "u_p1_d" in st.session_state: del st.session_state["u_p1_d"]
-                    st.rerun()
-        with c2:
-            u_p1_w = st.file_uploader("浄化後の水の写真 (試作①)", type=["jpg","png"], key="u_p1_w")
-            if u_p1_w: st.session_state.wt_proto1_water_photo = base64.b64encode(u_p1_w.getvalue()).decode()
-            if st.session_state.wt_proto1_water_photo: 
-                st.image(base64.b64decode(st.session_state.wt_proto1_water_photo), use_container_width=True)
-                if st.button("水①を削除", key="btn_del_p1w"):
-                    st.session_state.wt_proto1_water_photo = None
-                    if "u_p1_w" in st.session_state: del st.session_state["u_p1_w"]
-                    st.rerun()
+    elif st.session_state.exp_title == "実験② アルカリ型燃料電池の組み立て":
+        with st.expander("実験結果（アルカリ型燃料電池）"):
+            st.markdown("#### 充電実験")
+            st.caption("アルカリ水溶液を電解した際の電解条件（充電条件）を設定し、充電後に開回路電圧(V)を測定してください。")
+            st.session_state["fc_charge_df"] = st.data_editor(
+                st.session_state.fc_charge_df,
+                key="fc_charge_editor",
+                column_config=number_column_config("fc_charge_df")
+            )
         
-        st.text_area("原理や工夫（試作①） 100字程度", key="wt_proto1_text")
+            st.markdown("#### 放電実験 (1回目)")
+            st.caption("端子電圧、電流を入力すると、エネルギー（≒出力）が計算されます。")
+            logger_csv_uploader("fc_discharge_1", "fc_d1_editor")
+            derived_data_editor("fc_discharge_1", key="fc_d1_editor",
+                                column_config=number_column_config("fc_discharge_1"))
+
+            st.markdown("#### 放電実験 (2回目)")
+            logger_csv_uploader("fc_discharge_2", "fc_d2_editor")
+            derived_data_editor("fc_discharge_2", key="fc_d2_editor",
+                                column_config=number_column_config("fc_discharge_2"))
+
+            st.markdown("#### 放電実験 (3回目)")
+            logger_csv_uploader("fc_discharge_3", "fc_d3_editor")
+            derived_data_editor("fc_discharge_3", key="fc_d3_editor",
+                                column_config=number_column_config("fc_discharge_3"))
 
-        st.divider()
-        # 試作検討②
-        st.markdown("#### 試作検討②")
-        c1, c2 = st.columns(2)
-        with c1:
-            u_p2_d = st.file_uploader("作成した実験装置の写真 (試作②)", type=["jpg","png"], key="u_p2_d")
-            if u_p2_d: st.session_state.wt_proto2_dev_photo = base64.b64encode(u_p2_d.getvalue()).decode()
-            if st.session_state.wt_proto2_dev_photo: 
-                st.image(base64.b64decode(st.session_state.wt_proto2_dev_photo), use_container_width=True)
-                if st.button("装置②を削除", key="btn_del_p2d"):
-                    st.session_state.wt_proto2_dev_photo = None
-                    if "u_p2_d" in st.session_state: del st.session_state["u_p2_d"]
-                    st.rerun()
-        with c2:
-            u_p2_w = st.file_uploader("浄化後の水の写真 (試作②)", type=["jpg","png"], key="u_p2_w")
-            if u_p2_w: st.session_state.wt_proto2_water_photo = base64.b64encode(u_p2_w.getvalue()).decode()
-            if st.session_state.wt_proto2_water_photo: 
-                st.image(base64.b64decode(st.session_state.wt_proto2_water_photo), use_container_width=True)
-                if st.button("水②を削除", key="btn_del_p2w"):
-                    st.session_state.wt_proto2_water_photo = None
-                    if "u_p2_w" in st.session_state: del st.session_state["u_p2_w"]
+    elif st.session_state.exp_title == "実験③ 水処理装置の設計と提案":
+        with st.expander("実験結果（水処理装置）"):
+            # 浄化対象の水
+            st.markdown("#### 浄化対象の水")
+            u_orig = st.file_uploader("浄化対象の水の写真", type=["jpg","png"], key="u_orig")
+            if u_orig:
+                store_uploaded_photo(u_orig, "wt_original_water_photo")
+            if st.session_state.wt_original_water_photo:
+                show_photo_preview("wt_original_water_photo")
+                if st.button("浄化前の写真を削除", key="btn_del_wt_orig"):
+                    clear_photo("wt_original_water_photo", "u_orig")
                     st.rerun()
-
-        st.text_area("原理や工夫（試作②） 100字程度", key="wt_proto2_text")
-
-        st.divider()
-        # 清澄度評価
-        st.markdown("#### 清澄度評価 (1000点満点)")
-        # 既存セッションでカラムが足りない場合の補正
-        if "浄化対象の水" not in st.session_state.wt_clarity_df.columns:
-            st.session_state.wt_clarity_df.insert(0, "浄化対象の水", "")
         
-        # カラム順序の固定（浄化対象の水 を先頭に）
-        cols = ["浄化対象の水", "試作検討①", "試作検討②"]
-        existing_cols = [c for c in cols if c in st.session_state.wt_clarity_df.columns]
-        st.session_state.wt_clarity_df = st.session_state.wt_clarity_df[existing_cols]
+            st.divider()
+            # 試作検討①
+            st.markdown("#### 試作検討①")
+            c1, c2 = st.columns(2)
+            with c1:
+                u_p1_d = st.file_uploader("作成した実験装置の写真 (試作①)", type=["jpg","png"], key="u_p1_d")
+                if u_p1_d: store_uploaded_photo(u_p1_d, "wt_proto1_dev_photo")
+                if st.session_state.wt_proto1_dev_photo: 
+                    show_photo_preview("wt_proto1_dev_photo")
+                    if st.button("装置①を削除", key="btn_del_p1d"):
+                        clear_photo("wt_proto1_dev_photo", "u_p1_d")
+                        st.rerun()
+            with c2:
+                u_p1_w = st.file_uploader("浄化後の水の写真 (試作①)", type=["jpg","png"], key="u_p1_w")
+                if u_p1_w: store_uploaded_photo(u_p1_w, "wt_proto1_water_photo")
+                if st.session_state.wt_proto1_water_photo: 
+                    show_photo_preview("wt_proto1_water_photo")
+                    if st.button("水①を削除", key="btn_del_p1w"):
+                        clear_photo("wt_proto1_water_photo", "u_p1_w")
+                        st.rerun()
+        
+            st.text_area("原理や工夫（試作①） 100字程度", key="wt_proto1_text")
 
-        st.session_state.wt_clarity_df = st.data_editor(st.session_state.wt_clarity_df, key="wt_clarity_editor")
+            st.divider()
+            # 試作検討②
+            st.markdown("#### 試作検討②")
+            c1, c2 = st.columns(2)
+            with c1:
+                u_p2_d = st.file_uploader("作成した実験装置の写真 (試作②)", type=["jpg","png"], key="u_p2_d")
+                if u_p2_d: store_uploaded_photo(u_p2_d, "wt_proto2_dev_photo")
+                if st.session_state.wt_proto2_dev_photo: 
+                    show_photo_preview("wt_proto2_dev_photo")
+                    if st.button("装置②を削除", key="btn_del_p2d"):
+                        clear_photo("wt_proto2_dev_photo", "u_p2_d")
+                        st.rerun()
+            with c2:
+                u_p2_w = st.file_uploader("浄化後の水の写真 (試作②)", type=["jpg","png"], key="u_p2_w")
+                if u_p2_w: store_uploaded_photo(u_p2_w, "wt_proto2_water_photo")
+                if st.session_state.wt_proto2_water_photo: 
+                    show_photo_preview("wt_proto2_water_photo")
+                    if st.button("水②を削除", key="btn_del_p2w"):
+                        clear_photo("wt_proto2_water_photo", "u_p2_w")
+                        st.rerun()
+
+            st.text_area("原理や工夫（試作②） 100字程度", key="wt_proto2_text")
+
+            st.divider()
+            # 清澄度評価
+            st.markdown("#### 清澄度評価 (1000点満点)")
+            # 列の不足・順序（浄化対象の水 を先頭に）は復元時に coerce_table でそろえてある
+            st.session_state.wt_clarity_df = st.data_editor(
+                st.session_state.wt_clarity_df, key="wt_clarity_editor",
+                column_config=number_column_config("wt_clarity_df")
+            )
 
-        st.divider()
-        # 凝集剤の効果
-        st.markdown("#### 凝集剤の効果")
-        u_coag = st.file_uploader("凝集処理後の水の写真をアップロード", type=["jpg","png"], key="u_coag")
-        if u_coag: st.session_state.wt_coagulation_photo = base64.b64encode(u_coag.getvalue()).decode()
-        if st.session_state.wt_coagulation_photo: 
-            st.image(base64.b64decode(st.session_state.wt_coagulation_photo), use_container_width=True)
-            if st.button("凝集後の写真を削除", key="btn_del_coag"):
-                st.session_state.wt_coagulation_photo = None
-                if "u_coag" in st.session_state: del st.session_state["u_coag"]
-                st.rerun()
+            st.divider()
+            # 凝集剤の効果
+            st.markdown("#### 凝集剤の効果")
+            u_coag = st.file_uploader("凝集処理後の水の写真をアップロード", type=["jpg","png"], key="u_coag")
+            if u_coag: store_uploaded_photo(u_coag, "wt_coagulation_photo")
+            if st.session_state.wt_coagulation_photo: 
+                show_photo_preview("wt_coagulation_photo")
+                if st.button("凝集後の写真を削除", key="btn_del_coag"):
+                    clear_photo("wt_coagulation_photo", "u_coag")
+                    st.rerun()
         
-        st.text_area("原理（凝集剤） 100字程度", key="wt_coagulation_text")
+            st.text_area("原理（凝集剤） 100字程度", key="wt_coagulation_text")
+
+result_section()
 
 # -----------------------
 # 比較検証・考察
 # -----------------------
-with st.container():
-  with st.expander("比較検証と考察"):
-    if st.session_state.exp_title == "実験① 熱の可視化":
-        col1, col2, col3 = st.columns(3)
-        with col1:
-            st.text_input("銅の熱伝導率 W/m/K", key="lit_cu", help="銅の熱伝導率を調べて入力してください。")
-        with col2:
-            st.text_input("アルミの熱伝導率 W/m/K", key="lit_al", help="アルミの熱伝導率を調べて入力してください。")
-        with col3:
-            st.text_input("ステンレス(SUS304)の熱伝導率 W/m/K", key="lit_sus", help="ステンレス(SUS304等)の熱伝導率を調べて入力してください。")
-
-        st.text_area(
-            "実験結果との比較（100字程度）", 
-            key="comparison_text", 
-            height=80,
-            help="グラフの傾きや順序が文献値の傾向と一致しているか、材質の違いがどう影響したか等を考察してください。"
-        )
-        st.text_input("熱伝導率の引用文献 (1件)", key="thermal_conductivity_ref")
+@report_section("比較検証・考察")
+def comparison_section():
+    with st.container():
+      with st.expander("比較検証と考察"):
+        if st.session_state.exp_title == "実験① 熱の可視化":
+            col1, col2, col3 = st.columns(3)
+            with col1:
+                st.text_input("銅の熱伝導率 W/m/K", key="lit_cu", help="銅の熱伝導率を調べて入力してください。")
+            with col2:
+                st.text_input("アルミの熱伝導率 W/m/K", key="lit_al", help="アルミの熱伝導率を調べて入力してください。")
+            with col3:
+                st.text_input("ステンレス(SUS304)の熱伝導率 W/m/K", key="lit_sus", help="ステンレス(SUS304等)の熱伝導率を調べて入力してください。")
+
+            st.text_area(
+                "実験結果との比較（100字程度）", 
+                key="comparison_text", 
+                height=80,
+                help="グラフの傾きや順序が文献値の傾向と一致しているか、材質の違いがどう影響したか等を考察してください。"
+            )
+            st.text_input("熱伝導率の引用文献 (1件)", key="thermal_conductivity_ref")
+
+        elif st.session_state.exp_title == "実験② アルカリ型燃料電池の組み立て":
+            st.text_area(
+                "充電条件の比較（100字程度）",
+                key="fc_comparison_text",
+                height=100,
+                help="充電時間や電圧の違いが放電特性（グラフの形や持続時間）にどう影響したか考察してください。"
+            )
+        elif st.session_state.exp_title == "実験③ 水処理装置の設計と提案":
+            st.text_area(
+                "装置の比較　試作①vs試作②（100字程度）",
+                key="wt_comparison_text",
+                height=100,
+                help="何を変えて、効果はどの程度あったかを記述してください。"
+            )
 
-    elif st.session_state.exp_title == "実験② アルカリ型燃料電池の組み立て":
-        st.text_area(
-            "充電条件の比較（100字程度）",
-            key="fc_comparison_text",
-            height=100,
-            help="充電時間や電圧の違いが放電特性（グラフの形や持続時間）にどう影響したか考察してください。"
-        )
-    elif st.session_state.exp_title == "実験③ 水処理装置の設計と提案":
-        st.text_area(
-            "装置の比較　試作①vs試作②（100字程度）",
-            key="wt_comparison_text",
-            height=100,
-            help="何を変えて、効果はどの程度あったかを記述してください。"
-        )
+comparison_section()
 
 # -----------------------
 # 結果グラフ
@@ -2035,46 +1620,61 @@ with st.container():
 # -----------------------
 # 結果グラフ
 # -----------------------
-with st.expander("結果グラフ"):
-    if st.session_state.exp_title == "実験① 熱の可視化":
-        _, col_center, _ = st.columns([1, 4, 1])
-        with col_center:
-            fig = create_graph()
-            st.pyplot(fig)
-            st.markdown("<div style='text-align: center;'>熱が伝導した距離とロウの融解時間の関係（溶け始めの時間）</div>", unsafe_allow_html=True)
+@report_section("結果グラフ")
+def graph_section():
+    with st.expander("結果グラフ", key="graph_expander", on_change="rerun") as graph_box:
+        # 閉じている間はグラフを作らない（Matplotlib の読み込みと描画を、開いたときまで遅らせる）
+        if not graph_box.open:
+            return
+        # 既定はブラウザで描くグラフ（Vega-Lite）。画像が必要なときだけサーバーでPNGを描く
+        as_png = st.toggle("画像（PNG）で表示", key="graph_as_png", help="オンにすると、サーバーで描いた画像で表示します（画像として保存できます）。")
+        if st.session_state.exp_title == "実験① 熱の可視化":
+            _, col_center, _ = st.columns([1, 4, 1])
+            with col_center:
+                if as_png:
+                    st.image(thermal_graph_png(st.session_state.result_df), width="stretch")
+                else:
+                    st.vega_lite_chart(thermal_chart_data(st.session_state.result_df), THERMAL_SPEC, width="stretch")
+                st.markdown("<div style='text-align: center;'>熱が伝導した距離とロウの融解時間の関係（溶け始めの時間）</div>", unsafe_allow_html=True)
+
+            st.markdown("#### まとめ表（融解時間を t = t0 + k×距離² で近似）")
+            st.caption("熱が伝わる時間は距離の2乗に比例します。k が小さい金属ほど熱が速く伝わります（熱拡散率 ∝ 1/k）。"
+                       "熱伝導率の比は「比較検証」に入力した文献値から計算します。")
+            # ロガーから取り込んだ表は全点の記録で近似する
+            rows = thermal_fit_rows(
+                full_table(st.session_state, "result_df", st.session_state.photo_store),
+                [st.session_state.lit_cu, st.session_state.lit_al, st.session_state.lit_sus],
+            )
+            st.write(pd.DataFrame([r[1:] for r in rows], columns=["銅", "アルミ", "ステンレス"], index=[r[0] for r in rows]))
             
-    elif st.session_state.exp_title == "実験② アルカリ型燃料電池の組み立て":
-        _, col_center, _ = st.columns([1, 4, 1])
-        with col_center:
-            fig = create_fuel_cell_graph()
-            st.pyplot(fig)
-            st.markdown("<div style='text-align: center;'>放電時の時間と出力の関係（1～3回目）</div>", unsafe_allow_html=True)
-        
-        st.markdown("#### まとめ表（グラフの折れ線近似で下部面積 ＝ 発生エネルギーJ）")
-        areas = []
-        for df in [st.session_state.fc_discharge_1, st.session_state.fc_discharge_2, st.session_state.fc_discharge_3]:
-             try:
-                 t = pd.to_numeric(df["放電時間(sec)"], errors="coerce").fillna(0).values
-                 p = pd.to_numeric(df["出力(mW)"], errors="coerce").fillna(0).values
-                 
-                 area_mJ = 0
-                 for i in range(len(t)-1):
-                     dt = t[i+1] - t[i]
-                     avg_p = (p[i+1] + p[i]) / 2.0
-                     area_mJ += dt * avg_p
-                 
-                 areas.append(f"{area_mJ/1000:.2f}")
-             except:
-                 areas.append("-")
+        elif st.session_state.exp_title == "実験② アルカリ型燃料電池の組み立て":
+            _, col_center, _ = st.columns([1, 4, 1])
+            with col_center:
+                discharge_dfs = [st.session_state.fc_discharge_1, st.session_state.fc_discharge_2, st.session_state.fc_discharge_3]
+                if as_png:
+                    st.image(fuel_cell_graph_png(discharge_dfs), width="stretch")
+                else:
+                    st.vega_lite_chart(fuel_cell_chart_data(discharge_dfs), FUEL_CELL_SPEC, width="stretch")
+                st.markdown("<div style='text-align: center;'>放電時の時間と出力の関係（1～3回目）</div>", unsafe_allow_html=True)
         
-        st.write(pd.DataFrame([areas], columns=["1回目(J)", "2回目(J)", "3回目(J)"], index=["発生エネルギー"]))
+            st.markdown("#### まとめ表（グラフの折れ線近似で下部面積 ＝ 発生エネルギーJ）")
+            # ロガーから取り込んだ回は全点の記録で計算する
+            rows = discharge_summary_rows([
+                full_table(st.session_state, k, st.session_state.photo_store)
+                for k in ("fc_discharge_1", "fc_discharge_2", "fc_discharge_3")
+            ])
+            st.write(pd.DataFrame([r[1:] for r in rows], columns=["1回目", "2回目", "3回目"], index=[r[0] for r in rows]))
+
+        elif st.session_state.exp_title == "実験③ 水処理装置の設計と提案":
+            _, col_center, _ = st.columns([1, 4, 1])
+            with col_center:
+                if as_png:
+                    st.image(water_treatment_graph_png(st.session_state.wt_clarity_df), width="stretch")
+                else:
+                    st.vega_lite_chart(water_treatment_chart_data(st.session_state.wt_clarity_df), WATER_TREATMENT_SPEC, width="stretch")
+                st.markdown("<div style='text-align: center;'>水処理装置による浄化の効果</div>", unsafe_allow_html=True)
 
-    elif st.session_state.exp_title == "実験③ 水処理装置の設計と提案":
-        _, col_center, _ = st.columns([1, 4, 1])
-        with col_center:
-            fig = create_water_treatment_graph()
-            st.pyplot(fig)
-            st.markdown("<div style='text-align: center;'>水処理装置による浄化の効果</div>", unsafe_allow_html=True)
+graph_section()
 
 
 
@@ -2086,26 +1686,41 @@ with st.expander("結果グラフ"):
 # ルーブリック（評価基準）
 # -----------------------
 st.markdown("### 自己評価閲覧")
-with st.expander("簡易自己評価（達成度）"):
-    st.markdown("### 必要条件の達成度")
-    st.caption("現在の入力状況に基づく目安の達成度です（最大：100%）。提出前の確認に使ってください。")
-
-    # --- 採点ロジック ---
-    score_home, score_report, total, is_default_basic = calculate_achievement_rate()
-
-    # 表示
-    c1, c2, c3 = st.columns(3)
-    c1.metric("総合達成度", f"{total} %")
-    c2.metric("自宅課題", f"{score_home} % (max 50)")
-    c3.metric("レポート作成", f"{score_report} % (max 50)")
+@report_section("自己評価")
+def self_evaluation_section():
+    with st.expander("簡易自己評価（達成度）"):
+        st.markdown("### 必要条件の達成度")
+        st.caption("現在の入力状況に基づく目安の達成度です（最大：100%）。提出前の確認に使ってください。")
+
+        # --- 採点ロジック ---
+        score_home, score_report, total, is_default_basic = calculate_achievement_rate()
+
+        # 表示
+        c1, c2, c3 = st.columns(3)
+        c1.metric("総合達成度", f"{total} %")
+        c2.metric("自宅課題", f"{score_home} % (max 50)")
+        c3.metric("レポート作成", f"{score_report} % (max 50)")
     
-    if total < 60:
-        st.error("入力が不足しています。各項目を見直してください。")
-    elif total < 80:
-        st.warning("合格圏内ですが、さらに記述を充実させましょう。")
-    else:
-        st.success("素晴らしい出来栄えです！")
+        if total < 60:
+            st.error("入力が不足しています。各項目を見直してください。")
+        elif total < 80:
+            st.warning("合格圏内ですが、さらに記述を充実させましょう。")
+        else:
+            st.success("素晴らしい出来栄えです！")
+
+        if is_default_basic:
+
+            st.warning("⚠️ 学籍番号や氏名が初期値（例：高専 太郎）のままです。修正してください。")
+
+self_evaluation_section()
 
-    if is_default_basic:
 
-        st.warning("⚠️ 学籍番号や氏名が初期値（例：高専 太郎）のままです。修正してください。")
+# -----------------------
+# 自動保存（変更分のみ・書き込みは別スレッド）
+# -----------------------
+autosave_session()
+
+# セクション単独の再実行で、全体の再実行が必要かどうかを判定するための基準
+with measure_cpu("要約の判定"):
+    st.session_state["_summary_signature"] = summary_signature()
+end_run("全体の再実行", _run_timer)
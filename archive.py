@@ -0,0 +1,207 @@
+# -*- coding: utf-8 -*-
+"""復元用ファイル（作業状態の保存）のアーカイブ形式
+
+ZIPの中身:
+    manifest.json            形式・バージョン、基本情報、履歴、実験と写真の一覧
+    experiments/NN.json      テーマごとの入力状態（写真は "sha256:..." 参照）
+    photos/<sha256>.<ext>    写真の実体（バイナリのまま、各1つだけ）。データロガーの全点の記録も .npz でここに入る
+
+写真（とロガーの記録）は圧縮済みなのでZIP_STOREDで格納し、JSONだけを圧縮する。
+読み込み時はエントリを1つずつストリームで読むため、全体を一度にメモリへ展開しない。
+現在のテーマ以外の入力状態は LazyExperimentState（JSONのバイト列のまま）で保持し、
+そのテーマへ切り替えたときに初めて展開する。
+旧形式（1つのJSONファイル）は load_save_file() でそのまま読み込める。
+"""
+import json
+import re
+import zipfile
+import zlib
+from io import BytesIO
+
+from photos import PHOTO_REF_PREFIX, photo_digest
+
+ARCHIVE_FORMAT = "omu-exp-report"
+ARCHIVE_VERSION = 1
+MANIFEST_NAME = "manifest.json"
+
+# manifest.json にそのまま入れる（テーマ別ファイルに分けない）項目
+_GLOBAL_SECTIONS = ["global_info", "origin_info", "history_log", "achievement_at_save"]
+
+_PHOTO_REF_RE = re.compile(rb"sha256:[0-9a-f]{64}")
+
+
+# 壊れた・途中で切れたZIPを読んだときに zipfile・zlib が出す例外（ArchiveError にして返す）
+_ZIP_ERRORS = (zipfile.BadZipFile, zlib.error, EOFError)
+
+
+class ArchiveError(Exception):
+    """復元用アーカイブの形式が不正"""
+
+
+class LazyExperimentState:
+    """未展開のテーマの入力状態（アーカイブ内のJSONをバイト列のまま保持する）"""
+
+    __slots__ = ("raw", "photo_refs")
+
+    def __init__(self, raw):
+        self.raw = raw
+        # 写真ストアのガベージコレクションで参照を見落とさないよう、参照だけは先に拾っておく
+        self.photo_refs = {m.decode("ascii") for m in _PHOTO_REF_RE.findall(raw)}
+
+    def load(self):
+        return json.loads(self.raw)
+
+
+def materialize_exp_state(state):
+    """実験レジストリの値を辞書にする（未展開ならここで展開する）"""
+    if isinstance(state, LazyExperimentState):
+        return state.load()
+    return state
+
+
+def _dumps(obj):
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":"))
+
+
+def _photo_ext(data):
+    if data[:3] == b"\xff\xd8\xff":
+        return "jpg"
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+        return "webp"
+    if data[:8] == b"\x89PNG\r\n\x1a\n":
+        return "png"
+    if data[:4] == b"PK\x03\x04":
+        return "npz"  # データロガーの全点の記録（logger_import.encode_log）
+    return "bin"
+
+
+def write_archive(export_data, store, refs):
+    """保存データ（旧JSON形式と同じ構造の辞書）と写真ストアからZIPのバイト列を作る
+
+    refs: アーカイブに含める写真参照の集合（レジストリから参照されているもの）
+    """
+    buf = BytesIO()
+    manifest = {
+        "format": ARCHIVE_FORMAT,
+        "version": ARCHIVE_VERSION,
+        "experiments": [],
+        "photos": [],
+    }
+    for k in _GLOBAL_SECTIONS:
+        if k in export_data:
+            manifest[k] = export_data[k]
+
+    with zipfile.ZipFile(buf, "w", compression=zipfile.ZIP_DEFLATED) as zf:
+        for i, (title, state) in enumerate(export_data.get("experiment_registry", {}).items(), 1):
+            name = f"experiments/{i:02d}.json"
+            # 未展開のテーマは読み込んだバイト列をそのまま書き戻す
+            raw = state.raw if isinstance(state, LazyExperimentState) else _dumps(state)
+            zf.writestr(name, raw)
+            manifest["experiments"].append({"title": title, "path": name})
+
+        for ref in sorted(refs):
+            data = store.get(ref)
+            if data is None:
+                continue
+            digest = ref[len(PHOTO_REF_PREFIX):]
+            name = f"photos/{digest}.{_photo_ext(data)}"
+            zf.writestr(name, data, compress_type=zipfile.ZIP_STORED)
+            manifest["photos"].append({"sha256": digest, "path": name, "size": len(data)})
+
+        # manifest は最後に書く（読み込み側はZIPの中央ディレクトリから探すので順序は問わない）
+        zf.writestr(MANIFEST_NAME, _dumps(manifest))
+    return buf.getvalue()
+
+
+def is_archive(fileobj):
+    """ファイルがZIP（新形式）かどうか（読み取り位置は先頭に戻す）"""
+    fileobj.seek(0)
+    result = zipfile.is_zipfile(fileobj)
+    fileobj.seek(0)
+    return result
+
+
+def read_manifest(fileobj):
+    """アーカイブから manifest.json だけを読む（確認ダイアログ用）"""
+    fileobj.seek(0)
+    try:
+        with zipfile.ZipFile(fileobj) as zf:
+            return _read_manifest(zf)
+    except _ZIP_ERRORS as e:
+        raise ArchiveError(f"復元用ファイルが破損しています: {e}") from e
+
+
+def _read_manifest(zf):
+    try:
+        with zf.open(MANIFEST_NAME) as f:
+            manifest = json.load(f)
+    except KeyError:
+        raise ArchiveError("manifest.json がありません")
+    if manifest.get("format") != ARCHIVE_FORMAT:
+        raise ArchiveError("復元用ファイルの形式が違います")
+    if manifest.get("version", 0) > ARCHIVE_VERSION:
+        raise ArchiveError(f"新しい形式のファイルです (version {manifest.get('version')})。アプリを更新してください")
+    return manifest
+
+
+def read_archive(fileobj, store, eager_title=None):
+    """アーカイブを読み込み、旧JSON形式と同じ構造の辞書を返す
+
+    写真はエントリを1つずつ読み、ハッシュを確認してからストアに登録する。
+    eager_title 以外のテーマは LazyExperimentState のまま返す（eager_title=None なら全テーマを展開）。
+    """
+    fileobj.seek(0)
+    try:
+        return _read_archive(fileobj, store, eager_title)
+    except (*_ZIP_ERRORS, KeyError) as e:
+        # KeyError: manifest に載っているエントリがZIPにない
+        raise ArchiveError(f"復元用ファイルが破損しています: {e}") from e
+
+
+def _read_archive(fileobj, store, eager_title):
+    with zipfile.ZipFile(fileobj) as zf:
+        manifest = _read_manifest(zf)
+        data = {k: manifest[k] for k in _GLOBAL_SECTIONS if k in manifest}
+
+        for p in manifest.get("photos", []):
+            with zf.open(p["path"]) as f:
+                blob = f.read()
+            if photo_digest(blob) != p["sha256"]:
+                raise ArchiveError(f"写真データが破損しています: {p['path']}")
+            store.load_blobs({p["sha256"]: blob})
+
+        registry = {}
+        for e in manifest.get("experiments", []):
+            with zf.open(e["path"]) as f:
+                if eager_title is None or e["title"] == eager_title:
+                    registry[e["title"]] = json.load(f)
+                else:
+                    registry[e["title"]] = LazyExperimentState(f.read())
+        data["experiment_registry"] = registry
+    return data
+
+
+def read_save_header(fileobj):
+    """確認ダイアログ用に基本情報だけを読む（新旧どちらの形式にも対応）"""
+    if is_archive(fileobj):
+        return read_manifest(fileobj)
+    fileobj.seek(0)
+    return json.load(fileobj)
+
+
+def load_save_file(fileobj, store, eager_title=None):
+    """復元用ファイルを読み込む（新形式のZIP・旧形式のJSONの両方に対応）
+
+    新形式では eager_title 以外のテーマは未展開のまま返す。旧形式は全体が1つのJSONなので常に展開済み。
+    """
+    if is_archive(fileobj):
+        return read_archive(fileobj, store, eager_title)
+    fileobj.seek(0)
+    if fileobj.read(4) == b"PK\x03\x04":
+        # ZIPの先頭はあるのに中央ディレクトリが読めない（ダウンロードが途中で切れた等）
+        raise ArchiveError("復元用ファイルが破損しています（ZIPの末尾がありません）")
+    fileobj.seek(0)
+    data = json.load(fileobj)
+    # 旧形式でも写真ハッシュ参照付きのJSON（photo_blobs）があれば取り込む
+    store.load_blobs(data.get("photo_blobs"))
+    return data
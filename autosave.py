@@ -0,0 +1,211 @@
+# -*- coding: utf-8 -*-
+"""サーバー側の自動保存（SQLite・WALモード）
+
+環境変数 REPORT_AUTOSAVE_DIR で保存先ディレクトリを指定したときだけ有効になる。
+学生の出席番号と実験タイトルごとに、変更のあったキーだけを差分として書き込む
+（保存先の出席番号・実験タイトルが変わったときは全体を書く）。
+書き込みは専用スレッドがまとめて行うため、画面の描画（スクリプトの再実行）を待たせない。
+ブラウザのタブが落ちても、同じ出席番号で開き直せば直前の状態から復元できる。
+"""
+import json
+import logging
+import os
+import queue
+import sqlite3
+import threading
+import time
+
+from photos import PHOTO_REF_PREFIX, is_photo_ref
+
+AUTOSAVE_DIR_ENV = "REPORT_AUTOSAVE_DIR"
+DB_NAME = "autosave.sqlite3"
+
+# 書き込みをまとめる間隔（秒）。連続入力中は最後の値だけが書かれる
+DEBOUNCE_SEC = 2.0
+
+logger = logging.getLogger(__name__)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS snapshot_keys (
+    student_id TEXT NOT NULL,
+    exp_title  TEXT NOT NULL,
+    key        TEXT NOT NULL,
+    value      TEXT NOT NULL,
+    updated_at REAL NOT NULL,
+    PRIMARY KEY (student_id, exp_title, key)
+);
+CREATE TABLE IF NOT EXISTS photos (
+    ref        TEXT PRIMARY KEY,
+    data       BLOB NOT NULL
+);
+"""
+
+_lock = threading.Lock()
+_store = None
+
+
+class AutosaveStore:
+    """自動保存の書き込みスレッドと読み出しをまとめたもの（プロセスに1つ）"""
+
+    def __init__(self, directory):
+        os.makedirs(directory, exist_ok=True)
+        self.path = os.path.join(directory, DB_NAME)
+        conn = self._connect()
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(_SCHEMA)
+        finally:
+            conn.close()
+        self._queue = queue.Queue()
+        # (出席番号, 実験タイトル) → 最後に書き込んだ時刻（書き込みスレッドが更新する）
+        self._saved_at = {}
+        self._saved_lock = threading.Lock()
+        # 書き込み待ちの有無（_idle）は、キューへの出し入れと同じロックの中で切り替える
+        self._idle_lock = threading.Lock()
+        self._idle = threading.Event()
+        self._idle.set()
+        self._thread = threading.Thread(target=self._run, name="autosave-writer", daemon=True)
+        self._thread.start()
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=10)
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    # -----------------------
+    # 書き込み（非同期）
+    # -----------------------
+    def submit(self, student_id, exp_title, changes, photos=None):
+        """変更のあったキー（key → JSON文字列）を書き込み待ちに積む（すぐに戻る）"""
+        item = (student_id, exp_title, dict(changes), dict(photos or {}), time.time())
+        # 書き込みスレッドが「キューが空」と見て _idle を立てるのと入れ違いにならないよう、同じロックの中で積む
+        with self._idle_lock:
+            self._idle.clear()
+            self._queue.put(item)
+
+    def flush(self, timeout=None):
+        """書き込み待ちがなくなるまで待つ（終了処理・計測用）"""
+        return self._idle.wait(timeout)
+
+    def _run(self):
+        conn = self._connect()
+        while True:
+            item = self._queue.get()
+            batch = [item]
+            # 少し待って、その間に届いた変更をまとめて1回のトランザクションで書く
+            deadline = time.monotonic() + DEBOUNCE_SEC
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            try:
+                self._write_batch(conn, batch)
+            except Exception:
+                logger.exception("自動保存の書き込みに失敗しました")
+            else:
+                with self._saved_lock:
+                    for student_id, exp_title, _, _, ts in batch:
+                        key = (student_id, exp_title)
+                        self._saved_at[key] = max(ts, self._saved_at.get(key) or ts)
+            with self._idle_lock:
+                if self._queue.empty():
+                    self._idle.set()
+
+    def _write_batch(self, conn, batch):
+        rows = {}
+        photos = {}
+        for student_id, exp_title, changes, batch_photos, ts in batch:
+            for k, v in changes.items():
+                rows[(student_id, exp_title, k)] = (v, ts)
+            photos.update(batch_photos)
+        with conn:
+            # 上書きで参照されなくなるかもしれない写真（上書き前の値が写真参照のもの）
+            replaced = set()
+            for (s, t, k) in rows:
+                old = conn.execute(
+                    "SELECT value FROM snapshot_keys WHERE student_id=? AND exp_title=? AND key=?", (s, t, k),
+                ).fetchone()
+                if old and old[0].startswith('"' + PHOTO_REF_PREFIX):
+                    replaced.add(json.loads(old[0]))
+            conn.executemany(
+                "INSERT OR IGNORE INTO photos (ref, data) VALUES (?, ?)",
+                [(ref, sqlite3.Binary(data)) for ref, data in photos.items() if data],
+            )
+            conn.executemany(
+                "INSERT INTO snapshot_keys (student_id, exp_title, key, value, updated_at) VALUES (?, ?, ?, ?, ?) "
+                "ON CONFLICT (student_id, exp_title, key) DO UPDATE SET value=excluded.value, updated_at=excluded.updated_at",
+                [(s, t, k, v, ts) for (s, t, k), (v, ts) in rows.items()],
+            )
+            # どの保存（他の学生・テーマを含む）からも参照されなくなった写真を消す
+            # （同じまとまりの中で積まれてすぐ差し替えられた写真も対象にする）
+            replaced.update(photos)
+            conn.executemany(
+                "DELETE FROM photos WHERE ref=? AND NOT EXISTS (SELECT 1 FROM snapshot_keys WHERE value=?)",
+                [(ref, json.dumps(ref)) for ref in replaced],
+            )
+
+    # -----------------------
+    # 読み出し
+    # -----------------------
+    def last_saved_at(self, student_id, exp_title):
+        """最後に自動保存された時刻（UNIX時間）。保存がなければ None
+
+        書き込みスレッドが記録した時刻をメモリから返す（画面の再実行ごとに SQLite を開かない）。
+        プロセスの起動後に初めて聞かれた保存先だけ、データベースを1回読む。
+        """
+        key = (student_id, exp_title)
+        with self._saved_lock:
+            if key in self._saved_at:
+                return self._saved_at[key]
+        saved_at = self._query_last_saved_at(student_id, exp_title)
+        with self._saved_lock:
+            # 読んでいる間に書き込みスレッドが記録していれば、そちらを使う
+            return self._saved_at.setdefault(key, saved_at)
+
+    def _query_last_saved_at(self, student_id, exp_title):
+        conn = self._connect()
+        try:
+            row = conn.execute(
+                "SELECT MAX(updated_at) FROM snapshot_keys WHERE student_id=? AND exp_title=?",
+                (student_id, exp_title),
+            ).fetchone()
+        finally:
+            conn.close()
+        return row[0] if row else None
+
+    def load(self, student_id, exp_title):
+        """自動保存された状態（key → 値）と、参照している写真（参照 → バイト列）を返す"""
+        conn = self._connect()
+        try:
+            rows = conn.execute(
+                "SELECT key, value FROM snapshot_keys WHERE student_id=? AND exp_title=?",
+                (student_id, exp_title),
+            ).fetchall()
+            state = {k: json.loads(v) for k, v in rows}
+            refs = {v for v in state.values() if is_photo_ref(v)}
+            photos = {}
+            for ref in refs:
+                row = conn.execute("SELECT data FROM photos WHERE ref=?", (ref,)).fetchone()
+                if row:
+                    photos[ref] = bytes(row[0])
+        finally:
+            conn.close()
+        return state, photos
+
+
+def get_autosave_store():
+    """自動保存ストアを返す（REPORT_AUTOSAVE_DIR が未設定なら None）"""
+    global _store
+    directory = os.environ.get(AUTOSAVE_DIR_ENV)
+    if not directory:
+        return None
+    if _store is None:
+        with _lock:
+            if _store is None:
+                _store = AutosaveStore(directory)
+                logger.info("自動保存を有効化: %s", _store.path)
+    return _store
@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+"""放電実験の発生エネルギーの集計（derived.discharge_summary）の速さ
+
+実行: python benchmarks/discharge_energy.py [行数]
+
+データロガーの記録のような長い放電表（時刻の順不同・重複・欠測あり）を作り、
+以前の計算（行ごとの Python ループ、空欄は0）と、集計（初回・キャッシュ済み）の時間を比べる。
+"""
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from derived import FC_POWER_COL, FC_TIME_COL, discharge_summary  # noqa: E402
+
+
+def make_log(rows, seed=0):
+    """1秒ごとの測定（並びは順不同、1%は同じ時刻の重複、0.5%は欠測）"""
+    rng = np.random.default_rng(seed)
+    t = np.arange(rows, dtype="float64")
+    t[rng.integers(0, rows, rows // 100)] -= 1
+    p = 30.0 * np.exp(-t / rows) + rng.normal(0, 0.2, rows)
+    p[rng.integers(0, rows, rows // 200)] = np.nan
+    order = rng.permutation(rows)
+    return pd.DataFrame({FC_TIME_COL: t[order], FC_POWER_COL: p[order]})
+
+
+def loop_energy_j(df):
+    """以前の計算（表の行の順に台形を足す。空欄は0）"""
+    t = df[FC_TIME_COL].fillna(0).values
+    p = df[FC_POWER_COL].fillna(0).values
+    area_mj = 0
+    for i in range(len(t) - 1):
+        area_mj += (t[i + 1] - t[i]) * (p[i + 1] + p[i]) / 2.0
+    return area_mj / 1000
+
+
+def timed(func, *args):
+    t0 = time.perf_counter()
+    result = func(*args)
+    return result, (time.perf_counter() - t0) * 1000
+
+
+def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    df = make_log(rows)
+    before, t_loop = timed(loop_energy_j, df)
+    summary, t_first = timed(discharge_summary, df)
+    _, t_cached = timed(discharge_summary, df)
+    print(f"放電表 {rows:,}行（順不同・重複・欠測あり）")
+    print(f"以前の計算: {before:12.2f} J  {t_loop:8.1f}ms")
+    print(f"集計（初回）: {summary.energy_j:10.2f} J  {t_first:8.1f}ms")
+    print(f"集計（キャッシュ）:            {t_cached:8.1f}ms")
+    print(f"最大出力 {summary.peak_mw:.2f} mW / 平均出力 {summary.mean_mw:.2f} mW / 放電時間 {summary.duration_s:g} sec")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*-
+"""データロガーのCSVの取り込み（logger_import.import_logger_csv）の速さと大きさ
+
+実行: python benchmarks/logger_import.py [行数]
+
+Shift_JIS・説明行付き・経過時間[分]/電流(A) のロガー風CSVを作って放電表に取り込み、
+取り込み時間、表示用に間引いた行数、全点の記録（npz）の大きさ、
+全点と間引いた表それぞれの発生エネルギーを表示する。
+"""
+import io
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from derived import discharge_summary  # noqa: E402
+from logger_import import decode_log, import_logger_csv  # noqa: E402
+
+
+def make_csv(rows, seed=0):
+    """1秒ごとの放電の記録（説明行・欠測あり）"""
+    rng = np.random.default_rng(seed)
+    minutes = np.arange(rows) / 60
+    volts = 0.9 * np.exp(-minutes / (rows / 30)) + rng.normal(0, 0.005, rows)
+    amps = 0.03 * np.exp(-minutes / (rows / 30)) + rng.normal(0, 0.0005, rows)
+    lines = ["データロガー 記録", "サンプリング間隔,1s", "", "経過時間[分],電圧(V),電流(A)"]
+    for m, v, a in zip(minutes, volts, amps):
+        lines.append(f"{m:.5f},{v:.4f},{a:.5f}")
+    for i in rng.integers(4, len(lines), rows // 1000):
+        lines[i] = lines[i].rsplit(",", 1)[0] + ",---"
+    return ("\r\n".join(lines) + "\r\n").encode("cp932")
+
+
+def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    data = make_csv(rows)
+    t0 = time.perf_counter()
+    imported = import_logger_csv(io.BytesIO(data), "fc_discharge_1")
+    t_import = (time.perf_counter() - t0) * 1000
+    full = decode_log(imported.log)
+    print(f"CSV {rows:,}行 {len(data) / 1024:,.0f}KB → 取り込み {t_import:.1f}ms")
+    print(f"表示用の表: {len(imported.table)}行 / 全点の記録(npz): {len(imported.log) / 1024:,.0f}KB")
+    print(f"発生エネルギー 全点: {discharge_summary(full).energy_j:.2f} J"
+          f" / 間引いた表: {discharge_summary(imported.table).energy_j:.2f} J")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,45 @@
+# -*- coding: utf-8 -*-
+"""PDFの写真の縮小の効果（PDFサイズ・作成時間）
+
+実行: python benchmarks/pdf_photos.py 保存ファイル.zip [dpi]
+
+取り込み済みの写真をそのまま埋め込んだ場合（縮小前）と、
+枠に合わせて dpi（既定は report_layout.PHOTO_DPI）まで縮小した場合（縮小後）のPDFを比べる。
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from archive import load_save_file  # noqa: E402
+from photos import PhotoStore, format_size  # noqa: E402
+from report_layout import PHOTO_DPI, build_report_pdf  # noqa: E402
+from report_pdf import state_from_save  # noqa: E402
+
+
+def build(s, store, dpi):
+    t0 = time.perf_counter()
+    pdf = build_report_pdf(s, store, photo_dpi=dpi)
+    return len(pdf), time.perf_counter() - t0
+
+
+def main():
+    if len(sys.argv) < 2:
+        print(__doc__)
+        return 2
+    dpi = int(sys.argv[2]) if len(sys.argv) > 2 else PHOTO_DPI
+    store = PhotoStore()
+    with open(sys.argv[1], "rb") as f:
+        s = state_from_save(load_save_file(f, store), store)
+
+    before, t_before = build(s, store, None)
+    after, t_after = build(s, store, dpi)
+    print(f"{s.exp_title}（写真 {dpi}dpi）")
+    print(f"縮小前: {format_size(before):>8}  {t_before * 1000:7.1f}ms")
+    print(f"縮小後: {format_size(after):>8}  {t_after * 1000:7.1f}ms（{(1 - after / before) * 100:.0f}%削減）")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
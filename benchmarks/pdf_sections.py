@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+"""PDF作成のセクションごとの時間（キャッシュなし ↔ 1項目だけ変更したとき）
+
+実行: python benchmarks/pdf_sections.py 保存ファイル.zip [回数]
+
+1回目はすべてのセクションを作成する。2回目以降は考察の文章だけを書き換えて作成し、
+作り直されるのが変更したセクション（と組版）だけになることを確認する。
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import perf  # noqa: E402
+from archive import load_save_file  # noqa: E402
+from photos import PhotoStore  # noqa: E402
+from report_pdf import build_report_pdf, state_from_save  # noqa: E402
+
+# 実験ごとの考察の入力欄
+COMPARISON_KEYS = {
+    "実験① 熱の可視化": "comparison_text",
+    "実験② アルカリ型燃料電池の組み立て": "fc_comparison_text",
+    "実験③ 水処理装置の設計と提案": "wt_comparison_text",
+}
+
+
+def build(s, store):
+    perf.clear()
+    t0 = time.perf_counter()
+    build_report_pdf(s, store)
+    wall = time.perf_counter() - t0
+    return wall, {k: v["cpu_ms_total"] for k, v in perf.summary().items() if k.startswith("PDF ")}
+
+
+def main():
+    if len(sys.argv) < 2:
+        print(__doc__)
+        return 2
+    runs = int(sys.argv[2]) if len(sys.argv) > 2 else 3
+    store = PhotoStore()
+    with open(sys.argv[1], "rb") as f:
+        s = state_from_save(load_save_file(f, store), store)
+    key = COMPARISON_KEYS.get(s.exp_title)
+
+    cold_wall, cold = build(s, store)
+    warm = []
+    for i in range(runs):
+        if key:
+            s[key] = f"{s.get(key, '')} (変更{i})"
+        warm.append(build(s, store))
+
+    print(f"{s.exp_title}")
+    print(f"{'区間':<20}{'初回[ms]':>10}{'変更後[ms]':>12}")
+    for name in cold:
+        mean = sum(w[1].get(name, 0.0) for w in warm) / len(warm)
+        print(f"{name:<20}{cold[name]:>10.1f}{mean:>12.1f}")
+    warm_wall = sum(w[0] for w in warm) / len(warm)
+    print(f"{'合計（経過時間）':<20}{cold_wall * 1000:>10.1f}{warm_wall * 1000:>12.1f}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
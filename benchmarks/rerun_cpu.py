@@ -0,0 +1,118 @@
+# -*- coding: utf-8 -*-
+"""1回の入力操作あたりのサーバーCPU時間の比較（全体の再実行 ↔ セクション単独の再実行）
+
+実行: python benchmarks/rerun_cpu.py [回数]
+
+基準（セクション単位の再実行を入れる前の動き）: 入力のたびにスクリプト全体を再実行する。
+これを AppTest の通常の実行で計る。
+セクション単独の再実行: ブラウザでセクション（report_section）内の入力を操作したときと同じく、
+再実行の要求にそのセクションのフラグメントIDを載せて、フラグメントだけを実際に再実行して計る
+（AppTest には入力操作からフラグメントだけを再実行する手段がないため、要求を作る部分を差し替える）。
+どちらもスクリプトのスレッドCPU時間（perf の記録）で比べる。AppTest 自体の処理（1回あたり100ms以上）は含めない。
+"""
+import dataclasses
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from streamlit.runtime.scriptrunner_utils.script_requests import ScriptRequests  # noqa: E402
+from streamlit.testing.v1 import AppTest  # noqa: E402
+from streamlit.testing.v1 import app_test as _app_test  # noqa: E402
+from streamlit.testing.v1.local_script_runner import LocalScriptRunner  # noqa: E402
+
+import perf  # noqa: E402
+
+APP = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "app.py")
+TITLES = ["実験① 熱の可視化", "実験② アルカリ型燃料電池の組み立て", "実験③ 水処理装置の設計と提案"]
+FULL = "全体の再実行"
+# セクション単独の再実行のあとに app.py が行う同期処理（sync_after_fragment_run）
+SYNC = "セクション間の同期"
+
+
+class FragmentRunner(LocalScriptRunner):
+    """fragment_ids が設定されている間は、そのフラグメントだけを再実行する ScriptRunner"""
+
+    fragment_ids = None
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        if FragmentRunner.fragment_ids:
+            # 生成時に積まれる全体の再実行の要求と合わさると全体の再実行になるので、要求を空にしておく
+            self._requests = ScriptRequests()
+
+    def request_rerun(self, rerun_data):
+        if FragmentRunner.fragment_ids:
+            rerun_data = dataclasses.replace(rerun_data, fragment_id_queue=list(FragmentRunner.fragment_ids))
+        return super().request_rerun(rerun_data)
+
+
+_app_test.LocalScriptRunner = FragmentRunner
+
+
+def run(at, fragment_id=None):
+    """スクリプト全体（fragment_id を渡したときはそのフラグメントだけ）を1回実行する"""
+    FragmentRunner.fragment_ids = [fragment_id] if fragment_id else None
+    try:
+        at.run()
+    finally:
+        FragmentRunner.fragment_ids = None
+    if at.exception:
+        raise RuntimeError(at.exception)
+
+
+def find_sections(at):
+    """フラグメントID → セクション名（フラグメントを1つずつ再実行し、perf に記録された名前で見分ける）"""
+    sections = {}
+    for fragment_id in list(at._fragment_storage._fragments):
+        run(at)
+        perf.clear()
+        run(at, fragment_id)
+        names = [name for name, _, _ in perf.records() if name not in (FULL, SYNC)]
+        if names:
+            sections[fragment_id] = names[0]
+    return sections
+
+
+def measure(title, runs):
+    at = AppTest.from_file(APP, default_timeout=120)
+    at.session_state["exp_title"] = title
+    at.session_state["exp_title_selector"] = title
+    run(at)  # 初回（フォント登録・グラフ作成など）は計測から外す
+    sections = find_sections(at)
+
+    # 基準: 全体の再実行
+    perf.clear()
+    for _ in range(runs):
+        run(at)
+    full = perf.summary()[FULL]["cpu_ms_mean"]
+
+    # セクション単独の再実行（直前に全体を1回実行して画面を揃えてから、フラグメントだけを計る）
+    results = []
+    for fragment_id, name in sections.items():
+        total = 0.0
+        for _ in range(runs):
+            run(at)
+            perf.clear()
+            run(at, fragment_id)
+            recorded = perf.records()
+            if any(n == FULL for n, _, _ in recorded):
+                raise RuntimeError(f"{name}: セクション単独の再実行のはずが全体が再実行された")
+            total += sum(cpu for _, cpu, _ in recorded)
+        results.append((name, total / runs))
+    return full, results
+
+
+def main():
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+    for title in TITLES:
+        full, results = measure(title, runs)
+        print(f"== {title}  (各 {runs} 回の平均)")
+        print(f"  基準: {FULL:<10} CPU {full:8.1f} ms")
+        print("  セクション単独の再実行（セクション＋同期処理）:")
+        for name, cpu in results:
+            print(f"    {name:<12} CPU {cpu:8.1f} ms  ({cpu / full * 100:5.1f}%)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+"""起動時間のプロファイル（python -X importtime）
+
+実行: python benchmarks/startup_profile.py [実験番号 1～3] [上位件数]
+
+新しいプロセスで app.py を初回実行（AppTest）し、最初の画面ができるまでの時間と、
+その間に読み込まれたモジュールの読み込み時間をパッケージごとに集計して表示する。
+Streamlit Community Cloud でスリープから起動したときの待ち時間の目安になる。
+"""
+import json
+import os
+import re
+import subprocess
+import sys
+from collections import defaultdict
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+APP = os.path.join(ROOT, "app.py")
+TITLES = ["実験① 熱の可視化", "実験② アルカリ型燃料電池の組み立て", "実験③ 水処理装置の設計と提案"]
+
+# 子プロセス: Streamlit の読み込み → app.py の初回実行、の時間を計る
+CHILD = """
+import json, sys, time
+t0 = time.perf_counter()
+from streamlit.testing.v1 import AppTest
+t1 = time.perf_counter()
+at = AppTest.from_file(sys.argv[1], default_timeout=120)
+at.session_state["exp_title"] = at.session_state["exp_title_selector"] = sys.argv[2]
+at.run()
+t2 = time.perf_counter()
+print(json.dumps({"streamlit_ms": (t1 - t0) * 1000, "first_run_ms": (t2 - t1) * 1000, "ok": not at.exception}))
+"""
+
+# 集計して表示するパッケージ（その他は「その他」にまとめる）
+PACKAGES = ["matplotlib", "reportlab", "PIL", "pandas", "numpy", "pyarrow", "altair", "streamlit"]
+
+_LINE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)")
+
+
+def parse_importtime(text):
+    """-X importtime の出力を (モジュール名, self[us], 累積[us]) のリストにする"""
+    out = []
+    for line in text.splitlines():
+        m = _LINE.match(line)
+        if m:
+            out.append((m.group(4), int(m.group(1)), int(m.group(2))))
+    return out
+
+
+def profile(title):
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", CHILD, APP, title],
+        cwd=ROOT, capture_output=True, text=True,
+    )
+    result = json.loads(proc.stdout.strip().splitlines()[-1])
+    return result, parse_importtime(proc.stderr)
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 1
+    top = int(sys.argv[2]) if len(sys.argv) > 2 else 10
+    title = TITLES[n - 1]
+    result, modules = profile(title)
+
+    print(f"起動プロファイル（{title}）")
+    print(f"  Streamlit の読み込み      {result['streamlit_ms']:8.1f} ms")
+    print(f"  app.py の初回実行         {result['first_run_ms']:8.1f} ms{'' if result['ok'] else '（例外あり）'}")
+
+    by_package = defaultdict(int)
+    for name, self_us, _ in modules:
+        root = name.split(".")[0]
+        by_package[root if root in PACKAGES else "その他"] += self_us
+    print("  パッケージ別の読み込み時間（self の合計）")
+    for name in PACKAGES + ["その他"]:
+        if by_package.get(name):
+            print(f"    {name:<12}{by_package[name] / 1000:8.1f} ms")
+    print(f"    {'合計':<12}{sum(by_package.values()) / 1000:8.1f} ms")
+
+    print(f"  読み込みに時間のかかったモジュール（self 上位{top}件）")
+    for name, self_us, _ in sorted(modules, key=lambda m: -m[1])[:top]:
+        print(f"    {name:<40}{self_us / 1000:8.1f} ms")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+"""プロセス内で共有するキャッシュの共通部品
+
+Streamlitの各セッション（各学生）から同時に呼ばれるため、すべてスレッドセーフにしている。
+キーは入力内容のハッシュなので、異なるセッション間で共有しても結果は混ざらない。
+"""
+import hashlib
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+
+def df_content_hash(df):
+    """DataFrameの内容（列名・インデックス・値）からハッシュ値を作る"""
+    h = hashlib.sha256()
+    if df is None:
+        h.update(b"None")
+        return h.hexdigest()
+    if not isinstance(df, pd.DataFrame):
+        df = pd.DataFrame(df)
+    h.update(repr(list(df.columns)).encode("utf-8"))
+    # 行番号だけのインデックス（データロガーの長い表など）は範囲だけを見る
+    index = df.index if isinstance(df.index, pd.RangeIndex) else list(df.index)
+    h.update(repr(index).encode("utf-8"))
+    h.update(repr(list(df.dtypes.astype(str))).encode("utf-8"))
+    for _, col in df.items():
+        if pd.api.types.is_numeric_dtype(col.dtype):
+            # 測定表の数値の列（tables.py）はメモリ上の値をそのままハッシュする
+            h.update(np.ascontiguousarray(col.to_numpy()).tobytes())
+        else:
+            # 文字列の表は数値と "" が混在することがあるため、文字列に揃えてからハッシュする
+            h.update(pd.util.hash_pandas_object(col.astype(str), index=False).values.tobytes())
+    return h.hexdigest()
+
+
+def content_hash(*parts):
+    """DataFrame・bytes・文字列などを組み合わせたキャッシュキーを作る"""
+    h = hashlib.sha256()
+    for p in parts:
+        if isinstance(p, pd.DataFrame):
+            h.update(df_content_hash(p).encode("ascii"))
+        elif isinstance(p, (bytes, bytearray)):
+            h.update(p)
+        else:
+            h.update(repr(p).encode("utf-8"))
+        h.update(b"\x00")
+    return h.hexdigest()
+
+
+# get_or_create の「キャッシュにない」印（None を返す factory の結果もキャッシュするため）
+_MISSING = object()
+
+
+class LRUCache:
+    """上限件数を超えたら最も古く使われたものから捨てるキャッシュ"""
+
+    def __init__(self, maxsize=64):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, default=None):
+        with self._lock:
+            if key in self._data:
+                self._data.move_to_end(key)
+                self.hits += 1
+                return self._data[key]
+            self.misses += 1
+            return default
+
+    def put(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def get_or_create(self, key, factory):
+        """キャッシュにあればそれを返し、なければ factory() の結果を登録して返す"""
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            # 生成中はロックを持たない（重い処理で他セッションを待たせないため）
+            value = factory()
+            self.put(key, value)
+        return value
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._data
+
+    def __len__(self):
+        with self._lock:
+            return len(self._data)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
@@ -0,0 +1,341 @@
+# -*- coding: utf-8 -*-
+"""表の派生列・集計値（入力から自動計算する値）
+
+融解温度の「平均(℃)」、放電実験の「出力(mW)」・発生エネルギーの集計のように、他の列から計算できる値は
+測定表ごとに式（Formula）として宣言する（TABLE_FORMULAS）。画面の入力欄・グラフ・達成率・PDFは
+すべてここで計算した値を読むので、同じ値が表示される。
+
+- 式は列単位（NumPy のベクトル演算）で計算し、行ごとの df.at ループは使わない。
+  表の測定値は float64（空欄は NaN。tables.py）なので、文字列から数値への変換もしない。
+- 式どうしの依存（派生列を読む集計値など）は依存グラフで順序を決める。
+  編集のあとは、変わった列に依存する式だけを計算し直す。
+- 集計値は入力列の内容ハッシュでキャッシュする。
+
+data_editor の on_change コールバック（スクリプト実行前に呼ばれる）で編集内容を表に反映し、
+派生列まで計算しておけば、その回の実行で派生列の表示まで更新される。
+st.rerun() で2回目の実行をする必要はない。
+"""
+import re
+import unicodedata
+from graphlib import TopologicalSorter
+from typing import Callable, NamedTuple
+
+import numpy as np
+import pandas as pd
+
+from caching import LRUCache, content_hash
+
+MELTING_RUN_COLS = ["1回目(℃)", "2回目(℃)", "3回目(℃)"]
+MELTING_AVG_COL = "平均(℃)"
+
+FC_VOLTAGE_COL = "端子電圧(V)"
+FC_CURRENT_COL = "電流(mA)"
+FC_POWER_COL = "出力(mW)"
+FC_TIME_COL = "放電時間(sec)"
+FC_SUMMARY = "放電の集計"
+
+THERMAL_DIST_COL = "距離(cm)"
+THERMAL_TIME_COLS = ["銅(sec)", "アルミ(sec)", "ステンレス(sec)"]
+THERMAL_METALS = ["銅", "アルミ", "ステンレス"]
+# 比の基準にする金属の順（近似できた最初の金属を1とする）
+THERMAL_REFERENCE_ORDER = [2, 1, 0]
+THERMAL_FIT = "融解時間の近似"
+
+_aggregate_cache = LRUCache(maxsize=256)
+
+
+class Formula(NamedTuple):
+    """派生列または集計値1つ分の式
+
+    name: 派生列の列名（集計値なら値の名前）
+    inputs: 式が読む列（派生列を読んでもよい）
+    compute: inputs の列を順に ndarray で受け取り、派生列なら同じ長さの ndarray、集計値なら数値（または数値の組）を返す
+    keep_entered: 式の結果が NaN の行は入力済みの値を残す（手入力もできる派生列）
+    """
+    name: str
+    inputs: tuple
+    compute: Callable
+    keep_entered: bool = False
+
+
+class FormulaEngine:
+    """測定表1つ分の派生列・集計値の式と、その依存グラフ"""
+
+    def __init__(self, columns=(), aggregates=()):
+        self.columns = {f.name: f for f in columns}
+        self.aggregates = {f.name: f for f in aggregates}
+        graph = {f.name: set(f.inputs) for f in (*columns, *aggregates)}
+        # 循環した式は宣言の時点（import 時）に graphlib.CycleError になる
+        self._order = [name for name in TopologicalSorter(graph).static_order() if name in self.columns]
+        self._dependents = {}
+        for name, inputs in graph.items():
+            for col in inputs:
+                self._dependents.setdefault(col, set()).add(name)
+
+    def affected(self, changed):
+        """changed の列から（派生列を経由して）影響を受ける式の名前"""
+        seen = set()
+        stack = list(changed)
+        while stack:
+            for name in self._dependents.get(stack.pop(), ()):
+                if name not in seen:
+                    seen.add(name)
+                    stack.append(name)
+        return seen
+
+    def derive(self, df, changed=None):
+        """派生列を計算した表を返す
+
+        changed: 変わった列の集合。None ならすべての派生列を計算する。
+        派生列そのものが編集された場合も、式で計算できる行は式の値に戻す。
+        """
+        if not isinstance(df, pd.DataFrame):
+            return df
+        if changed is None:
+            targets = set(self.columns)
+        else:
+            targets = (self.affected(changed) | set(changed)) & set(self.columns)
+        out = None
+        for name in self._order:
+            f = self.columns[name]
+            if name not in targets or name not in df.columns or not set(f.inputs) <= set(df.columns):
+                continue
+            if out is None:
+                out = df.copy()
+            values = f.compute(*(out[c].to_numpy(dtype="float64") for c in f.inputs))
+            if f.keep_entered:
+                values = np.where(np.isnan(values), out[name].to_numpy(dtype="float64"), values)
+            out[name] = values
+        return df if out is None else out
+
+    def aggregate(self, df, name):
+        """集計値（入力列の内容が前回と同じならキャッシュを返す）"""
+        f = self.aggregates[name]
+        inputs = df[list(f.inputs)]
+        key = content_hash("aggregate", name, inputs)
+        return _aggregate_cache.get_or_create(
+            key, lambda: f.compute(*(inputs[c].to_numpy(dtype="float64") for c in f.inputs)))
+
+
+# -----------------------
+# 式
+# -----------------------
+def _row_mean(*cols):
+    """行ごとの平均（NaN の回は除く。すべて NaN の行は NaN）"""
+    x = np.column_stack(cols)
+    n = np.count_nonzero(~np.isnan(x), axis=1)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.nansum(x, axis=1) / n
+
+
+# numpy 2.0 より前は trapz という名前
+_trapezoid = getattr(np, "trapezoid", None) or np.trapz
+
+
+class DischargeSummary(NamedTuple):
+    """放電実験1回分の集計（データがなければ NaN）"""
+    energy_j: float     # 発生エネルギー[J]（放電時間と出力の折れ線の下の面積）
+    peak_mw: float      # 最大出力[mW]
+    mean_mw: float      # 平均出力[mW]（時間で重み付けした平均 = エネルギー ÷ 放電時間）
+    duration_s: float   # 放電時間[sec]（最初と最後の測定の間隔）
+
+
+def _discharge_summary(t, p):
+    """放電時間 t[sec] と出力 p[mW] の測定値から DischargeSummary を作る
+
+    - 時間・出力のどちらかが空欄（NaN）の行は測定値として使わない（0 とはみなさない）
+    - 時間の順に並べ替え、同じ時刻の測定が複数あれば出力を平均する
+    データロガーの数十万行の記録でもベクトル演算だけで計算する。
+    """
+    mask = ~(np.isnan(t) | np.isnan(p))
+    t, p = t[mask], p[mask]
+    if not len(t):
+        return DischargeSummary(np.nan, np.nan, np.nan, np.nan)
+    # np.unique で時刻を昇順にそろえ、同じ時刻の出力は平均する
+    times, inverse = np.unique(t, return_inverse=True)
+    if len(times) < len(t):
+        power = np.bincount(inverse, weights=p) / np.bincount(inverse)
+    else:
+        power = p[np.argsort(t, kind="stable")]
+    duration = float(times[-1] - times[0])
+    peak = float(np.max(power))
+    if duration > 0:
+        energy_mj = float(_trapezoid(power, times))
+        mean = energy_mj / duration
+    else:
+        energy_mj = 0.0
+        mean = float(np.mean(power))
+    return DischargeSummary(energy_mj / 1000, peak, mean, duration)
+
+
+class ThermalFit(NamedTuple):
+    """融解時間 t[sec] と距離 x[cm] の近似 t = t0 + k·x²（金属ごとの配列。THERMAL_TIME_COLS の順、近似できなければ NaN）"""
+    slope: np.ndarray       # k[sec/cm²]（小さいほど熱が速く伝わる。熱拡散率に反比例）
+    intercept: np.ndarray   # t0[sec]（加熱を始めてから熱が伝わり始めるまでの遅れ）
+    r2: np.ndarray          # 決定係数 R²
+    points: np.ndarray      # 近似に使った点の数
+
+
+def _thermal_fit(x, *times):
+    """金属ごとに t = t0 + k·x² を最小二乗法で近似する（ThermalFit）
+
+    熱伝導では、熱が距離 x まで伝わる時間は x² に比例する（t ∝ x²/α、α: 熱拡散率）。
+    全金属の列を1つの行列にして、空欄（NaN）の点を除いた和から一度に傾き・切片・R² を計算する。
+    距離が2種類以上ない金属は NaN。
+    """
+    t = np.column_stack(times)
+    u = np.broadcast_to((x ** 2)[:, None], t.shape)
+    w = ~(np.isnan(t) | np.isnan(u))
+    u0 = np.where(w, u, 0.0)
+    t0 = np.where(w, t, 0.0)
+    n = w.sum(axis=0)
+    su, st, suu, sut = u0.sum(axis=0), t0.sum(axis=0), (u0 * u0).sum(axis=0), (u0 * t0).sum(axis=0)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        det = n * suu - su ** 2
+        ok = (n >= 2) & (det > 1e-12 * np.maximum(suu * n, 1))
+        slope = np.where(ok, (n * sut - su * st) / det, np.nan)
+        intercept = np.where(ok, (st - slope * su) / n, np.nan)
+        ss_res = (np.where(w, t - intercept - slope * u, 0.0) ** 2).sum(axis=0)
+        ss_tot = (np.where(w, t - st / n, 0.0) ** 2).sum(axis=0)
+        r2 = np.where(ok & (ss_tot > 0), 1 - ss_res / ss_tot, np.nan)
+    return ThermalFit(slope, intercept, r2, n)
+
+
+MELTING_POINT_FORMULAS = FormulaEngine(columns=[
+    # 数値が入っている回だけで平均し、小数1桁に丸める
+    Formula(MELTING_AVG_COL, tuple(MELTING_RUN_COLS), lambda *runs: np.round(_row_mean(*runs), 1)),
+])
+
+FC_DISCHARGE_FORMULAS = FormulaEngine(
+    columns=[
+        # 出力[mW] = 端子電圧[V] × 電流[mA]（電圧・電流のどちらかが空欄の行は入力済みの値を残す）
+        Formula(FC_POWER_COL, (FC_VOLTAGE_COL, FC_CURRENT_COL), lambda v, a: np.round(v * a, 2), keep_entered=True),
+    ],
+    aggregates=[
+        # 発生エネルギー・最大出力・平均出力・放電時間
+        Formula(FC_SUMMARY, (FC_TIME_COL, FC_POWER_COL), _discharge_summary),
+    ],
+)
+
+THERMAL_RESULT_FORMULAS = FormulaEngine(aggregates=[
+    # 金属ごとの t = t0 + k·x² の近似
+    Formula(THERMAL_FIT, (THERMAL_DIST_COL, *THERMAL_TIME_COLS), _thermal_fit),
+])
+
+# セッションステートのキー → 表の式（派生列・集計値のない表は載せない）
+TABLE_FORMULAS = {
+    "melting_point_df": MELTING_POINT_FORMULAS,
+    "result_df": THERMAL_RESULT_FORMULAS,
+    "fc_discharge_1": FC_DISCHARGE_FORMULAS,
+    "fc_discharge_2": FC_DISCHARGE_FORMULAS,
+    "fc_discharge_3": FC_DISCHARGE_FORMULAS,
+}
+
+
+def derive_table(key, df, changed=None):
+    """測定表の派生列を計算した表（式のない表はそのまま返す）"""
+    engine = TABLE_FORMULAS.get(key)
+    return engine.derive(df, changed) if engine else df
+
+
+def discharge_summary(df):
+    """放電実験1回分の集計（DischargeSummary。表の内容が同じならキャッシュを返す）"""
+    return FC_DISCHARGE_FORMULAS.aggregate(df, FC_SUMMARY)
+
+
+# 発生エネルギーのまとめ表の行（見出し, DischargeSummary の項目, 書式）
+DISCHARGE_SUMMARY_ROWS = [
+    ("発生エネルギー(J)", "energy_j", "{:.2f}"),
+    ("最大出力(mW)", "peak_mw", "{:.2f}"),
+    ("平均出力(mW)", "mean_mw", "{:.2f}"),
+    ("放電時間(sec)", "duration_s", "{:g}"),
+]
+
+
+def discharge_summary_rows(discharge_dfs):
+    """発生エネルギーのまとめ表（1行が1項目、列は1～3回目）の文字列
+
+    画面のまとめ表とPDFの表は同じこの値を使う。データがない回・計算できない回は "-"。
+    """
+    summaries = []
+    for df in discharge_dfs:
+        try:
+            summaries.append(discharge_summary(df))
+        except (KeyError, ValueError):
+            summaries.append(None)
+    rows = []
+    for label, field, fmt in DISCHARGE_SUMMARY_ROWS:
+        cells = []
+        for summary in summaries:
+            value = getattr(summary, field) if summary else np.nan
+            cells.append("-" if np.isnan(value) else fmt.format(value))
+        rows.append([label] + cells)
+    return rows
+
+
+def thermal_fit(df):
+    """融解時間の表の近似（ThermalFit。表の内容が同じならキャッシュを返す）"""
+    return THERMAL_RESULT_FORMULAS.aggregate(df, THERMAL_FIT)
+
+
+def _number_in_text(text):
+    """文献値の入力欄（"約398" "237 W/m/K" など）の最初の数値。なければ NaN"""
+    match = re.search(r"\d+(?:\.\d+)?", unicodedata.normalize("NFKC", str(text or "")).replace(",", ""))
+    return float(match.group()) if match else np.nan
+
+
+def thermal_fit_rows(df, literature):
+    """融解時間の近似のまとめ表（1行が1項目、列は銅・アルミ・ステンレス）の文字列
+
+    literature: 銅・アルミ・ステンレスの熱伝導率の文献値（入力欄の文字列）
+    熱の伝わりやすさ（熱拡散率 ∝ 1/k）と熱伝導率は、どちらも同じ基準の金属を1とした比で並べる。
+    基準はステンレス、ステンレスが近似できなければアルミ、銅の順に、近似できた最初の金属
+    （見出しに基準の金属名を出す）。画面のまとめ表とPDFの表は同じこの値を使う。計算できない値は "-"。
+    """
+    try:
+        fit = thermal_fit(df)
+    except (KeyError, ValueError):
+        fit = None
+    nan = np.full(len(THERMAL_TIME_COLS), np.nan)
+    slope = fit.slope if fit else nan
+    with np.errstate(invalid="ignore", divide="ignore"):
+        # 傾きが正でない（時間が距離とともに増えない）金属は比を出さない
+        diffusivity = np.where(slope > 0, 1 / slope, np.nan)
+        conductivity = np.array([_number_in_text(v) for v in literature])
+        ref = next((i for i in THERMAL_REFERENCE_ORDER if np.isfinite(diffusivity[i])), THERMAL_REFERENCE_ORDER[0])
+        values = [
+            ("傾き k (sec/cm²)", slope, "{:.3g}"),
+            ("切片 t0 (sec)", fit.intercept if fit else nan, "{:.1f}"),
+            ("決定係数 R²", fit.r2 if fit else nan, "{:.3f}"),
+            ("近似に使った点の数", fit.points if fit else nan, "{:.0f}"),
+            (f"熱の伝わりやすさの比（1/k、{THERMAL_METALS[ref]}=1）", diffusivity / diffusivity[ref], "{:.2f}"),
+            (f"熱伝導率の比（文献値、{THERMAL_METALS[ref]}=1）", conductivity / conductivity[ref], "{:.2f}"),
+        ]
+    rows = []
+    for label, array, fmt in values:
+        rows.append([label] + ["-" if not np.isfinite(v) else fmt.format(v) for v in np.asarray(array, dtype="float64")])
+    return rows
+
+
+# -----------------------
+# data_editor の編集
+# -----------------------
+def edited_columns(editor_state):
+    """data_editor のウィジェット状態（edited_rows）で編集された列の集合"""
+    return {col for changes in (editor_state or {}).get("edited_rows", {}).values() for col in changes}
+
+
+def apply_editor_edits(df, editor_state):
+    """data_editor のウィジェット状態（edited_rows）を表に反映した新しい表を返す
+
+    行数固定の表（num_rows="fixed"）用。edited_rows は「行位置 → 列名 → 値」。
+    消したセル（None）は、数値の列なら NaN、文字列の列なら空文字にする。
+    """
+    out = df.copy()
+    for row, changes in (editor_state or {}).get("edited_rows", {}).items():
+        for col, value in changes.items():
+            if col in out.columns:
+                if value is None:
+                    value = np.nan if pd.api.types.is_float_dtype(out[col]) else ""
+                out.iat[int(row), out.columns.get_loc(col)] = value
+    return out
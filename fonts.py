@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+"""日本語フォント（IPAexゴシック）の登録をプロセスごとに1回だけ行う
+
+Streamlitはウィジェット操作のたびに app.py 全体を再実行するが、
+インポートされたモジュールは再実行されないため、ここに置いた状態は
+プロセス内（全セッション共通）で保持される。
+ReportLab 用（PDF）と Matplotlib 用（画面のグラフ）は、それぞれ最初に使うときに登録する。
+"""
+import logging
+import os
+import threading
+import time
+
+FONT_NAME = "IPAexGothic"
+FONT_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "ipaexg.ttf")
+
+logger = logging.getLogger(__name__)
+
+_lock = threading.Lock()
+_report = None
+_loaded = set()
+
+
+def _register(part, font_path):
+    """part（"reportlab" / "matplotlib"）にフォントを登録し、所要時間を _report に記録する"""
+    global _report
+    if part in _loaded:
+        return _report
+    with _lock:
+        # 複数セッションが同時に初回実行した場合もフォント解析は1回だけ
+        if part in _loaded:
+            return _report
+        timings = dict(_report["timings"]) if _report else {}
+
+        if part == "reportlab":
+            # === PDF 用 日本語フォント ===
+            t0 = time.perf_counter()
+            from reportlab.pdfbase import pdfmetrics
+            from reportlab.pdfbase.ttfonts import TTFont
+            if FONT_NAME not in pdfmetrics.getRegisteredFontNames():
+                pdfmetrics.registerFont(TTFont(FONT_NAME, font_path))
+            timings["reportlab_ms"] = (time.perf_counter() - t0) * 1000
+        else:
+            # === Matplotlib 用 日本語フォント ===
+            t0 = time.perf_counter()
+            from matplotlib import font_manager, rcParams
+            font_manager.fontManager.addfont(font_path)
+            rcParams["font.family"] = FONT_NAME
+            timings["matplotlib_ms"] = (time.perf_counter() - t0) * 1000
+
+            # フォント検索結果のキャッシュを事前に作っておく（初回描画時の検索を省く）
+            t0 = time.perf_counter()
+            font_manager.findfont(font_manager.FontProperties(family=FONT_NAME), fallback_to_default=False)
+            timings["matplotlib_cache_ms"] = (time.perf_counter() - t0) * 1000
+
+        timings["total_ms"] = sum(v for k, v in timings.items() if k != "total_ms")
+        _report = {
+            "font_name": FONT_NAME,
+            "font_path": font_path,
+            "pid": os.getpid(),
+            "loaded_at": time.strftime('%Y-%m-%d %H:%M:%S'),
+            "timings": timings,
+        }
+        _loaded.add(part)
+        logger.info("フォント初期化: %s", format_font_report(_report))
+        return _report
+
+
+def ensure_pdf_fonts(font_path=FONT_FILE):
+    """ReportLab に日本語フォントを登録する（PDFを作るときに呼ぶ。2回目以降は何もしない）"""
+    return _register("reportlab", font_path)
+
+
+def ensure_graph_fonts(font_path=FONT_FILE):
+    """Matplotlib に日本語フォントを登録する（グラフを描くときに呼ぶ。2回目以降は何もしない）"""
+    return _register("matplotlib", font_path)
+
+
+def ensure_fonts(font_path=FONT_FILE):
+    """ReportLab と Matplotlib の両方に日本語フォントを登録する（2回目以降は何もしない）
+
+    戻り値は起動時の計測結果（各段階の所要時間[ms]）を持つ辞書。
+    画面の起動を速くするため、app.py では呼ばずに、PDF・グラフを最初に作るときに
+    ensure_pdf_fonts / ensure_graph_fonts でそれぞれ登録する。
+    """
+    ensure_pdf_fonts(font_path)
+    return ensure_graph_fonts(font_path)
+
+
+def format_font_report(report=None):
+    """起動時のフォント初期化の計測結果を1行の文字列にする"""
+    report = report or _report
+    if not report:
+        return "フォント未初期化"
+    t = report["timings"]
+    parts = []
+    if "reportlab_ms" in t:
+        parts.append(f"ReportLab {t['reportlab_ms']:.1f}ms")
+    if "matplotlib_ms" in t:
+        parts.append(f"Matplotlib {t['matplotlib_ms']:.1f}ms")
+        parts.append(f"キャッシュ構築 {t['matplotlib_cache_ms']:.1f}ms")
+    parts.append(f"合計 {t['total_ms']:.1f}ms")
+    return f"{report['font_name']} (pid={report['pid']}, {report['loaded_at']}) " + " / ".join(parts)
@@ -0,0 +1,251 @@
+# -*- coding: utf-8 -*-
+"""結果グラフの作成（画面表示用）
+
+画面の「結果グラフ」は、既定ではブラウザで描くグラフ（Vega-Lite）で表示し、
+「画像（PNG）で表示」のときだけ Matplotlib で描いたPNG（st.image）を使う。
+PDFには同じグラフを pdf_charts.py のベクター図形で載せる（グラフの系列・色・ラベルを変えるときはすべて合わせること）。
+PNGは入力DataFrameの内容ハッシュをキーにしてキャッシュする。
+測定表は数値の型（空欄は NaN。tables.py）なので、列はそのまま数値として使う。
+Figure は pyplot に登録しない（Agg の Figure を直接使う）ので、ラスタライズ後は参照がなくなれば解放される。
+"""
+from io import BytesIO
+
+import pandas as pd
+
+from caching import LRUCache, content_hash
+from fonts import ensure_graph_fonts
+
+GRAPH_DPI = 150
+GRAPH_FIGSIZE = (6, 4)
+
+_png_cache = LRUCache(maxsize=128)
+
+
+def _new_figure():
+    """Agg キャンバスの Figure と Axes を作る
+
+    pyplot（Figureの管理）は使わない。Figure はどこにも登録されないので plt.close は不要で、
+    セッションごとのスレッドから同時に描画してもよい。
+    Matplotlib は重いので、画面の起動時ではなく最初にグラフを描くときに読み込む。
+    """
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.figure import Figure
+
+    fig = Figure(figsize=GRAPH_FIGSIZE)
+    FigureCanvasAgg(fig)
+    return fig, fig.add_subplot()
+
+
+# -----------------------
+# グラフ作成関数
+# -----------------------
+def create_graph(df):
+    """実験①: パイプ端からの距離とロウの融解時間"""
+    fig, ax = _new_figure()
+
+    # X軸
+    x = df["距離(cm)"]
+
+    # プロット
+    legend_labels = []
+    for col, label, color in zip(
+        ["銅(sec)", "アルミ(sec)", "ステンレス(sec)"],
+        ["銅", "アルミ", "ステンレス"],
+        ["#ff7f0e", "#1f77b4", "#7f7f7f"] # 簡易的な色指定(matplotlib default準拠)
+    ):
+        y = df[col]
+        # xとyの両方が数値の行だけを使う
+        valid_indices = ~y.isna() & ~x.isna()
+        if valid_indices.any():
+            ax.plot(x[valid_indices], y[valid_indices], marker="o", label=label, color=color)
+            legend_labels.append(label)
+    ax.set_xlabel("パイプ端からの距離(cm)")
+    ax.set_ylabel("融解時間 (sec)")
+    ax.grid(True)
+    if legend_labels:
+        ax.legend()
+    return fig
+
+
+def create_fuel_cell_graph(discharge_dfs):
+    """実験②: 放電時間と出力（1～3回目）"""
+    fig, ax = _new_figure()
+
+    # 3回分のデータをプロット
+    colors = ["#ff7f0e", "#1f77b4", "#2ca02c"]
+    labels = ["1回目", "2回目", "3回目"]
+
+    has_plot = False
+    for i, df in enumerate(discharge_dfs):
+        try:
+            # 時間(sec) vs 出力(mW)
+            t = df["放電時間(sec)"]
+            p = df["出力(mW)"]
+
+            mask = ~t.isna() & ~p.isna()
+            if mask.any():
+                ax.plot(t[mask], p[mask], marker="o", label=labels[i], color=colors[i])
+                has_plot = True
+        except Exception:
+            pass
+
+    ax.set_xlabel("放電時間 (sec)")
+    ax.set_ylabel("出力 (mW)") # ≒ エネルギー的な指標として出力を使用
+    ax.grid(True)
+    if has_plot:
+        ax.legend()
+    return fig
+
+
+def create_water_treatment_graph(df):
+    """実験③: 浄化の各段階の清澄度"""
+    fig, ax = _new_figure()
+
+    stages = ["浄化対象の水", "試作検討①", "試作検討②"]
+    values = []
+
+    for s in stages:
+        if s in df.columns:
+            val = df[s].iloc[0]
+            values.append(val if not pd.isna(val) else 0)
+        else:
+            values.append(0)
+
+    bars = ax.bar(stages, values, color=["#d62728", "#1f77b4", "#2ca02c"])
+
+    ax.set_ylabel("清澄度[点]/1000点（水道水）")
+    ax.set_ylim(0, 1100)
+    ax.grid(True, axis='y', linestyle='--', alpha=0.7)
+
+    for bar in bars:
+        height = bar.get_height()
+        ax.text(bar.get_x() + bar.get_width()/2., height + 5,
+                f'{int(height)}', ha='center', va='bottom')
+
+    return fig
+
+
+# -----------------------
+# PNGキャッシュ
+# -----------------------
+def _render_png(builder, *args):
+    ensure_graph_fonts()
+    fig = builder(*args)
+    buf = BytesIO()
+    fig.savefig(buf, format="png", dpi=GRAPH_DPI)
+    return buf.getvalue()
+
+
+def thermal_graph_png(result_df):
+    """実験①のグラフPNG（result_df の内容が同じならキャッシュを返す）"""
+    key = content_hash("thermal", GRAPH_DPI, result_df)
+    return _png_cache.get_or_create(key, lambda: _render_png(create_graph, result_df))
+
+
+def fuel_cell_graph_png(discharge_dfs):
+    """実験②のグラフPNG（fc_discharge_1..3 の内容が同じならキャッシュを返す）"""
+    discharge_dfs = list(discharge_dfs)
+    key = content_hash("fuel_cell", GRAPH_DPI, *discharge_dfs)
+    return _png_cache.get_or_create(key, lambda: _render_png(create_fuel_cell_graph, discharge_dfs))
+
+
+def water_treatment_graph_png(clarity_df):
+    """実験③のグラフPNG（wt_clarity_df の内容が同じならキャッシュを返す）"""
+    key = content_hash("water_treatment", GRAPH_DPI, clarity_df)
+    return _png_cache.get_or_create(key, lambda: _render_png(create_water_treatment_graph, clarity_df))
+
+
+# -----------------------
+# ブラウザで描くグラフ（Vega-Lite）
+# -----------------------
+# 描画はブラウザで行い、サーバーからは数値データ（数十行）だけを送る。
+# 値にマウスを重ねると数値が表示される（ツールチップ）。
+THERMAL_SERIES = [("銅(sec)", "銅", "#ff7f0e"), ("アルミ(sec)", "アルミ", "#1f77b4"), ("ステンレス(sec)", "ステンレス", "#7f7f7f")]
+FUEL_CELL_SERIES = [("1回目", "#ff7f0e"), ("2回目", "#1f77b4"), ("3回目", "#2ca02c")]
+WATER_STAGES = [("浄化対象の水", "#d62728"), ("試作検討①", "#1f77b4"), ("試作検討②", "#2ca02c")]
+CHART_HEIGHT = 360
+
+
+def thermal_chart_data(df):
+    """実験①のグラフ用データ（距離・金属・融解時間の縦長の表。数値でない行は除く）"""
+    x = df["距離(cm)"]
+    parts = []
+    for col, label, _ in THERMAL_SERIES:
+        parts.append(pd.DataFrame({"距離(cm)": x, "金属": label, "融解時間(sec)": df[col]}))
+    return pd.concat(parts, ignore_index=True).dropna()
+
+
+def fuel_cell_chart_data(discharge_dfs):
+    """実験②のグラフ用データ（回・放電時間・出力の縦長の表。数値でない行は除く）"""
+    parts = []
+    for (label, _), df in zip(FUEL_CELL_SERIES, discharge_dfs):
+        try:
+            parts.append(pd.DataFrame({
+                "回": label,
+                "放電時間(sec)": df["放電時間(sec)"],
+                "出力(mW)": df["出力(mW)"],
+            }))
+        except (KeyError, TypeError):
+            pass
+    if not parts:
+        return pd.DataFrame(columns=["回", "放電時間(sec)", "出力(mW)"])
+    return pd.concat(parts, ignore_index=True).dropna()
+
+
+def water_treatment_chart_data(df):
+    """実験③のグラフ用データ（段階・清澄度。未入力は0点）"""
+    values = []
+    for stage, _ in WATER_STAGES:
+        v = df[stage].iloc[0] if stage in df.columns else None
+        values.append(0 if v is None or pd.isna(v) else v)
+    return pd.DataFrame({"段階": [s for s, _ in WATER_STAGES], "清澄度[点]": values})
+
+
+def _line_spec(x, y, series, colors, x_title, y_title):
+    labels = [label for label, _ in colors]
+    return {
+        "height": CHART_HEIGHT,
+        "mark": {"type": "line", "point": True},
+        "encoding": {
+            "x": {"field": x, "type": "quantitative", "title": x_title},
+            "y": {"field": y, "type": "quantitative", "title": y_title},
+            "color": {
+                "field": series, "type": "nominal", "title": None, "sort": labels,
+                "scale": {"domain": labels, "range": [c for _, c in colors]},
+            },
+            "tooltip": [
+                {"field": series, "type": "nominal"},
+                {"field": x, "type": "quantitative"},
+                {"field": y, "type": "quantitative"},
+            ],
+        },
+    }
+
+
+# Vega-Lite の仕様（データ以外）は実験ごとに固定。Altair で組み立てると再実行のたびに
+# スキーマ検証が走るので、辞書のまま st.vega_lite_chart に渡す
+THERMAL_SPEC = _line_spec(
+    "距離(cm)", "融解時間(sec)", "金属", [(label, color) for _, label, color in THERMAL_SERIES],
+    "パイプ端からの距離(cm)", "融解時間 (sec)",
+)
+FUEL_CELL_SPEC = _line_spec("放電時間(sec)", "出力(mW)", "回", FUEL_CELL_SERIES, "放電時間 (sec)", "出力 (mW)")
+WATER_TREATMENT_SPEC = {
+    "height": CHART_HEIGHT,
+    "encoding": {
+        "x": {"field": "段階", "type": "nominal", "title": None, "sort": [s for s, _ in WATER_STAGES], "axis": {"labelAngle": 0}},
+        "y": {"field": "清澄度[点]", "type": "quantitative", "title": "清澄度[点]/1000点（水道水）", "scale": {"domain": [0, 1100]}},
+    },
+    "layer": [
+        {
+            "mark": "bar",
+            "encoding": {
+                "color": {
+                    "field": "段階", "type": "nominal", "legend": None,
+                    "scale": {"domain": [s for s, _ in WATER_STAGES], "range": [c for _, c in WATER_STAGES]},
+                },
+                "tooltip": [{"field": "段階", "type": "nominal"}, {"field": "清澄度[点]", "type": "quantitative"}],
+            },
+        },
+        {"mark": {"type": "text", "dy": -6}, "encoding": {"text": {"field": "清澄度[点]", "type": "quantitative", "format": "d"}}},
+    ],
+}
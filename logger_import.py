@@ -0,0 +1,302 @@
+# -*- coding: utf-8 -*-
+"""データロガーのCSVの取り込み（放電実験・融解時間の表）
+
+ロガーが書き出すCSV（数千～数十万行）を、放電実験（fc_discharge_1..3）・融解時間（result_df）の表に取り込む。
+
+- CSVは IMPORT_CHUNK_ROWS 行ずつ読み（pandas の chunksize）、ファイル全体を文字列で持たない。
+  文字コードは UTF-8（BOM付きも可）と Shift_JIS（cp932）に対応する。
+- 列は見出しの名前で対応付け（IMPORT_TABLES の aliases）、見出しの単位を表の単位に換算する
+  （分→sec、A→mA など）。見出しより前の説明行は読み飛ばす。
+- 全点の記録は列ごとの float64 配列を圧縮した npz のバイト列にして、写真と同じストア（photos.PhotoStore）に
+  "sha256:..." 参照で置く。保存ファイル・共有データ・自動保存には写真と同じ仕組みで入る。
+- 表（入力欄・グラフ・PDF）には、区間ごとの最小・最大の行だけを残して DECIMATE_ROWS 行程度に
+  間引いたものを入れる。発生エネルギーなど全点を使う計算は full_table() で全点の表を読む。
+"""
+import codecs
+import csv
+import io
+import re
+import unicodedata
+from typing import NamedTuple
+
+import numpy as np
+import pandas as pd
+
+from caching import LRUCache
+from derived import derive_table
+from tables import TABLE_SCHEMAS
+
+IMPORT_CHUNK_ROWS = 20_000
+DECIMATE_ROWS = 200
+HEADER_SEARCH_LINES = 50
+
+# 表のキー → 全点の記録の参照を置くセッションステートのキー
+LOG_KEYS = {
+    "fc_discharge_1": "fc_discharge_1_log",
+    "fc_discharge_2": "fc_discharge_2_log",
+    "fc_discharge_3": "fc_discharge_3_log",
+    "result_df": "result_df_log",
+}
+
+_log_cache = LRUCache(maxsize=16)
+
+
+class LoggerImportError(Exception):
+    """取り込めないCSV（対応する列がない・単位を換算できないなど）"""
+
+
+class Field(NamedTuple):
+    """取り込む列（見出しの名前の候補と、単位 → 表の単位への倍率）"""
+    column: str
+    aliases: tuple
+    units: dict
+
+
+class ImportSpec(NamedTuple):
+    """表ごとの取り込み方
+
+    x: 並べ替え・間引きの基準の列
+    peaks: 間引きで最小・最大を残す列
+    required: どれか1組がそろっていれば取り込める列の組
+    """
+    fields: list
+    x: str
+    peaks: tuple
+    required: tuple
+
+
+_TIME_UNITS = {"s": 1, "sec": 1, "秒": 1, "ms": 0.001, "min": 60, "分": 60, "h": 3600}
+_DISCHARGE = ImportSpec(
+    fields=[
+        Field("放電時間(sec)", ("放電時間", "経過時間", "時間", "時刻", "time", "elapsed", "t"), _TIME_UNITS),
+        Field("端子電圧(V)", ("端子電圧", "電圧", "voltage", "volt", "v"), {"v": 1, "mv": 0.001}),
+        Field("電流(mA)", ("電流", "current", "i"), {"ma": 1, "a": 1000, "ua": 0.001, "μa": 0.001}),
+        Field("出力(mW)", ("出力", "電力", "power", "p"), {"mw": 1, "w": 1000}),
+    ],
+    x="放電時間(sec)",
+    peaks=("出力(mW)",),
+    required=(("放電時間(sec)", "出力(mW)"), ("放電時間(sec)", "端子電圧(V)", "電流(mA)")),
+)
+_THERMAL = ImportSpec(
+    fields=[
+        Field("距離(cm)", ("距離", "位置", "distance", "position", "x"), {"cm": 1, "mm": 0.1, "m": 100}),
+        Field("銅(sec)", ("銅", "cu", "copper"), _TIME_UNITS),
+        Field("アルミ(sec)", ("アルミ", "アルミニウム", "al", "aluminum", "aluminium"), _TIME_UNITS),
+        Field("ステンレス(sec)", ("ステンレス", "sus", "sus304", "stainless"), _TIME_UNITS),
+    ],
+    x="距離(cm)",
+    peaks=("銅(sec)", "アルミ(sec)", "ステンレス(sec)"),
+    required=(("距離(cm)", "銅(sec)"), ("距離(cm)", "アルミ(sec)"), ("距離(cm)", "ステンレス(sec)")),
+)
+
+# 取り込みできる表
+IMPORT_TABLES = {
+    "fc_discharge_1": _DISCHARGE,
+    "fc_discharge_2": _DISCHARGE,
+    "fc_discharge_3": _DISCHARGE,
+    "result_df": _THERMAL,
+}
+
+
+class LoggerImport(NamedTuple):
+    """取り込みの結果"""
+    table: pd.DataFrame   # 間引いた表（セッションステートの表に入れる）
+    log: bytes            # 全点の記録（npz）
+    rows: int             # 取り込んだ行数
+    mapping: list         # (CSVの見出し, 表の列, 倍率)
+
+    def summary(self):
+        cols = "、".join(f"{header}→{col}" + ("" if factor == 1 else f"（×{factor:g}）") for header, col, factor in self.mapping)
+        return f"{self.rows:,}行を取り込みました（表示は{len(self.table)}行に間引き）。列: {cols}"
+
+
+# -----------------------
+# 見出しの対応付け
+# -----------------------
+_UNIT_RE = re.compile(r"^(.*?)\s*[\(\[]\s*([^\)\]]*?)\s*[\)\]]\s*$")
+
+
+def _split_header(header):
+    """見出しを（名前, 単位）に分ける。例: "電流 [A]" → ("電流", "a")、"time_s" → ("time", "s")"""
+    text = unicodedata.normalize("NFKC", str(header)).strip().lower()
+    m = _UNIT_RE.match(text)
+    if m:
+        return m.group(1).replace(" ", ""), m.group(2).replace(" ", "")
+    parts = re.split(r"[_\s]+", text)
+    if len(parts) > 1:
+        return "".join(parts[:-1]), parts[-1]
+    return text, ""
+
+
+def _map_header(header, spec):
+    """見出し1つを表の列に対応付ける（対応しなければ None）。戻り値は (列, 倍率)"""
+    name, unit = _split_header(header)
+    for field in spec.fields:
+        if name + unit in field.aliases:
+            # 単位のない見出し（"SUS 304" のように後ろが単位でないものも含む）は表の単位のまま
+            return field.column, 1
+        if name in field.aliases:
+            if unit not in field.units:
+                raise LoggerImportError(f"列「{header}」の単位 {unit} は {field.column} に換算できません")
+            return field.column, field.units[unit]
+    return None
+
+
+def _map_columns(headers, spec):
+    """見出しの行を対応付ける。戻り値は {CSVの列番号: (列, 倍率)}（同じ列に対応する見出しは最初のものだけ）"""
+    mapping = {}
+    for i, header in enumerate(headers):
+        mapped = _map_header(header, spec)
+        if mapped and mapped[0] not in {col for col, _ in mapping.values()}:
+            mapping[i] = mapped
+    return mapping
+
+
+def _is_complete(mapping, spec):
+    cols = {col for col, _ in mapping.values()}
+    return any(set(group) <= cols for group in spec.required)
+
+
+# -----------------------
+# 読み込み
+# -----------------------
+def _text_stream(fileobj):
+    """バイナリのCSVを文字列のストリームにする（UTF-8 で読めなければ cp932）"""
+    head = fileobj.read(65536)
+    fileobj.seek(0)
+    for encoding in ("utf-8-sig", "cp932"):
+        try:
+            codecs.getincrementaldecoder(encoding)().decode(head, final=False)
+            break
+        except UnicodeDecodeError:
+            continue
+    else:
+        raise LoggerImportError("文字コードを判別できません（UTF-8 または Shift_JIS のCSVにしてください）")
+    return io.TextIOWrapper(fileobj, encoding=encoding, newline="")
+
+
+def _find_header(text, spec):
+    """見出しの行を探す（説明行は読み飛ばす）。戻り値は (見出しのリスト, 区切り文字, 対応付け)"""
+    for _ in range(HEADER_SEARCH_LINES):
+        line = text.readline()
+        if not line:
+            break
+        if not line.strip():
+            continue
+        try:
+            delimiter = csv.Sniffer().sniff(line, delimiters=",\t;").delimiter
+        except csv.Error:
+            delimiter = ","
+        headers = next(csv.reader([line], delimiter=delimiter))
+        mapping = _map_columns(headers, spec)
+        if _is_complete(mapping, spec):
+            return headers, delimiter, mapping
+    raise LoggerImportError("CSVに取り込める列の見出しが見つかりません（" + "・".join(f.column for f in spec.fields) + "）")
+
+
+def read_logger_csv(fileobj, key):
+    """ロガーのCSVを読み、表の列（単位換算済み）ごとの float64 配列の辞書と対応付けを返す
+
+    IMPORT_CHUNK_ROWS 行ずつ読み、各チャンクは必要な列だけを数値にして配列に足していく。
+    数値でないセルは NaN、基準の列（時間・距離）が空の行は捨てる。
+    """
+    spec = IMPORT_TABLES[key]
+    text = _text_stream(fileobj)
+    try:
+        headers, delimiter, mapping = _find_header(text, spec)
+        usecols = sorted(mapping)
+        parts = {col: [] for col, _ in mapping.values()}
+        try:
+            reader = pd.read_csv(
+                text, sep=delimiter, header=None, usecols=usecols,
+                chunksize=IMPORT_CHUNK_ROWS, skip_blank_lines=True, on_bad_lines="skip",
+            )
+            for chunk in reader:
+                for i in usecols:
+                    col, factor = mapping[i]
+                    parts[col].append(pd.to_numeric(chunk[i], errors="coerce").to_numpy("float64") * factor)
+        except pd.errors.EmptyDataError:
+            pass  # 見出しのあとに行がない（下で「数値の行がありません」にする）
+    finally:
+        text.detach()
+    arrays = {col: np.concatenate(chunks) if chunks else np.empty(0) for col, chunks in parts.items()}
+    keep = ~np.isnan(arrays[spec.x])
+    arrays = {col: values[keep] for col, values in arrays.items()}
+    return arrays, [(headers[i], *mapping[i]) for i in usecols]
+
+
+# -----------------------
+# 全点の表・間引き
+# -----------------------
+def build_full_table(key, arrays):
+    """取り込んだ配列から、表の型（tables.py）と派生列（derived.py）をそろえた全点の表を作る（基準の列の順）"""
+    spec = IMPORT_TABLES[key]
+    n = len(arrays[spec.x])
+    order = np.argsort(arrays[spec.x], kind="stable")
+    df = pd.DataFrame({col: np.asarray(arrays[col], dtype="float64")[order] if col in arrays else np.full(n, np.nan)
+                       for col in TABLE_SCHEMAS[key].columns})
+    if "放電時間(分)" in df.columns:
+        df["放電時間(分)"] = df["放電時間(sec)"] / 60
+    return derive_table(key, df)
+
+
+def minmax_decimate(df, peaks, max_rows=DECIMATE_ROWS):
+    """区間ごとに peaks の列が最小・最大になる行だけを残す（行の順は保つ）
+
+    行を同じ行数の区間に分け、各区間で各列の最小・最大の行（と最初・最後の行）を残すので、
+    折れ線の山・谷は間引いても消えない。max_rows 行以下の表はそのまま返す。
+    """
+    n = len(df)
+    if n <= max_rows:
+        return df.reset_index(drop=True)
+    buckets = max(1, max_rows // (2 * len(peaks)))
+    size = -(-n // buckets)
+    base = np.arange(buckets) * size
+    keep = np.zeros(n, dtype=bool)
+    keep[[0, -1]] = True
+    for col in peaks:
+        values = df[col].to_numpy(dtype="float64")
+        padded = np.concatenate([values, np.full(size * buckets - n, np.nan)]).reshape(buckets, size)
+        missing = np.isnan(padded)
+        idx = np.concatenate([
+            np.where(missing, np.inf, padded).argmin(axis=1) + base,
+            np.where(missing, -np.inf, padded).argmax(axis=1) + base,
+        ])
+        idx = idx[idx < n]
+        keep[idx[~np.isnan(values[idx])]] = True
+    return df[keep].reset_index(drop=True)
+
+
+def encode_log(df):
+    """全点の表を npz（列名と float64 の2次元配列、圧縮）のバイト列にする"""
+    buf = io.BytesIO()
+    np.savez_compressed(buf, columns=np.array(df.columns, dtype=str), data=df.to_numpy(dtype="float64"))
+    return buf.getvalue()
+
+
+def decode_log(data):
+    with np.load(io.BytesIO(data), allow_pickle=False) as npz:
+        return pd.DataFrame(npz["data"], columns=npz["columns"].tolist())
+
+
+def import_logger_csv(fileobj, key):
+    """ロガーのCSVを表 key に取り込む（LoggerImport を返す）"""
+    arrays, mapping = read_logger_csv(fileobj, key)
+    if not len(arrays[IMPORT_TABLES[key].x]):
+        raise LoggerImportError("CSVに数値の行がありません")
+    full = build_full_table(key, arrays)
+    table = minmax_decimate(full, IMPORT_TABLES[key].peaks)
+    return LoggerImport(table, encode_log(full), len(full), mapping)
+
+
+def full_table(state, key, store):
+    """表 key の全点の表（ロガーから取り込んだ記録があればそれ、なければ表そのもの）
+
+    state: 入力状態（st.session_state または report_pdf.ReportState）
+    store: 参照 → バイト列を get() で引けるもの（PhotoStore または辞書）
+    """
+    ref = state.get(LOG_KEYS.get(key)) if key in LOG_KEYS else None
+    data = store.get(ref) if ref else None
+    if data is None:
+        return state[key]
+    return _log_cache.get_or_create(ref, lambda: decode_log(data))
@@ -0,0 +1,185 @@
+# -*- coding: utf-8 -*-
+"""PDF用の結果グラフ（ReportLabのベクター図形）
+
+画面の結果グラフ（graphs.py、MatplotlibのPNG）と同じデータ・色・日本語ラベルで、
+PDFにはラスタライズしない図形（reportlab.graphics の Drawing）を埋め込む。
+印刷してもぼやけず、PDFも小さくなる。PDFの作成にMatplotlibは使わない。
+"""
+import numpy as np
+import pandas as pd
+from reportlab.graphics.charts.barcharts import VerticalBarChart
+from reportlab.graphics.charts.legends import LineLegend
+from reportlab.graphics.charts.lineplots import LinePlot
+from reportlab.graphics.shapes import Drawing, Group, String
+from reportlab.graphics.widgets.markers import makeMarker
+from reportlab.lib import colors
+from reportlab.lib.units import mm
+from reportlab.platypus import Flowable
+
+# graphs.py の図（6x4インチ）をPDFに載せていた大きさ
+CHART_WIDTH = 135*mm
+CHART_HEIGHT = 90*mm
+
+FONT = "IPAexGothic"
+FONT_SIZE = 8
+LABEL_FONT_SIZE = 9
+
+# 描画領域の余白（軸ラベル・目盛りの分）
+_LEFT = 18*mm
+_BOTTOM = 14*mm
+_RIGHT = 5*mm
+_TOP = 5*mm
+
+THERMAL_SERIES = [
+    ("銅(sec)", "銅", "#ff7f0e"),
+    ("アルミ(sec)", "アルミ", "#1f77b4"),
+    ("ステンレス(sec)", "ステンレス", "#7f7f7f"),
+]
+FUEL_CELL_SERIES = [("1回目", "#ff7f0e"), ("2回目", "#1f77b4"), ("3回目", "#2ca02c")]
+WATER_STAGES = ["浄化対象の水", "試作検討①", "試作検討②"]
+WATER_COLORS = ["#d62728", "#1f77b4", "#2ca02c"]
+
+
+class Chart(Flowable):
+    """グラフ（Drawing）をPDFに載せるフロウアブル
+
+    Drawing のグラフ部品はコピー（deepcopy）できず、描画中は canv を持つので
+    複数のPDF作成で共有もできない。コピーのたびに同じ入力から Drawing を作り直す。
+    """
+
+    def __init__(self, make, *args):
+        super().__init__()
+        self._make = make
+        self._args = args
+        self.drawing = make(*args)
+        self.hAlign = "CENTER"
+
+    def __deepcopy__(self, memo):
+        return Chart(self._make, *self._args)
+
+    def wrap(self, availWidth, availHeight):
+        return self.drawing.wrap(availWidth, availHeight)
+
+    def draw(self):
+        self.drawing.drawOn(self.canv, 0, 0)
+
+
+def _points(df, x_col, y_col):
+    """x・y の両方が入力済み（NaN でない）行の (x, y) のリスト（測定表は数値の型。tables.py）"""
+    x = df[x_col].to_numpy()
+    y = df[y_col].to_numpy()
+    mask = ~(np.isnan(x) | np.isnan(y))
+    return list(zip(x[mask].tolist(), y[mask].tolist()))
+
+
+def _axis_labels(d, xlabel, ylabel):
+    """X軸・Y軸のラベル（Y軸は90度回転）"""
+    d.add(String(_LEFT + (CHART_WIDTH - _LEFT - _RIGHT) / 2, 2*mm, xlabel,
+                 fontName=FONT, fontSize=LABEL_FONT_SIZE, textAnchor="middle"))
+    y = Group(String(0, 0, ylabel, fontName=FONT, fontSize=LABEL_FONT_SIZE, textAnchor="middle"))
+    y.translate(4*mm, _BOTTOM + (CHART_HEIGHT - _BOTTOM - _TOP) / 2)
+    y.rotate(90)
+    d.add(y)
+
+
+def _line_chart(series, xlabel, ylabel):
+    """折れ線グラフ（マーカー付き）。series は (凡例, 色, 点のリスト) のリスト"""
+    d = Drawing(CHART_WIDTH, CHART_HEIGHT)
+    lp = LinePlot()
+    lp.x, lp.y = _LEFT, _BOTTOM
+    lp.width = CHART_WIDTH - _LEFT - _RIGHT
+    lp.height = CHART_HEIGHT - _BOTTOM - _TOP
+    series = [s for s in series if s[2]]
+    if series:
+        lp.data = [points for _, _, points in series]
+        for i, (_, color, _) in enumerate(series):
+            lp.lines[i].strokeColor = colors.HexColor(color)
+            lp.lines[i].strokeWidth = 1.2
+            lp.lines[i].symbol = makeMarker("FilledCircle", size=4, fillColor=colors.HexColor(color), strokeColor=colors.HexColor(color))
+    else:
+        # データがないときも空の軸だけは描く（Matplotlibの空のグラフと同じ 0～1）
+        lp.data = [[(0, 0), (1, 1)]]
+        lp.lines[0].strokeColor = None
+        lp.xValueAxis.valueMin = lp.yValueAxis.valueMin = 0
+        lp.xValueAxis.valueMax = lp.yValueAxis.valueMax = 1
+    for axis in (lp.xValueAxis, lp.yValueAxis):
+        axis.labels.fontName = FONT
+        axis.labels.fontSize = FONT_SIZE
+        axis.visibleGrid = True
+        axis.gridStrokeColor = colors.lightgrey
+        axis.gridStrokeWidth = 0.5
+    lp.xValueAxis.labelTextFormat = lp.yValueAxis.labelTextFormat = "%g"
+    d.add(lp)
+
+    if series:
+        legend = LineLegend()
+        legend.fontName = FONT
+        legend.fontSize = FONT_SIZE
+        legend.x = CHART_WIDTH - _RIGHT - 22*mm
+        legend.y = CHART_HEIGHT - _TOP - 3*mm
+        legend.dx, legend.dy = 6*mm, 0
+        legend.deltay = 4*mm
+        legend.alignment = "right"
+        legend.colorNamePairs = [(colors.HexColor(color), label) for label, color, _ in series]
+        d.add(legend)
+
+    _axis_labels(d, xlabel, ylabel)
+    return d
+
+
+def thermal_chart(result_df):
+    """実験①: パイプ端からの距離とロウの融解時間"""
+    series = [(label, color, _points(result_df, "距離(cm)", col)) for col, label, color in THERMAL_SERIES]
+    return _line_chart(series, "パイプ端からの距離(cm)", "融解時間 (sec)")
+
+
+def fuel_cell_chart(discharge_dfs):
+    """実験②: 放電時間と出力（1～3回目）"""
+    series = []
+    for (label, color), df in zip(FUEL_CELL_SERIES, discharge_dfs):
+        try:
+            points = _points(df, "放電時間(sec)", "出力(mW)")
+        except (KeyError, ValueError, TypeError):
+            points = []
+        series.append((label, color, points))
+    return _line_chart(series, "放電時間 (sec)", "出力 (mW)")
+
+
+def water_treatment_chart(clarity_df):
+    """実験③: 浄化の各段階の清澄度（棒グラフと値）"""
+    values = []
+    for stage in WATER_STAGES:
+        v = clarity_df[stage].iloc[0] if stage in clarity_df.columns else None
+        values.append(0 if v is None or pd.isna(v) else float(v))
+
+    d = Drawing(CHART_WIDTH, CHART_HEIGHT)
+    bc = VerticalBarChart()
+    bc.x, bc.y = _LEFT, _BOTTOM
+    bc.width = CHART_WIDTH - _LEFT - _RIGHT
+    bc.height = CHART_HEIGHT - _BOTTOM - _TOP
+    bc.data = [values]
+    bc.categoryAxis.categoryNames = WATER_STAGES
+    bc.valueAxis.valueMin = 0
+    bc.valueAxis.valueMax = 1100
+    bc.valueAxis.valueStep = 200
+    bc.valueAxis.visibleGrid = True
+    bc.valueAxis.gridStrokeColor = colors.lightgrey
+    bc.valueAxis.gridStrokeDashArray = (3, 2)
+    bc.valueAxis.gridStrokeWidth = 0.5
+    for axis in (bc.categoryAxis, bc.valueAxis):
+        axis.labels.fontName = FONT
+        axis.labels.fontSize = FONT_SIZE
+    bc.barSpacing = 0
+    bc.groupSpacing = 12
+    bc.bars.strokeColor = None
+    for i, color in enumerate(WATER_COLORS):
+        bc.bars[(0, i)].fillColor = colors.HexColor(color)
+    # 棒の上に値（整数）
+    bc.barLabelFormat = "%d"
+    bc.barLabels.fontName = FONT
+    bc.barLabels.fontSize = FONT_SIZE
+    bc.barLabels.nudge = 5
+    d.add(bc)
+
+    _axis_labels(d, "", "清澄度[点]/1000点（水道水）")
+    return d
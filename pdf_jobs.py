@@ -0,0 +1,264 @@
+# -*- coding: utf-8 -*-
+"""提出用PDFのバックグラウンド作成と受付制御
+
+PDFの作成（グラフのラスタライズ・写真の埋め込み・doc.build）には数秒かかる。
+ボタンの処理の中で同期的に作ると、その間ページが固まり、Streamlitのスクリプト実行も占有される。
+ここではサーバー（プロセス）に1つのスケジューラへ作成を投げ、
+画面にはジョブ（PdfJob）だけを持たせて、順番・進捗（セクション単位）と完了を確認する。
+
+提出締切の直前にクラス全員が一斉に作成しても、同時に作成するのは上限（CPUコア数とメモリから決める）までで、
+残りは受付順（FIFO）に待つ。待ち時間・作成時間には上限（タイムアウト）を設け、
+待ち時間と作成時間は別々に記録する（stats()）。
+
+ジョブには入力状態と写真のスナップショットを渡すので、作成中に入力が変わっても影響しない。
+"""
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import deque
+
+from report_pdf import render_report_pdf
+
+PDF_WORKERS_ENV = "REPORT_PDF_WORKERS"
+
+# PDF 1件の作成に見込むメモリ（写真のデコード・ReportLabの組版を含む）
+PDF_JOB_MEMORY_MB = 200
+# PDF作成に使ってよいメモリの割合（残りはStreamlit本体と各セッションの入力状態）
+PDF_MEMORY_SHARE = 0.5
+
+# 順番待ち・作成中それぞれの上限（秒）
+QUEUE_TIMEOUT_SEC = 300
+RENDER_TIMEOUT_SEC = 120
+
+logger = logging.getLogger(__name__)
+
+_lock = threading.Lock()
+_scheduler = None
+
+
+def _memory_limit_mb():
+    """このプロセスが使えるメモリ[MB]（コンテナのcgroup制限があればそちら）"""
+    try:
+        with open("/sys/fs/cgroup/memory.max") as f:
+            v = f.read().strip()
+        if v.isdigit():
+            return int(v) // 2**20
+    except OSError:
+        pass
+    try:
+        return os.sysconf("SC_PHYS_PAGES") * os.sysconf("SC_PAGE_SIZE") // 2**20
+    except (ValueError, OSError, AttributeError):
+        return None
+
+
+def pdf_worker_count():
+    """同時に作成するPDFの数
+
+    環境変数 REPORT_PDF_WORKERS があればその値。なければCPUコア数と、
+    メモリ（PDF_MEMORY_SHARE 分を PDF_JOB_MEMORY_MB ずつ）の小さい方。
+    """
+    n = os.environ.get(PDF_WORKERS_ENV)
+    if n:
+        return max(1, int(n))
+    cap = os.cpu_count() or 1
+    mem = _memory_limit_mb()
+    if mem:
+        cap = min(cap, int(mem * PDF_MEMORY_SHARE // PDF_JOB_MEMORY_MB))
+    return max(1, cap)
+
+
+class PdfJob:
+    """PDF作成のジョブ（session_state に置いて画面から状態を確認する）
+
+    status: "queued"（順番待ち）→ "running"（作成中）→ "done" / "failed" / "timeout"
+    """
+
+    def __init__(self, filename, state, photos, cache_key=None):
+        self.id = uuid.uuid4().hex[:8]
+        self.filename = filename
+        self.cache_key = cache_key
+        self.record_history = True  # 完了時に更新履歴へPDF出力を記録するか（画面側で使う）
+        self.status = "queued"
+        self.section = "順番待ち"
+        self.progress = 0.0
+        self.submitted_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.error = None
+        self._pdf = None
+        self._inputs = (state, photos)
+        self._scheduler = None
+
+    def _update(self, section, progress):
+        # ワーカースレッドから呼ばれる（単純な属性の書き換えのみ）
+        self.section = section
+        self.progress = progress
+
+    def done(self):
+        """作成が終わったか（成功・失敗・タイムアウトのいずれか）"""
+        if self.status in ("queued", "running"):
+            self._scheduler.expire(self)
+        return self.status not in ("queued", "running")
+
+    def result(self):
+        """作成したPDFのバイト列（失敗・タイムアウトの場合は例外を送出する）"""
+        if self.status != "done":
+            raise self.error or RuntimeError("PDFの作成が完了していません")
+        return self._pdf
+
+    def position(self):
+        """順番待ちの何番目か（作成中・完了なら0）"""
+        return self._scheduler.position(self)
+
+    @property
+    def queue_wait(self):
+        """順番待ちの時間（秒）"""
+        return (self.started_at or self.finished_at or time.time()) - self.submitted_at
+
+    @property
+    def render_time(self):
+        """作成にかかった時間（秒、未開始なら0）"""
+        if self.started_at is None:
+            return 0.0
+        return (self.finished_at or time.time()) - self.started_at
+
+    @property
+    def elapsed(self):
+        return (self.finished_at or time.time()) - self.submitted_at
+
+
+class PdfScheduler:
+    """同時作成数に上限のあるPDF作成の受付（プロセスに1つ）"""
+
+    def __init__(self, workers, queue_timeout=QUEUE_TIMEOUT_SEC, render_timeout=RENDER_TIMEOUT_SEC):
+        self.workers = workers
+        self.queue_timeout = queue_timeout
+        self.render_timeout = render_timeout
+        self._cond = threading.Condition()
+        self._pending = deque()
+        self._running = 0
+        # タイムアウトにしたが、スレッドがまだ作成を続けている（枠を使っている）ジョブの数
+        self._abandoned = 0
+        self._counts = {"done": 0, "failed": 0, "timeout": 0}
+        self._waits = deque(maxlen=500)
+        self._renders = deque(maxlen=500)
+        for i in range(workers):
+            threading.Thread(target=self._run, name=f"pdf-build-{i}", daemon=True).start()
+
+    def submit(self, job):
+        job._scheduler = self
+        with self._cond:
+            self._pending.append(job)
+            self._cond.notify()
+        logger.info("PDF作成を受付: %s (%s) 待ち%d件", job.id, job.filename, len(self._pending))
+        return job
+
+    def position(self, job):
+        with self._cond:
+            try:
+                return self._pending.index(job) + 1
+            except ValueError:
+                return 0
+
+    def expire(self, job):
+        """待ち時間・作成時間の上限を超えたジョブをタイムアウトにする"""
+        now = time.time()
+        with self._cond:
+            if job.status == "queued" and now - job.submitted_at > self.queue_timeout:
+                self._pending.remove(job)
+                self._finish(job, "timeout", TimeoutError("混雑のためPDFを作成できませんでした。しばらくしてからもう一度作成してください。"))
+            elif job.status == "running" and now - job.started_at > self.render_timeout:
+                # スレッドは止められないので、結果を受け取らないことにする（作成は裏で最後まで進む）。
+                # スレッドが戻るまでは枠を使っているので、running からは外さず abandoned にも数える
+                self._abandoned += 1
+                self._finish(job, "timeout", TimeoutError("PDFの作成に時間がかかりすぎたため中断しました。"))
+
+    def _finish(self, job, status, error=None):
+        # self._cond を取得した状態で呼ぶ
+        job.status = status
+        job.error = error
+        job.finished_at = time.time()
+        job._inputs = None
+        self._counts[status] += 1
+        self._waits.append(job.queue_wait)
+        if job.started_at:
+            self._renders.append(job.render_time)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._pending:
+                    self._cond.wait()
+                job = self._pending.popleft()
+                if job.status != "queued":
+                    continue
+                if time.time() - job.submitted_at > self.queue_timeout:
+                    # 画面が閉じられて誰も確認していないジョブも、上限を超えたら作成しない
+                    self._finish(job, "timeout", TimeoutError("混雑のためPDFを作成できませんでした。しばらくしてからもう一度作成してください。"))
+                    continue
+                job.status = "running"
+                job.started_at = time.time()
+                self._running += 1
+                state, photos = job._inputs
+            job.section = "開始"
+            try:
+                pdf = render_report_pdf(state, photos, progress=job._update, key=job.cache_key)
+                error = None
+            except Exception as e:
+                logger.exception("PDF作成に失敗しました: %s", job.id)
+                pdf, error = None, e
+            with self._cond:
+                self._running -= 1
+                if job.status == "running":
+                    job._pdf = pdf
+                    self._finish(job, "failed" if error else "done", error)
+                else:
+                    # expire でタイムアウトにしたジョブのスレッドがようやく戻った
+                    self._abandoned -= 1
+            logger.info("PDF作成: %s %s 待ち%.1fs 作成%.1fs", job.id, job.status, job.queue_wait, job.render_time)
+
+    def stats(self):
+        """受付状況と、待ち時間・作成時間の平均と最大（秒、直近500件）
+
+        running: 作成中で枠を使っているスレッドの数（タイムアウトにしたがまだ終わっていない abandoned を含む）
+        """
+        with self._cond:
+            waits, renders = list(self._waits), list(self._renders)
+            out = {
+                "workers": self.workers,
+                "running": self._running,
+                "abandoned": self._abandoned,
+                "queued": len(self._pending),
+                **self._counts,
+            }
+        out["wait_mean_sec"] = sum(waits) / len(waits) if waits else 0.0
+        out["wait_max_sec"] = max(waits, default=0.0)
+        out["render_mean_sec"] = sum(renders) / len(renders) if renders else 0.0
+        out["render_max_sec"] = max(renders, default=0.0)
+        return out
+
+
+def get_pdf_scheduler():
+    global _scheduler
+    if _scheduler is None:
+        with _lock:
+            if _scheduler is None:
+                _scheduler = PdfScheduler(pdf_worker_count())
+                logger.info("PDF作成の同時実行数: %d", _scheduler.workers)
+    return _scheduler
+
+
+def submit_pdf_job(state, photos, filename, cache_key=None):
+    """PDF作成を受付に投げ、すぐにジョブを返す
+
+    state: 入力状態のスナップショット（report_pdf.ReportState）
+    photos: 写真参照 → バイト列の辞書（作成中に写真ストアが掃除されても困らないように写しておく）
+    cache_key: 作成したPDFを登録するキャッシュのキー（report_pdf.resolve_report_input）
+    """
+    # 組版（ReportLab）は初回のPDF作成時に読み込むが、ワーカースレッドではなくここ（スクリプトの実行中）で読み込む。
+    # Streamlit は app.py のフォルダをスクリプトの実行中だけ sys.path に加えるため、
+    # 実行後のワーカースレッドからの import では同じフォルダのモジュールが見つからないことがある
+    import report_layout  # noqa: F401
+    return get_pdf_scheduler().submit(PdfJob(filename, state, photos, cache_key))
@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+"""再実行ごとのサーバーCPU時間の計測
+
+Streamlitはセッションごとに別スレッドでスクリプトを実行するので、
+スレッドCPU時間（time.thread_time）で計れば他の学生の処理と混ざらない。
+記録はプロセス内のリングバッファに残し、benchmarks/ のスクリプトや
+ログ（DEBUGレベル）から参照する。
+"""
+import logging
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+_records = deque(maxlen=5000)
+_lock = threading.Lock()
+
+
+@contextmanager
+def measure_cpu(name):
+    """with ブロック内のCPU時間・経過時間[ms]を name として記録する"""
+    cpu0 = time.thread_time()
+    wall0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(name, (time.thread_time() - cpu0) * 1000, (time.perf_counter() - wall0) * 1000)
+
+
+def begin_run():
+    """with で囲めない区間（スクリプト全体など）の計測開始。end_run に渡す"""
+    return (time.thread_time(), time.perf_counter())
+
+
+def end_run(name, token):
+    cpu0, wall0 = token
+    record(name, (time.thread_time() - cpu0) * 1000, (time.perf_counter() - wall0) * 1000)
+
+
+def record(name, cpu_ms, wall_ms):
+    with _lock:
+        _records.append((name, cpu_ms, wall_ms))
+    logger.debug("%s: CPU %.1fms / 経過 %.1fms", name, cpu_ms, wall_ms)
+
+
+def records(name=None):
+    """記録を (name, cpu_ms, wall_ms) のリストで返す"""
+    with _lock:
+        return [r for r in _records if name is None or r[0] == name]
+
+
+def summary():
+    """区間ごとの回数・CPU時間の平均・最大[ms]"""
+    out = {}
+    for name, cpu_ms, _ in records():
+        s = out.setdefault(name, {"count": 0, "cpu_ms_total": 0.0, "cpu_ms_max": 0.0})
+        s["count"] += 1
+        s["cpu_ms_total"] += cpu_ms
+        s["cpu_ms_max"] = max(s["cpu_ms_max"], cpu_ms)
+    for s in out.values():
+        s["cpu_ms_mean"] = s["cpu_ms_total"] / s["count"]
+    return out
+
+
+def clear():
+    with _lock:
+        _records.clear()
@@ -0,0 +1,309 @@
+# -*- coding: utf-8 -*-
+"""アップロード写真の取り込み（向き補正・縮小・再圧縮）
+
+スマートフォンの写真（3～8MB）をそのまま保持すると、セッションのメモリ・保存JSON・PDFが
+すべて肥大化する。取り込み時に一度だけPDFの枠に必要な解像度まで縮小し、
+JPEG（またはWebP）で再圧縮したバイト列を保持する。
+
+写真そのものは PhotoStore（SHA-256をキーにした内容アドレス方式のストア）に1つだけ置き、
+session_state・実験レジストリ・保存ファイルからは "sha256:<hex>" 形式の参照で指す。
+データロガーから取り込んだ全点の記録（logger_import.py）も同じストアに置く。
+"""
+import base64
+import hashlib
+from dataclasses import dataclass
+from io import BytesIO
+
+from PIL import Image, ImageOps
+
+from caching import LRUCache
+
+# PDF内で最も大きい写真枠（実験装置: 120×80mm）を約200dpiで印刷できる大きさ
+PRINT_DPI = 200
+MAX_FRAME_MM = 120
+PHOTO_MAX_PX = round(MAX_FRAME_MM / 25.4 * PRINT_DPI)
+
+PHOTO_FORMAT = "JPEG"  # "JPEG" または "WEBP"
+PHOTO_QUALITY = 82
+
+# 枠に収まる写真をそのまま使うときの1画素あたりのバイト数の上限。
+# PHOTO_QUALITY で圧縮した写真は 0.1～0.3 バイト/画素程度で、これを超えるもの（高画質設定で保存された写真など）は再圧縮する
+PASSTHROUGH_MAX_BYTES_PER_PX = 0.35
+
+# 画面プレビュー用のサムネイル（PDFには使わない）
+THUMB_MAX_PX = 640
+THUMB_QUALITY = 70
+
+_thumb_cache = LRUCache(maxsize=256)
+
+# PDFに埋め込む写真（枠の大きさに合わせて縮小したもの）
+_print_cache = LRUCache(maxsize=128)
+
+# 写真参照の接頭辞（旧形式の base64 文字列と区別するため）
+PHOTO_REF_PREFIX = "sha256:"
+
+
+@dataclass
+class IngestResult:
+    """写真取り込みの結果"""
+    data: bytes
+    original_size: int
+    width: int
+    height: int
+    format: str
+
+    @property
+    def stored_size(self):
+        return len(self.data)
+
+    @property
+    def saved_bytes(self):
+        return self.original_size - self.stored_size
+
+    def summary(self):
+        """「4.2MB → 180KB（96%削減）」形式の説明文"""
+        ratio = (self.saved_bytes / self.original_size * 100) if self.original_size else 0
+        return (
+            f"{format_size(self.original_size)} → {format_size(self.stored_size)}"
+            f"（{ratio:.0f}%削減, {self.width}×{self.height}px）"
+        )
+
+
+@dataclass(frozen=True)
+class PhotoRenditions:
+    """1枚の写真の2つの表現: 画面用サムネイルと印刷用（PDF用）画像"""
+    digest: str
+    print_data: bytes
+    thumbnail: bytes
+
+
+def format_size(n):
+    """バイト数を KB / MB 表記にする"""
+    if n >= 1024 * 1024:
+        return f"{n / 1024 / 1024:.1f}MB"
+    if n >= 1024:
+        return f"{n / 1024:.0f}KB"
+    return f"{n}B"
+
+
+def ingest_photo(raw, max_px=PHOTO_MAX_PX, fmt=PHOTO_FORMAT, quality=PHOTO_QUALITY):
+    """写真のバイト列をEXIFの向きに合わせて回転し、max_px 以内に縮小して再圧縮する
+
+    すでに縮小済み（枠に収まるJPEG/WebPで、EXIFがなく、大きさが PASSTHROUGH_MAX_BYTES_PER_PX 以内）の写真は
+    再圧縮せずそのまま返す。保存・復元を繰り返しても画質が劣化しないようにするため。
+    EXIF（撮影情報・位置情報）の付いた写真や高画質で保存された写真は、枠に収まっていても再圧縮する。
+    """
+    with Image.open(BytesIO(raw)) as src:
+        src_format = src.format
+        if (
+            src_format in ("JPEG", "WEBP")
+            and max(src.size) <= max_px
+            and not src.info.get("exif")
+            and len(raw) <= src.width * src.height * PASSTHROUGH_MAX_BYTES_PER_PX
+        ):
+            return IngestResult(raw, len(raw), src.width, src.height, src_format)
+
+        img = ImageOps.exif_transpose(src)
+        img.thumbnail((max_px, max_px), Image.Resampling.LANCZOS)
+
+        # 透過PNGなどは白背景に合成してからJPEG化する
+        if img.mode not in ("RGB", "L"):
+            rgba = img.convert("RGBA")
+            img = Image.new("RGB", rgba.size, (255, 255, 255))
+            img.paste(rgba, mask=rgba.getchannel("A"))
+
+        out = BytesIO()
+        if fmt == "WEBP":
+            img.save(out, format="WEBP", quality=quality, method=4)
+        else:
+            img.save(out, format="JPEG", quality=quality, optimize=True, progressive=True)
+        return IngestResult(out.getvalue(), len(raw), img.width, img.height, fmt)
+
+
+def is_photo_ref(value):
+    """値が PhotoStore への参照（"sha256:<hex>"）かどうか"""
+    return isinstance(value, str) and value.startswith(PHOTO_REF_PREFIX)
+
+
+def photo_bytes(value, store=None):
+    """写真値をバイト列にする（参照・バイト列・旧形式の base64 文字列に対応）"""
+    if not value:
+        return None
+    if isinstance(value, (bytes, bytearray)):
+        return bytes(value)
+    if is_photo_ref(value):
+        return store.get(value) if store is not None else None
+    return base64.b64decode(value)
+
+
+def load_photo(value):
+    """保存データ中の写真値（bytes または旧形式の base64 文字列）を取り込み済みのバイト列にする
+
+    旧形式のファイルに含まれる未縮小の写真は、ここで一度だけ縮小される。
+    """
+    data = photo_bytes(value)
+    if not data:
+        return None
+    try:
+        return ingest_photo(data).data
+    except Exception:
+        # 画像として解釈できない場合は手を加えずに保持する
+        return data
+
+
+def photo_digest(data):
+    """写真バイト列の内容ハッシュ（SHA-256）"""
+    return hashlib.sha256(data).hexdigest()
+
+
+def make_thumbnail(data, max_px=THUMB_MAX_PX, quality=THUMB_QUALITY):
+    """画面プレビュー用の小さなJPEGを作る"""
+    with Image.open(BytesIO(data)) as src:
+        img = ImageOps.exif_transpose(src)
+        img.thumbnail((max_px, max_px), Image.Resampling.LANCZOS)
+        if img.mode not in ("RGB", "L"):
+            img = img.convert("RGB")
+        out = BytesIO()
+        img.save(out, format="JPEG", quality=quality, optimize=True)
+        return out.getvalue()
+
+
+def resample_for_frame(data, max_width, max_height, dpi=PRINT_DPI, quality=PHOTO_QUALITY, digest=None):
+    """PDFの枠（幅・高さ、ポイント＝1/72インチ）に収めたときに dpi になる画素数まで縮小したJPEG
+
+    取り込み時の縮小は最も大きい枠に合わせてあるので、小さい枠ではさらに縮小できる。
+    すでに必要な画素数以下の写真や、画像として解釈できないものは手を加えずに返す。
+    結果は内容ハッシュ・枠・dpiごとにキャッシュする。
+    """
+    digest = digest or photo_digest(data)
+    key = (digest, round(max_width, 1), round(max_height, 1), dpi, quality)
+
+    def _build():
+        try:
+            with Image.open(BytesIO(data)) as src:
+                img = ImageOps.exif_transpose(src)
+                # 枠に収めたときの表示幅（create_proportional_image と同じ計算）
+                width = min(max_width, max_height * img.width / img.height)
+                target = round(width / 72 * dpi)
+                if img.width <= target:
+                    return data
+                img = img.resize((target, max(1, round(img.height * target / img.width))), Image.Resampling.LANCZOS)
+                if img.mode not in ("RGB", "L"):
+                    img = img.convert("RGB")
+                out = BytesIO()
+                img.save(out, format="JPEG", quality=quality, optimize=True)
+                return out.getvalue()
+        except Exception:
+            return data
+
+    return _print_cache.get_or_create(key, _build)
+
+
+def get_renditions(value, store=None):
+    """写真値から画面用・印刷用の両表現を得る（サムネイルは内容ハッシュごとに1回だけ生成）"""
+    data = photo_bytes(value, store)
+    if not data:
+        return None
+    # 参照ならハッシュを計算し直す必要はない
+    digest = value[len(PHOTO_REF_PREFIX):] if is_photo_ref(value) else photo_digest(data)
+
+    def _build():
+        try:
+            return make_thumbnail(data)
+        except Exception:
+            # 画像として解釈できない場合は印刷用をそのまま使う
+            return data
+
+    thumb = _thumb_cache.get_or_create(digest, _build)
+    return PhotoRenditions(digest, data, thumb)
+
+
+class PhotoStore:
+    """写真をSHA-256ごとに1つだけ保持するストア（セッションごとに1つ）
+
+    同じ写真が現在の入力・実験レジストリ・保存ファイルに現れても、実体はここに1つだけ置く。
+    """
+
+    def __init__(self):
+        self._blobs = {}
+
+    def put(self, data):
+        """写真を登録して参照（"sha256:<hex>"）を返す"""
+        ref = PHOTO_REF_PREFIX + photo_digest(data)
+        self._blobs.setdefault(ref, data)
+        return ref
+
+    def get(self, ref):
+        return self._blobs.get(ref)
+
+    def import_value(self, value):
+        """保存データ中の写真値をストアに取り込み、参照を返す
+
+        参照はそのまま、旧形式（base64・バイト列）は縮小してから登録する。
+        """
+        if not value:
+            return None
+        if is_photo_ref(value):
+            return value
+        data = load_photo(value)
+        return self.put(data) if data else None
+
+    def load_blobs(self, blobs):
+        """保存ファイルの "photo_blobs"（ハッシュ → base64 またはバイト列）を読み込む"""
+        for digest, encoded in (blobs or {}).items():
+            data = encoded if isinstance(encoded, (bytes, bytearray)) else base64.b64decode(encoded)
+            # 中身とハッシュが一致しないものは取り込まない
+            if photo_digest(data) == digest:
+                self._blobs.setdefault(PHOTO_REF_PREFIX + digest, bytes(data))
+
+    def export_blobs(self, refs):
+        """指定した参照の写真を "photo_blobs" 形式（ハッシュ → base64）で書き出す"""
+        out = {}
+        for ref in sorted(set(refs)):
+            data = self._blobs.get(ref)
+            if data is not None:
+                out[ref[len(PHOTO_REF_PREFIX):]] = base64.b64encode(data).decode()
+        return out
+
+    def gc(self, live_refs):
+        """どこからも参照されていない写真を削除し、削除した件数を返す"""
+        live = set(live_refs)
+        dead = [ref for ref in self._blobs if ref not in live]
+        for ref in dead:
+            del self._blobs[ref]
+        return len(dead)
+
+    def __contains__(self, ref):
+        return ref in self._blobs
+
+    def __len__(self):
+        return len(self._blobs)
+
+    @property
+    def total_bytes(self):
+        return sum(len(b) for b in self._blobs.values())
+
+
+def collect_photo_refs(obj):
+    """辞書・リストを再帰的にたどり、含まれる写真参照をすべて集める"""
+    refs = set()
+    stack = [obj]
+    while stack:
+        o = stack.pop()
+        if isinstance(o, dict):
+            stack.extend(o.values())
+        elif isinstance(o, (list, tuple)):
+            stack.extend(o)
+        elif is_photo_ref(o):
+            refs.add(o)
+        elif hasattr(o, "photo_refs"):
+            # 未展開のまま保持しているデータ（archive.LazyExperimentState）
+            refs |= o.photo_refs
+    return refs
+
+
+def json_default(o):
+    """json.dumps の default 用: 写真のバイト列は base64 文字列として書き出す"""
+    if isinstance(o, (bytes, bytearray)):
+        return base64.b64encode(o).decode()
+    raise TypeError(f"Object of type {type(o).__name__} is not JSON serializable")
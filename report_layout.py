@@ -0,0 +1,646 @@
+# -*- coding: utf-8 -*-
+"""提出用PDFの組版（ReportLab）
+
+report_pdf.build_report_pdf から、最初にPDFを作るときに読み込まれる。
+ReportLab の読み込みには時間がかかるので、画面の起動（app.py の import）では読み込まない。
+
+PDFはセクションごとに作り（_report_plan）、依存する入力が同じセクションはキャッシュから使う。
+"""
+import copy
+import os
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle, Image
+from reportlab.lib.pagesizes import A4
+from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+from reportlab.lib.enums import TA_CENTER, TA_RIGHT
+from reportlab.lib.units import mm
+from reportlab.lib import colors
+from reportlab.lib.utils import ImageReader
+
+from caching import LRUCache, content_hash
+from derived import discharge_summary_rows, thermal_fit_rows
+from logger_import import full_table
+from fonts import ensure_pdf_fonts
+from pdf_charts import Chart, thermal_chart, fuel_cell_chart, water_treatment_chart
+from perf import measure_cpu
+from photos import PHOTO_REF_PREFIX, PRINT_DPI, is_photo_ref, photo_bytes, photo_digest, resample_for_frame
+from report_pdf import GLOBAL_KEYS, ReportState
+from scoring import QUESTION_DICT, achievement_rate, question_key
+from tables import table_cells
+
+# 写真の枠（最大の幅・高さ）。写真はこの枠に収めたときに PHOTO_DPI になるよう縮小して埋め込む
+PHOTO_FRAMES = {
+    "apparatus_photo_data": (120*mm, 80*mm),
+    "wt_original_water_photo": (100*mm, 70*mm),
+    "wt_proto1_dev_photo": (75*mm, 55*mm),
+    "wt_proto1_water_photo": (75*mm, 55*mm),
+    "wt_proto2_dev_photo": (75*mm, 55*mm),
+    "wt_proto2_water_photo": (75*mm, 55*mm),
+    "wt_coagulation_photo": (100*mm, 70*mm),
+}
+PHOTO_DPI = PRINT_DPI
+
+# セクションごとのフロウアブルのキャッシュ（写真を含むセクションもあるので件数は控えめ）
+SECTION_CACHE_SIZE = 64
+_section_cache = LRUCache(maxsize=SECTION_CACHE_SIZE)
+
+
+def create_proportional_image(img_io, max_width=100*mm, max_height=75*mm):
+    """アスペクト比を維持しつつ、指定の枠内に収まるReportLab Imageを作成する"""
+    try:
+        img_reader = ImageReader(img_io)
+        iw, ih = img_reader.getSize()
+        aspect = ih / float(iw)
+        
+        width = max_width
+        height = width * aspect
+        
+        if height > max_height:
+            height = max_height
+            width = height / aspect
+            
+        return Image(img_io, width=width, height=height)
+    except:
+        # 失敗時はデフォルトサイズで返す
+        return Image(img_io, width=max_width, height=max_height)
+
+
+def _section_header(s, styles, photo):
+    """スコア・実験タイトル・基本情報"""
+    elements = []
+    # スコア計算
+    home_score, report_score, total_score, _ = s.achievement
+    score_text = f"簡易自己評価: {total_score}% (自宅課題: {home_score}% / レポート: {report_score}%)"
+    score_style = ParagraphStyle('Score', parent=styles['Normal'], alignment=TA_RIGHT, textColor=colors.red)
+    elements.append(Paragraph(score_text, score_style))
+    elements.append(Spacer(1, 5*mm))
+
+    # タイトル・基本情報
+    elements.append(Paragraph(f"実験タイトル: {s.exp_title}", styles['Title']))
+    elements.append(Paragraph(f"実験日: {s.exp_date}", styles['Normal']))
+
+    # 安全確認ステータス
+    safety_style = ParagraphStyle('Safety', parent=styles['Normal'], textColor=colors.green, fontName='IPAexGothic')
+    elements.append(Paragraph("【安全上の注意事項：全項目確認済み】", safety_style))
+
+    # 本人情報
+    elements.append(Paragraph(
+        f"クラス: {s.class_name} 席番号: {s.seat_number} "
+        f"出席番号: {s.student_id} 氏名: {s.student_name}", 
+        styles['Normal']
+    ))
+
+    # 共同実験者情報（入力がある場合のみ表示）
+    partners = []
+    if s.partner1_id or s.partner1_name:
+        partners.append(f"共同実験者①: {s.partner1_id} {s.partner1_name}")
+    if s.partner2_id or s.partner2_name:
+        partners.append(f"共同実験者②: {s.partner2_id} {s.partner2_name}")
+
+    if partners:
+        elements.append(Paragraph(" / ".join(partners), styles['Normal']))
+
+    elements.append(Spacer(1,5*mm))
+    return elements
+
+
+def _section_research(s, styles, photo):
+    """1. 調査レポート（自宅課題）と参考文献"""
+    elements = []
+    # 1. 調査レポート（自宅課題）
+    elements.append(Paragraph("1. 調査レポート（自宅課題）", styles['Heading2']))
+    for q in QUESTION_DICT[s.exp_title]:
+        key_name = question_key(q)
+        answer = s.get(key_name,"")
+        elements.append(Paragraph(f"<b>Q. {q}</b>", styles['Normal']))
+        elements.append(Paragraph(f"A. {answer}", styles['Normal']))
+        elements.append(Spacer(1, 2*mm))
+
+    # 参考文献
+    elements.append(Paragraph("【参考文献】", styles['Normal']))
+    if not s.references_list.empty:
+        ref_data = [["書籍名・サイト名", "著者・発行者", "発行年・URL"]]
+        ref_dict = s.references_list.to_dict(orient="records")
+        # テーブル内での改行を有効にするためParagraphを使用
+        table_cell_style = ParagraphStyle('TableCellStyle', parent=styles['Normal'], fontName='IPAexGothic', fontSize=9, leading=11)
+        for item in ref_dict:
+             ref_data.append([
+                 Paragraph(str(item.get("書籍名・サイト名", "")), table_cell_style),
+                 Paragraph(str(item.get("著者・発行者", "")), table_cell_style),
+                 Paragraph(str(item.get("発行年・URL", "")), table_cell_style)
+             ])
+
+        if len(ref_data) > 1:
+            rt = Table(ref_data, colWidths=[60*mm, 50*mm, 50*mm])
+            rt.setStyle(TableStyle([
+                ('FONT', (0,0), (-1,-1), 'IPAexGothic'),
+                ('GRID', (0,0), (-1,-1), 0.5, colors.black),
+                ('BACKGROUND', (0,0), (1,0), colors.lightgrey),
+                ('ALIGN', (0,0), (-1,-1), 'LEFT'),
+            ]))
+            elements.append(rt)
+        else:
+            elements.append(Paragraph("なし", styles['Normal']))
+    else:
+        elements.append(Paragraph("なし", styles['Normal']))
+
+    elements.append(Spacer(1, 4*mm))
+    return elements
+
+
+def _section_method(s, styles, photo):
+    """2. 実験方法"""
+    elements = []
+    # 2. 実験方法
+    elements.append(Paragraph("2. 実験方法", styles['Heading2']))
+    elements.append(Paragraph("【使用器具】", styles['Normal']))
+    tools_data = [["器具・装置・薬品名", "用途・役割など"]]
+    tools_dict = s.tools_list.to_dict(orient="records")
+    table_cell_style = ParagraphStyle('TableCellStyle', parent=styles['Normal'], fontName='IPAexGothic', fontSize=9, leading=11)
+    for item in tools_dict:
+        # 新旧カラム名の両対応（旧名がある場合はそちらを使用）
+        name = item.get("器具・装置・薬品名", item.get("器具名", ""))
+        role = item.get("用途・役割など", item.get("役割", ""))
+        tools_data.append([
+            Paragraph(str(name), table_cell_style),
+            Paragraph(str(role), table_cell_style)
+        ])
+
+    if len(tools_data) > 1:
+        t = Table(tools_data, colWidths=[60*mm, 100*mm])
+        t.setStyle(TableStyle([
+            ('FONT', (0,0), (-1,-1), 'IPAexGothic'),
+            ('GRID', (0,0), (-1,-1), 0.5, colors.black),
+            ('BACKGROUND', (0,0), (1,0), colors.lightgrey),
+            ('ALIGN', (0,0), (-1,-1), 'LEFT'),
+        ]))
+        elements.append(t)
+    else:
+        elements.append(Paragraph("なし", styles['Normal']))
+    elements.append(Spacer(1, 3*mm))
+
+    if s.apparatus_photo_data:
+        elements.append(Paragraph("【作成した実験装置】", styles['Normal']))
+        try:
+            elements.append(photo("apparatus_photo_data"))
+        except Exception as e:
+            elements.append(Paragraph(f"(画像読み込みエラー: {e})", styles['Normal']))
+        elements.append(Spacer(1, 3*mm))
+
+    elements.append(Paragraph(f"【評価方法】 {s.evaluation_method}", styles['Normal']))
+    elements.append(Spacer(1, 5*mm))
+    return elements
+
+
+def _section_thermal_results(s, styles, photo):
+    """実験①: 3. 実験結果（融解温度・融解時間の表）"""
+    elements = []
+    elements.append(Paragraph("3. 実験結果", styles['Heading2']))
+
+    # 融解温度テーブル
+    elements.append(Paragraph("■ ロウの融解温度(℃)", styles['Normal']))
+    m_df = s.melting_point_df
+    m_table_data = table_cells(m_df)
+    mt = Table(m_table_data, colWidths=[30*mm]*4)
+    mt.setStyle(TableStyle([
+        ('FONT', (0,0), (-1,-1), 'IPAexGothic'),
+        ('GRID', (0,0), (-1,-1), 0.5, colors.black),
+        ('BACKGROUND', (0,0), (1,0), colors.lightgrey),
+        ('ALIGN', (0,0), (-1,-1), 'CENTER'),
+    ]))
+    elements.append(mt)
+    elements.append(Spacer(1, 3*mm))
+
+    elements.append(Paragraph("■ 距離と融解時間", styles['Normal']))
+    df = s.result_df
+    table_data = table_cells(df)
+    col_w = 40*mm
+    t = Table(table_data, colWidths=[col_w]*len(df.columns))
+    t.setStyle(TableStyle([
+        ('FONT', (0,0), (-1,-1), 'IPAexGothic'),
+        ('GRID', (0,0), (-1,-1), 0.5, colors.black),
+        ('BACKGROUND', (0,0), (1,0), colors.lightgrey),
+        ('ALIGN', (0,0), (-1,-1), 'CENTER'),
+    ]))
+    elements.append(t)
+    elements.append(Spacer(1, 2*mm))
+    return elements
+
+
+def _section_thermal_graph(s, styles, photo):
+    """実験①: 4. 結果グラフ"""
+    elements = []
+    # 4. 結果グラフ
+    elements.append(Paragraph("4. 結果グラフ", styles['Heading2']))
+    try:
+        elements.append(Chart(thermal_chart, s.result_df))
+    except Exception as e:
+        elements.append(Paragraph(f"グラフ作成エラー: {e}", styles['Normal']))
+
+    caption_style = ParagraphStyle('Caption', parent=styles['Normal'], alignment=TA_CENTER)
+    elements.append(Paragraph("図：熱が伝導した距離とロウの融解時間の関係（溶け始めの時間）", caption_style))
+    elements.append(Spacer(1, 5*mm))
+
+    # 近似のまとめ表（画面のまとめ表と同じ値）
+    elements.append(Paragraph("■ 融解時間の近似 t = t0 + k×距離²（熱の伝わりやすさ ∝ 1/k）", styles['Normal']))
+    fit_table_data = [["", "銅", "アルミ", "ステンレス"]] + s.thermal_fit
+    ft = Table(fit_table_data, colWidths=[70*mm] + [30*mm]*3)
+    ft.setStyle(TableStyle([
+        ('FONT', (0,0), (-1,-1), 'IPAexGothic'),
+        ('GRID', (0,0), (-1,-1), 0.5, colors.black),
+        ('BACKGROUND', (0,0), (-1,0), colors.lightgrey),
+        ('BACKGROUND', (0,0), (0,-1), colors.lightgrey),
+        ('ALIGN', (0,0), (-1,-1), 'CENTER'),
+    ]))
+    elements.append(ft)
+    return elements
+
+
+def _section_thermal_comparison(s, styles, photo):
+    """実験①: 5. 比較検証・考察"""
+    elements = []
+    # 5. 比較検証・考察
+    elements.append(Paragraph("5. 比較検証・考察", styles['Heading2']))
+    lit_vals = f"熱伝導率の文献値: 銅={s.lit_cu}, アルミ={s.lit_al}, ステンレス={s.lit_sus} (W/m/K)"
+    elements.append(Paragraph(lit_vals, styles['Normal']))
+    elements.append(Spacer(1, 2*mm))
+    elements.append(Paragraph("【考察】", styles['Normal']))
+    elements.append(Paragraph(s.comparison_text, styles['Normal']))
+    elements.append(Spacer(1, 2*mm))
+    if s.thermal_conductivity_ref:
+        elements.append(Paragraph(f"（熱伝導率の参考文献: {s.thermal_conductivity_ref}）", styles['Normal']))
+    return elements
+
+
+def _section_fuel_cell_results(s, styles, photo):
+    """実験②: 3. 実験結果（充電・放電の表）"""
+    elements = []
+    elements.append(Paragraph("3. 実験結果", styles['Heading2']))
+
+    # 充電実験
+    elements.append(Paragraph("■ 充電実験", styles['Normal']))
+    c_df = s.fc_charge_df
+    c_table_data = table_cells(c_df)
+    ct = Table(c_table_data, colWidths=[40*mm]*3)
+    ct.setStyle(TableStyle([
+        ('FONT', (0,0), (-1,-1), 'IPAexGothic'),
+        ('GRID', (0,0), (-1,-1), 0.5, colors.black),
+        ('BACKGROUND', (0,0), (1,0), colors.lightgrey),
+        ('ALIGN', (0,0), (-1,-1), 'CENTER'),
+    ]))
+    elements.append(ct)
+    elements.append(Spacer(1, 3*mm))
+
+    # 放電実験
+    elements.append(Paragraph("■ 放電実験", styles['Normal']))
+    for i, df in enumerate([s.fc_discharge_1, s.fc_discharge_2, s.fc_discharge_3]):
+        elements.append(Paragraph(f"【{i+1}回目】", styles['Normal']))
+        d_table_data = table_cells(df)
+        dt = Table(d_table_data, colWidths=[25*mm]*5)
+        dt.setStyle(TableStyle([
+            ('FONT', (0,0), (-1,-1), 'IPAexGothic'),
+            ('GRID', (0,0), (-1,-1), 0.5, colors.black),
+            ('BACKGROUND', (0,0), (1,0), colors.lightgrey),
+            ('ALIGN', (0,0), (-1,-1), 'CENTER'),
+            ('FONTSIZE', (0,0), (-1,-1), 8),
+        ]))
+        elements.append(dt)
+        elements.append(Spacer(1, 2*mm))
+    return elements
+
+
+def _section_fuel_cell_graph(s, styles, photo):
+    """実験②: 4. 結果グラフと発生エネルギー"""
+    elements = []
+    # 4. 結果グラフ
+    elements.append(Paragraph("4. 結果グラフ", styles['Heading2']))
+    try:
+        elements.append(Chart(fuel_cell_chart, [s.fc_discharge_1, s.fc_discharge_2, s.fc_discharge_3]))
+    except Exception as e:
+        elements.append(Paragraph(f"グラフ作成エラー: {e}", styles['Normal']))
+
+    caption_style = ParagraphStyle('Caption', parent=styles['Normal'], alignment=TA_CENTER)
+    elements.append(Paragraph("図：放電時の時間と出力の関係", caption_style))
+    elements.append(Spacer(1, 5*mm))
+
+    # 近似仕事量表（画面のまとめ表と同じ値）
+    elements.append(Paragraph("■ 発生エネルギーと出力", styles['Normal']))
+    area_table_data = [["", "1回目", "2回目", "3回目"]] + s.discharge_summary
+    at = Table(area_table_data, colWidths=[40*mm] + [30*mm]*3)
+    at.setStyle(TableStyle([
+        ('FONT', (0,0), (-1,-1), 'IPAexGothic'),
+        ('GRID', (0,0), (-1,-1), 0.5, colors.black),
+        ('BACKGROUND', (0,0), (-1,0), colors.lightgrey),
+        ('BACKGROUND', (0,0), (0,-1), colors.lightgrey),
+        ('ALIGN', (0,0), (-1,-1), 'CENTER'),
+    ]))
+    elements.append(at)
+    elements.append(Spacer(1, 5*mm))
+    return elements
+
+
+def _section_fuel_cell_comparison(s, styles, photo):
+    """実験②: 5. 比較検証・考察"""
+    elements = []
+    # 5. 比較検証・考察
+    elements.append(Paragraph("5. 比較検証・考察", styles['Heading2']))
+    elements.append(Paragraph("【充電条件の比較と考察】", styles['Normal']))
+    elements.append(Paragraph(s.fc_comparison_text, styles['Normal']))
+    return elements
+
+
+def _section_water_results(s, styles, photo):
+    """実験③: 3. 実験結果（写真・試作検討・清澄度）"""
+    elements = []
+    elements.append(Paragraph("3. 実験結果", styles['Heading2']))
+
+    # 実験結果 - 写真とテキスト
+    elements.append(Paragraph("■ 浄化対象の水", styles['Normal']))
+    if s.wt_original_water_photo:
+        try:
+            img = photo("wt_original_water_photo")
+            elements.append(img)
+        except: pass
+    elements.append(Spacer(1, 3*mm))
+
+    elements.append(Paragraph("■ 試作検討①", styles['Heading2']))
+    # 写真並記
+    p1_imgs = []
+    if s.wt_proto1_dev_photo:
+        try:
+             p1_imgs.append(photo("wt_proto1_dev_photo"))
+        except: pass
+    if s.wt_proto1_water_photo:
+        try:
+             p1_imgs.append(photo("wt_proto1_water_photo"))
+        except: pass
+
+    if p1_imgs:
+        t_data = [p1_imgs]
+        t = Table(t_data)
+        t.setStyle(TableStyle([('ALIGN', (0,0), (-1,-1), 'CENTER'), ('VALIGN', (0,0), (-1,-1), 'TOP')]))
+        elements.append(t)
+
+    elements.append(Paragraph("【原理や工夫】", styles['Normal']))
+    elements.append(Paragraph(s.wt_proto1_text, styles['Normal']))
+    elements.append(Spacer(1, 4*mm))
+
+    elements.append(Paragraph("■ 試作検討②", styles['Heading2']))
+    p2_imgs = []
+    if s.wt_proto2_dev_photo:
+        try:
+             p2_imgs.append(photo("wt_proto2_dev_photo"))
+        except: pass
+    if s.wt_proto2_water_photo:
+        try:
+             p2_imgs.append(photo("wt_proto2_water_photo"))
+        except: pass
+
+    if p2_imgs:
+        t_data = [p2_imgs]
+        t = Table(t_data)
+        t.setStyle(TableStyle([('ALIGN', (0,0), (-1,-1), 'CENTER'), ('VALIGN', (0,0), (-1,-1), 'TOP')]))
+        elements.append(t)
+
+    elements.append(Paragraph("【原理や工夫】", styles['Normal']))
+    elements.append(Paragraph(s.wt_proto2_text, styles['Normal']))
+    elements.append(Spacer(1, 4*mm))
+
+    # 清澄度評価
+    elements.append(Paragraph("■ 清澄度評価 (1000点満点)", styles['Heading2']))
+    clarity_df = s.wt_clarity_df
+    c_table_data = table_cells(clarity_df)
+    ct = Table(c_table_data, colWidths=[40*mm]*2)
+    ct.setStyle(TableStyle([
+        ('FONT', (0,0), (-1,-1), 'IPAexGothic'),
+        ('GRID', (0,0), (-1,-1), 0.5, colors.black),
+        ('BACKGROUND', (0,0), (1,0), colors.lightgrey),
+        ('ALIGN', (0,0), (-1,-1), 'CENTER'),
+    ]))
+    elements.append(ct)
+    elements.append(Spacer(1, 4*mm))
+    return elements
+
+
+def _section_water_graph(s, styles, photo):
+    """実験③: 4. 結果グラフ"""
+    elements = []
+    # 4. 結果グラフ
+    elements.append(Paragraph("4. 結果グラフ", styles['Heading2']))
+    try:
+        elements.append(Chart(water_treatment_chart, s.wt_clarity_df))
+    except Exception as e:
+        elements.append(Paragraph(f"グラフ作成エラー: {e}", styles['Normal']))
+
+    caption_style = ParagraphStyle('Caption', parent=styles['Normal'], alignment=TA_CENTER)
+    elements.append(Paragraph("図：水処理装置による浄化の効果", caption_style))
+    elements.append(Spacer(1, 5*mm))
+    return elements
+
+
+def _section_water_coagulation(s, styles, photo):
+    """実験③: 凝集剤の効果"""
+    elements = []
+    # 凝集剤の効果
+    elements.append(Paragraph("■ 凝集剤の効果", styles['Heading2']))
+    if s.wt_coagulation_photo:
+        try:
+            img = photo("wt_coagulation_photo")
+            elements.append(img)
+        except: pass
+    elements.append(Spacer(1, 2*mm))
+    elements.append(Paragraph("【原理】", styles['Normal']))
+    elements.append(Paragraph(s.wt_coagulation_text, styles['Normal']))
+    elements.append(Spacer(1, 5*mm))
+    return elements
+
+
+def _section_water_comparison(s, styles, photo):
+    """実験③: 5. 比較検証・考察"""
+    elements = []
+    # 5. 比較検証・考察
+    elements.append(Paragraph("5. 比較検証・考察", styles['Heading2']))
+    elements.append(Paragraph("【装置の比較（試作① vs 試作②）】", styles['Normal']))
+    elements.append(Paragraph(s.wt_comparison_text, styles['Normal']))
+    return elements
+
+
+def _section_history(s, styles, photo):
+    """6. レポート作成・更新履歴（コピペ防止・証跡）"""
+    elements = []
+    elements.append(Spacer(1, 10*mm))
+    elements.append(Paragraph("6. レポート作成・更新履歴", styles['Heading2']))
+
+    origin = s.get("origin_info", {"created_at": "-", "created_by_id": "-", "created_by_name": "-"})
+    elements.append(Paragraph(f"【オリジナル作成情報】", styles['Normal']))
+    elements.append(Paragraph(f"作成日時: {origin['created_at']}", styles['Normal']))
+    elements.append(Paragraph(f"作成者: {origin['created_by_id']} {origin['created_by_name']}", styles['Normal']))
+    elements.append(Spacer(1, 3*mm))
+
+    elements.append(Paragraph(f"【履歴一覧】", styles['Normal']))
+    table_history_style = ParagraphStyle('TableHistoryStyle', parent=styles['Normal'], fontName='IPAexGothic', fontSize=7, leading=8)
+    history_data = [["日時", "操作内容", "詳細・備考", "実行ユーザー"]]
+    for entry in s.get("history_log", []):
+        history_data.append([
+            Paragraph(str(entry.get("timestamp", "")), table_history_style),
+            Paragraph(str(entry.get("action", "")), table_history_style),
+            Paragraph(str(entry.get("detail", "")), table_history_style),
+            Paragraph(str(entry.get("user", "")), table_history_style)
+        ])
+
+    if len(history_data) > 1:
+        ht = Table(history_data, colWidths=[35*mm, 45*mm, 55*mm, 30*mm])
+        ht.setStyle(TableStyle([
+            ('FONT', (0,0), (-1,-1), 'IPAexGothic'),
+            ('GRID', (0,0), (-1,-1), 0.5, colors.grey),
+            ('BACKGROUND', (0,0), (-1,0), colors.whitesmoke),
+            ('ALIGN', (0,0), (-1,-1), 'LEFT'),
+            ('FONTSIZE', (0,0), (-1,-1), 7),
+            ('VALIGN', (0,0), (-1,-1), 'MIDDLE'),
+        ]))
+        elements.append(ht)
+    return elements
+
+
+# -----------------------
+# セクションごとの作成（フロウアブルのキャッシュ）
+# -----------------------
+# セクション名 → (依存する入力のキー, 作成関数)。依存する入力が前回と同じセクションは作り直さない
+def _report_plan(s):
+    """PDFのセクション構成（この順に並べる）"""
+    questions = [question_key(q) for q in QUESTION_DICT[s.exp_title]]
+    plan = [
+        ("基本情報", ["exp_title", "exp_date", *GLOBAL_KEYS, "achievement"], _section_header),
+        ("調査レポート", ["exp_title", *questions, "references_list"], _section_research),
+        ("実験方法", ["tools_list", "apparatus_photo_data", "evaluation_method"], _section_method),
+    ]
+    if s.exp_title == "実験① 熱の可視化":
+        plan += [
+            ("実験結果", ["melting_point_df", "result_df"], _section_thermal_results),
+            ("結果グラフ", ["result_df", "thermal_fit"], _section_thermal_graph),
+            ("比較検証・考察", ["lit_cu", "lit_al", "lit_sus", "comparison_text", "thermal_conductivity_ref"], _section_thermal_comparison),
+        ]
+    elif s.exp_title == "実験② アルカリ型燃料電池の組み立て":
+        plan += [
+            ("実験結果", ["fc_charge_df", "fc_discharge_1", "fc_discharge_2", "fc_discharge_3"], _section_fuel_cell_results),
+            ("結果グラフ", ["fc_discharge_1", "fc_discharge_2", "fc_discharge_3", "discharge_summary"], _section_fuel_cell_graph),
+            ("比較検証・考察", ["fc_comparison_text"], _section_fuel_cell_comparison),
+        ]
+    elif s.exp_title == "実験③ 水処理装置の設計と提案":
+        plan += [
+            ("実験結果", [
+                "wt_original_water_photo", "wt_proto1_dev_photo", "wt_proto1_water_photo", "wt_proto1_text",
+                "wt_proto2_dev_photo", "wt_proto2_water_photo", "wt_proto2_text", "wt_clarity_df",
+            ], _section_water_results),
+            ("結果グラフ", ["wt_clarity_df"], _section_water_graph),
+            ("凝集剤の効果", ["wt_coagulation_photo", "wt_coagulation_text"], _section_water_coagulation),
+            ("比較検証・考察", ["wt_comparison_text"], _section_water_comparison),
+        ]
+    plan.append(("更新履歴", ["origin_info", "history_log"], _section_history))
+    return plan
+
+
+def _report_styles():
+    styles = getSampleStyleSheet()
+
+    # 日本語フォント設定
+    styles['Normal'].fontName = 'IPAexGothic'
+    styles['Title'].fontName = 'IPAexGothic'
+    styles['Heading2'].fontName = 'IPAexGothic'
+    return styles
+
+
+def _embed_photos(s, store, dpi):
+    """PDFに埋め込む写真（項目名 → バイト列）。各写真を枠に合わせてスレッドプールで縮小する
+
+    Pillow は縮小・JPEG圧縮の間 GIL を手放すので、スレッドで並列に処理できる。
+    同じ写真が複数の枠に使われているときは、最も大きい枠に合わせて1回だけ縮小する
+    （ReportLab は同じバイト列の画像を1つにまとめて埋め込むため）。
+    dpi が None のときは取り込み済みの写真をそのまま使う。
+    """
+    originals = {}  # 項目名 → 写真のハッシュ
+    frames = {}  # 写真のハッシュ → (バイト列, 最大の幅, 最大の高さ)
+    for key, (width, height) in PHOTO_FRAMES.items():
+        value = s.get(key)
+        data = photo_bytes(value, store) if value else None
+        if not data:
+            continue
+        digest = value[len(PHOTO_REF_PREFIX):] if is_photo_ref(value) else photo_digest(data)
+        originals[key] = digest
+        _, w, h = frames.get(digest, (data, 0, 0))
+        frames[digest] = (data, max(w, width), max(h, height))
+    if dpi is None or not frames:
+        return {key: frames[digest][0] for key, digest in originals.items()}
+    with ThreadPoolExecutor(max_workers=min(len(frames), os.cpu_count() or 1)) as ex:
+        futures = {
+            digest: ex.submit(resample_for_frame, data, width, height, dpi=dpi, digest=digest)
+            for digest, (data, width, height) in frames.items()
+        }
+        embedded = {digest: f.result() for digest, f in futures.items()}
+    return {key: embedded[digest] for key, digest in originals.items()}
+
+
+def _section_flowables(name, s, deps, builder, styles, photos):
+    """1セクション分のフロウアブル（依存する入力が同じならキャッシュから）"""
+    # 作成関数には依存するキーだけを渡す（宣言漏れがあれば AttributeError で分かる）
+    view = ReportState({k: s[k] for k in deps if k in s})
+    # 埋め込む写真は他の枠での使われ方でも変わるので、縮小後の内容もキーに含める
+    embedded = [photo_digest(photos[k]) for k in deps if k in photos]
+    key = content_hash("pdf_section", name, builder.__name__, *embedded, *[view.get(k) for k in deps])
+
+    def photo(k):
+        # 項目 k の写真を枠に収めた Image
+        return create_proportional_image(BytesIO(photos[k]), *PHOTO_FRAMES[k])
+
+    with measure_cpu(f"PDF {name}"):
+        flowables = _section_cache.get_or_create(key, lambda: builder(view, styles, photo))
+        # doc.build はフロウアブルの状態を書き換えるので、キャッシュの中身ではなくコピーを使う
+        return copy.deepcopy(flowables)
+
+
+def build_report_pdf(s, store, progress=None, photo_dpi=PHOTO_DPI):
+    """入力状態 s と写真ストアから提出用PDFのバイト列を作る
+
+    store は写真参照 → バイト列を get() で引けるもの（PhotoStore または辞書）。
+    progress(セクション名, 進捗0～1) を渡すと、各セクションに入るときに呼ぶ。
+    写真は枠に収めたときに photo_dpi になるよう縮小して埋め込む（None なら取り込み済みのまま）。
+    各セクションの作成時間は perf に「PDF <セクション名>」として記録する。
+    安全上の注意事項の確認は呼び出し側で済ませておくこと（PDFには「全項目確認済み」と出る）。
+    """
+    ensure_pdf_fonts()
+    s = ReportState(s)
+    s["achievement"] = achievement_rate(s)
+    if s.get("exp_title") == "実験① 熱の可視化":
+        # 融解時間の近似も、ロガーから取り込んだ表は全点の記録で計算する
+        s["thermal_fit"] = thermal_fit_rows(full_table(s, "result_df", store), [s.get("lit_cu"), s.get("lit_al"), s.get("lit_sus")])
+    elif s.get("exp_title") == "実験② アルカリ型燃料電池の組み立て":
+        # 発生エネルギーは、ロガーから取り込んだ回は全点の記録で計算する（表は間引いてある）
+        s["discharge_summary"] = discharge_summary_rows(
+            [full_table(s, k, store) for k in ("fc_discharge_1", "fc_discharge_2", "fc_discharge_3")])
+    styles = _report_styles()
+
+    plan = _report_plan(s)
+    steps = len(plan) + 2
+    if progress:
+        progress("写真の縮小", 0.0)
+    with measure_cpu("PDF 写真の縮小"):
+        photos = _embed_photos(s, store, photo_dpi)
+
+    elements = []
+    for i, (name, deps, builder) in enumerate(plan, start=1):
+        if progress:
+            progress(name, i / steps)
+        elements += _section_flowables(name, s, deps, builder, styles, photos)
+
+    if progress:
+        progress("PDFの組版", (len(plan) + 1) / steps)
+    with measure_cpu("PDF 組版"):
+        buffer = BytesIO()
+        # invariant: 作成日時・文書IDを固定し、同じ入力から同じバイト列を作る
+        doc = SimpleDocTemplate(buffer, pagesize=A4, invariant=1)
+        doc.build(elements)
+    if progress:
+        progress("完了", 1.0)
+    return buffer.getvalue()
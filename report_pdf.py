@@ -0,0 +1,339 @@
+# -*- coding: utf-8 -*-
+"""提出用PDFの作成（Streamlitに依存しない）
+
+画面の「提出用ファイルの作成」ボタンと、コマンドラインの両方から同じ処理でPDFを作る。
+入力は属性で値を読める入力状態（st.session_state または ReportState）と写真ストア。
+組版（ReportLab）は report_layout.py にあり、最初にPDFを作るときに読み込む。
+
+    python -m report_pdf render 保存ファイル.zip -o out.pdf [--title 実験タイトル]
+    python -m report_pdf batch 保存ファイルのフォルダ -o 出力フォルダ [-j プロセス数]
+
+保存ファイルは新形式（ZIP）・旧形式（JSON）のどちらでもよい。
+batch はクラス全員分などの保存ファイルをプロセスプールで並列にPDF化し、
+結果（所要時間・サイズ・エラー）を summary.csv に書き出す。
+"""
+import argparse
+import csv
+import os
+import sys
+import time
+import zipfile
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import date
+
+import pandas as pd
+
+from archive import ArchiveError, load_save_file, materialize_exp_state
+from caching import LRUCache, content_hash
+from derived import derive_table
+from photos import PhotoStore
+from scoring import QUESTION_DICT
+from tables import TABLE_SCHEMAS, coerce_table, empty_table
+
+# テーマごとに管理するデータキー（画面の入力状態・保存データの experiment_registry の各テーマ）
+EXP_DATA_KEYS = [
+    "tools_list", "references_list", "evaluation_method",
+    "melting_point_df", "result_df", "result_df_log", "lit_cu", "lit_al", "lit_sus", "thermal_conductivity_ref", "comparison_text", "apparatus_photo_data",
+    "fc_charge_df", "fc_discharge_1", "fc_discharge_2", "fc_discharge_3", "fc_discharge_1_log", "fc_discharge_2_log", "fc_discharge_3_log", "fc_comparison_text",
+    "wt_original_water_photo", "wt_proto1_dev_photo", "wt_proto1_water_photo", "wt_proto1_text", "wt_proto2_dev_photo", "wt_proto2_water_photo", "wt_proto2_text", "wt_clarity_df", "wt_coagulation_photo", "wt_coagulation_text", "wt_comparison_text"
+]
+
+# 保存データの文字列の表（レコードのリスト）と、空のときの列（測定表は tables.TABLE_SCHEMAS）
+TABLE_COLUMNS = {
+    "tools_list": ["器具・装置・薬品名", "用途・役割など"],
+    "references_list": ["書籍名・サイト名", "著者・発行者", "発行年・URL"],
+}
+
+# 基本情報（保存データの global_info）のうち、PDFに載せる項目
+GLOBAL_KEYS = [
+    "class_name", "seat_number", "student_id", "student_name",
+    "partner1_id", "partner1_name", "partner2_id", "partner2_name",
+]
+
+
+# 更新履歴に記録する、PDF出力の操作名
+PDF_OUTPUT_ACTION = "最終提出PDFの出力"
+
+# 作成済みPDFのキャッシュ（キーは入力内容のハッシュ）。同じ入力なら同じバイト列になる
+PDF_CACHE_SIZE = 32
+_pdf_cache = LRUCache(maxsize=PDF_CACHE_SIZE)
+
+class ReportError(Exception):
+    """保存データからPDFを作れない（テーマがない等）"""
+
+
+# 保存ファイルが読めない・PDFにできないときの例外（コマンドラインではメッセージだけを表示する）
+SAVE_FILE_ERRORS = (OSError, ValueError, ReportError, ArchiveError, zipfile.BadZipFile)
+
+
+class ReportState(dict):
+    """保存データから組み立てた入力状態（st.session_state と同じく属性でも読める）"""
+
+    def __getattr__(self, name):
+        try:
+            return self[name]
+        except KeyError:
+            raise AttributeError(f"保存データに {name} がありません") from None
+
+
+def default_exp_value(key):
+    """保存データにない項目の既定値（画面の未入力の状態と同じ）"""
+    if key in TABLE_SCHEMAS:
+        return empty_table(key)
+    if key in TABLE_COLUMNS:
+        return pd.DataFrame(columns=TABLE_COLUMNS[key])
+    if key.endswith(("_photo", "_photo_data", "_log")):
+        return None  # 写真・ロガーの記録（photo_store への参照）
+    return ""
+
+
+def state_from_save(data, store, title=None):
+    """保存データ（load_save_file の戻り値）から1テーマ分の入力状態を組み立てる
+
+    title を省略すると、保存時に開いていたテーマ（global_info の last_exp_title）を使う。
+    写真は store に登録し、入力状態には参照を入れる。
+    保存データにない項目（以前のバージョンで保存したファイルなど）は未入力の状態にする。
+    """
+    g = data.get("global_info", {})
+    registry = data.get("experiment_registry")
+    if registry is None:
+        # 旧形式: レジストリがなくトップレベルが現在のテーマのデータ
+        title = title or data.get("exp_title") or g.get("last_exp_title")
+        exp = data
+    else:
+        title = title or g.get("last_exp_title") or next(iter(registry), None)
+        if title not in registry:
+            raise ReportError(f"保存データに「{title}」のデータがありません")
+        exp = materialize_exp_state(registry[title])
+    if title not in QUESTION_DICT:
+        raise ReportError(f"実験タイトルが不明です: {title}")
+
+    s = ReportState(exp_title=title)
+    s["exp_date"] = date.fromisoformat(g["exp_date"]) if g.get("exp_date") else ""
+    for k in GLOBAL_KEYS:
+        s[k] = g.get(k, "")
+    for k, v in exp.items():
+        if k in TABLE_SCHEMAS:
+            # 測定表は数値の型にそろえ（以前の文字列の保存データもここで変換）、派生列を計算し直す
+            s[k] = derive_table(k, coerce_table(k, v))
+        elif k in TABLE_COLUMNS:
+            df = pd.DataFrame(v)
+            if TABLE_COLUMNS[k] and df.empty:
+                df = pd.DataFrame(columns=TABLE_COLUMNS[k])
+            s[k] = df
+        elif k.startswith("check_"):
+            s[k] = v if isinstance(v, bool) else False
+        elif k.endswith("_photo") or k.endswith("_photo_data"):
+            s[k] = store.import_value(v)
+        else:
+            s[k] = v
+    for k in EXP_DATA_KEYS:
+        if k not in s:
+            s[k] = default_exp_value(k)
+    s["origin_info"] = data.get("origin_info", {"created_at": "-", "created_by_id": "-", "created_by_name": "-"})
+    s["history_log"] = data.get("history_log", [])
+    return s
+
+
+def report_filename(s):
+    """提出用PDFのファイル名"""
+    return f"{s.student_id}_{s.student_name}_{s.exp_title}.pdf".replace(" ", "_").replace("　", "_")
+
+
+# -----------------------
+# 作成済みPDFのキャッシュ
+# -----------------------
+def report_cache_key(s):
+    """PDFの内容を決める入力すべてのハッシュ
+
+    写真は参照（"sha256:..."）なのでハッシュで、更新履歴も含めて比較する。
+    安全確認のチェック（check_*）はPDFの内容に影響しないので含めない。
+    """
+    parts = []
+    for k in sorted(s):
+        if k.startswith("check_"):
+            continue
+        parts += [k, s[k]]
+    return content_hash("report_pdf", *parts)
+
+
+def resolve_report_input(s):
+    """PDF出力の対象とキャッシュキーを決める
+
+    更新履歴の最後が、いまと同じ内容のPDF出力（content_id が一致）なら、
+    その履歴を除いた入力（＝前回と同じPDF）を対象にし、履歴は追加しない。
+    何度ボタンを押しても、内容が変わらなければ同じPDF・同じ履歴になる。
+
+    戻り値: (キャッシュキー, PDFにする入力状態, PDF出力の履歴を追加するか)
+    """
+    history = s.get("history_log") or []
+    if history and history[-1].get("action") == PDF_OUTPUT_ACTION and history[-1].get("content_id"):
+        prev = ReportState(s)
+        prev["history_log"] = history[:-1]
+        key = report_cache_key(prev)
+        if history[-1]["content_id"] == key:
+            return key, prev, False
+    return report_cache_key(s), s, True
+
+
+def build_report_pdf(s, store, progress=None):
+    """入力状態 s と写真ストアから提出用PDFのバイト列を作る（report_layout.build_report_pdf）
+
+    ReportLab は重いので、画面の起動時ではなく最初にPDFを作るときに読み込む。
+    """
+    from report_layout import build_report_pdf as build
+    return build(s, store, progress)
+
+
+def cached_report_pdf(key):
+    """作成済みのPDF（なければ None）"""
+    return _pdf_cache.get(key)
+
+
+def render_report_pdf(s, store, progress=None, key=None):
+    """キャッシュを使ってPDFを作る（同じ入力の2回目以降は作り直さない）"""
+    key = key or report_cache_key(s)
+    return _pdf_cache.get_or_create(key, lambda: build_report_pdf(s, store, progress))
+
+
+def render_save_file(fileobj, title=None):
+    """保存ファイルからPDFを作り、(PDFのバイト列, ファイル名) を返す"""
+    store = PhotoStore()
+    data = load_save_file(fileobj, store, eager_title=title)
+    s = state_from_save(data, store, title)
+    return build_report_pdf(s, store), report_filename(s)
+
+
+# -----------------------
+# 一括作成（プロセスプール）
+# -----------------------
+SAVE_FILE_EXTS = (".zip", ".json")
+SUMMARY_NAME = "summary.csv"
+SUMMARY_FIELDS = ["source", "status", "output", "student_id", "student_name", "exp_title", "render_sec", "pdf_bytes", "error"]
+
+
+def _init_worker():
+    # ReportLab の読み込みとフォント登録はワーカープロセスごとに1回だけ
+    import report_layout
+    report_layout.ensure_pdf_fonts()
+
+
+def _render_one(path, out_dir, title=None):
+    """1つの保存ファイルをPDF化する（ワーカープロセスで実行。例外は結果に入れて返す）"""
+    row = {"source": os.path.basename(path), "status": "ok"}
+    t0 = time.perf_counter()
+    try:
+        store = PhotoStore()
+        with open(path, "rb") as f:
+            data = load_save_file(f, store, eager_title=title)
+        s = state_from_save(data, store, title)
+        row.update(student_id=s.student_id, student_name=s.student_name, exp_title=s.exp_title)
+        pdf = build_report_pdf(s, store)
+        # 出力名は入力ファイル名から決める（同じ学生の保存ファイルが複数あっても上書きしない）
+        out = os.path.join(out_dir, os.path.splitext(row["source"])[0] + ".pdf")
+        with open(out, "wb") as f:
+            f.write(pdf)
+        row.update(output=os.path.basename(out), pdf_bytes=len(pdf))
+    except SAVE_FILE_ERRORS as e:
+        # render と同じく、読めない保存ファイルはメッセージだけを記録する
+        row.update(status="error", error=str(e))
+    except Exception as e:
+        row.update(status="error", error=f"{type(e).__name__}: {e}")
+    row["render_sec"] = round(time.perf_counter() - t0, 3)
+    return row
+
+
+def find_save_files(directory):
+    """フォルダ直下の保存ファイル（.zip / .json）を名前順に返す"""
+    return sorted(
+        os.path.join(directory, n) for n in os.listdir(directory)
+        if n.lower().endswith(SAVE_FILE_EXTS) and os.path.isfile(os.path.join(directory, n))
+    )
+
+
+def render_batch(paths, out_dir, title=None, workers=None, progress=None):
+    """保存ファイルを並列にPDF化し、ファイルごとの結果（辞書）のリストを入力順で返す
+
+    1つのファイルの失敗は他に影響しない（結果の status が "error" になる）。
+    progress(完了数, 総数, 結果) を渡すと1件終わるごとに呼ぶ。
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    results = {}
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as pool:
+        futures = {pool.submit(_render_one, p, out_dir, title): p for p in paths}
+        for n, fut in enumerate(as_completed(futures), 1):
+            path = futures[fut]
+            try:
+                row = fut.result()
+            except Exception as e:
+                # ワーカープロセス自体が落ちた場合など
+                row = {"source": os.path.basename(path), "status": "error", "error": f"{type(e).__name__}: {e}"}
+            results[path] = row
+            if progress:
+                progress(n, len(paths), row)
+    return [results[p] for p in paths]
+
+
+def write_summary(rows, path):
+    """一括作成の結果をCSVに書く（Excelで開けるようBOM付きUTF-8）"""
+    with open(path, "w", newline="", encoding="utf-8-sig") as f:
+        w = csv.DictWriter(f, fieldnames=SUMMARY_FIELDS)
+        w.writeheader()
+        for r in rows:
+            w.writerow({k: r.get(k, "") for k in SUMMARY_FIELDS})
+
+
+def _print_progress(n, total, row):
+    if row["status"] == "ok":
+        detail = f"{row['output']} {row['pdf_bytes']} bytes"
+    else:
+        detail = row["error"]
+    print(f"[{n}/{total}] {row['source']}: {row['status']} {row.get('render_sec', 0):.2f}s {detail}", flush=True)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m report_pdf", description="保存ファイルから提出用PDFを作成する")
+    sub = parser.add_subparsers(dest="command", required=True)
+    p = sub.add_parser("render", help="保存ファイル（.zip / .json）からPDFを作成")
+    p.add_argument("path", help="復元用ファイル（.zip または旧形式の .json）")
+    p.add_argument("-o", "--output", help="出力先のPDF（省略時は提出用と同じファイル名でカレントディレクトリへ）")
+    p.add_argument("--title", help="PDFにする実験タイトル（省略時は保存時に開いていたテーマ）")
+    b = sub.add_parser("batch", help="フォルダ内の保存ファイルをまとめて並列にPDF化")
+    b.add_argument("directory", help="保存ファイル（.zip / .json）を置いたフォルダ")
+    b.add_argument("-o", "--output", required=True, help="PDFと summary.csv の出力先フォルダ")
+    b.add_argument("-j", "--jobs", type=int, default=None, help="並列プロセス数（省略時はCPUコア数）")
+    b.add_argument("--title", help="PDFにする実験タイトル（省略時は各ファイルの保存時のテーマ）")
+    args = parser.parse_args(argv)
+
+    if args.command == "batch":
+        return _main_batch(args)
+
+    try:
+        with open(args.path, "rb") as f:
+            pdf, filename = render_save_file(f, args.title)
+    except SAVE_FILE_ERRORS as e:
+        print(f"エラー: {e}", file=sys.stderr)
+        return 1
+    out = args.output or os.path.join(os.getcwd(), filename)
+    with open(out, "wb") as f:
+        f.write(pdf)
+    print(f"{out} ({len(pdf)} bytes)")
+    return 0
+
+
+def _main_batch(args):
+    paths = find_save_files(args.directory)
+    if not paths:
+        print(f"保存ファイルがありません: {args.directory}", file=sys.stderr)
+        return 1
+    t0 = time.perf_counter()
+    rows = render_batch(paths, args.output, args.title, args.jobs, progress=_print_progress)
+    summary = os.path.join(args.output, SUMMARY_NAME)
+    write_summary(rows, summary)
+    failed = sum(r["status"] != "ok" for r in rows)
+    print(f"{len(rows) - failed}/{len(rows)} 件成功 ({time.perf_counter() - t0:.1f}s) → {summary}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,213 @@
+# -*- coding: utf-8 -*-
+"""設問と簡易自己評価（達成度）の計算
+
+画面（サイドバーの達成度表示）とPDF（report_pdf）の両方から使う。
+入力状態は st.session_state に限らず、属性で値を読めるマッピングであればよい。
+測定表は数値の型（空欄は NaN。tables.py）なので、入力済みのセルは notna で数える。
+"""
+import pandas as pd
+
+# -----------------------
+# 設問辞書
+# -----------------------
+QUESTION_DICT = {
+    "実験① 熱の可視化": {
+        "熱伝導って何？": ["高温","低温","エネルギー"],
+        "固体の中で熱が伝わる仕組みは？": ["原子","格子振動","自由電子"],
+        "物質による伝わりやすさの違いは？": ["熱伝導率","流体","断熱材"]
+    },
+    "実験② アルカリ型燃料電池の組み立て": {
+        "アルカリ型燃料電池って何？": ["水素","アルカリ","水"],
+        "電池で発電できる仕組みは？": ["材料の反応性の違い","起電力","電子やイオンの動き"],
+        "組み立てで大切な工夫は？": ["触媒","安全上気を付けること"]
+    },
+    "実験③ 水処理装置の設計と提案": {
+        "水の利用と機械の関係": ["浄水","下水","ポンプ"],
+        "水の汚れとは？水を綺麗にする仕組み": [],
+        "作製した装置で工夫したポイント": []
+    }
+}
+
+
+def question_key(q):
+    """設問の回答を保持するキー（"設問_..."）"""
+    return "設問_" + q.replace("？","").replace(" ","_")
+
+
+# -----------------------
+# 採点ロジック関数
+# -----------------------
+def achievement_rate(s):
+    """簡易自己評価（自宅課題・レポート・合計[%]、基本情報がデフォルトのままか）を返す
+
+    s: 入力状態（st.session_state または report_pdf.ReportState）
+    """
+    score_home = 0.0
+    score_report = 0.0
+    
+    # 1. 自宅課題 (50%)
+    # 設問回答 (40%)
+    q_dict = QUESTION_DICT.get(s.exp_title, {})
+    if q_dict:
+        pts_per_q = 40.0 / len(q_dict)
+        for q, words in q_dict.items():
+            key_name = question_key(q)
+            ans = str(s.get(key_name, ""))
+            
+            # (1) 入力あり: 30%
+            if ans.strip():
+                score_home += pts_per_q * 0.3
+            
+            # (2) 200文字以上: 40%
+            if len(ans) >= 200:
+                score_home += pts_per_q * 0.4
+            elif len(ans) >= 100: # 部分点
+                score_home += pts_per_q * 0.2
+            
+            # (3) 必須語句: 30%
+            if words:
+                all_found = True
+                for w in words:
+                    if w not in ans:
+                        all_found = False
+                        break
+                if all_found:
+                    score_home += pts_per_q * 0.3
+
+    # 参考文献 (10%)
+    has_ref = False
+    default_titles = ["物理基礎 改訂版", "国立天文台 理科年表オフィシャルサイト"]
+    
+    if not s.references_list.empty:
+        for _, row in s.references_list.iterrows():
+             title = str(row.get("書籍名・サイト名", "")).strip()
+             # 空白でなく、かつデフォルト例そのままでない場合のみ加点対象とする
+             if title and (title not in default_titles):
+                 has_ref = True
+                 break
+    if has_ref:
+        score_home += 10.0
+
+    # 2. レポート点 (50%)
+    # 基本情報 (5%)
+    # デフォルト値の確認
+    is_default_basic = (s.student_id == "00") or (s.student_name == "高専 太郎")
+    
+    if s.class_name and s.student_id and s.student_name:
+        # デフォルトのままなら加点しない
+        if not is_default_basic:
+            score_report += 5.0
+    
+    # 実験方法 (10%)
+    # 器具 (4%)
+    has_tools = False
+    if not s.tools_list.empty:
+        for _, row in s.tools_list.iterrows():
+             if str(row.iloc[0]).strip():
+                 has_tools = True
+                 break
+    if has_tools: score_report += 4.0
+    
+    # 写真 (4%)
+    if s.exp_title == "実験③ 水処理装置の設計と提案":
+        # 試作①か②の装置写真があれば加点
+        if s.wt_proto1_dev_photo or s.wt_proto2_dev_photo:
+            score_report += 4.0
+    else:
+        if s.apparatus_photo_data:
+            score_report += 4.0
+    
+    # 評価方法 (2%)
+    if s.exp_title == "実験③ 水処理装置の設計と提案":
+        # 清澄度の入力があれば加点
+        c_df = s.wt_clarity_df
+        try:
+            # clean index issue using iloc
+            if c_df[["試作検討①", "試作検討②"]].iloc[0].notna().any():
+                score_report += 2.0
+        except: pass
+    else:
+        if s.evaluation_method:
+            score_report += 2.0
+
+    if s.exp_title == "実験① 熱の可視化":
+        # 実験結果 (20%)
+        # 融解平均 (5%)
+        try:
+            if pd.notna(s.melting_point_df["平均(℃)"].iloc[0]):
+                 score_report += 5.0
+        except:
+            pass
+            
+        # 結果データ (15%)
+        r_cols = ["銅(sec)", "アルミ(sec)", "ステンレス(sec)"]
+        total_cells = len(s.result_df) * 3
+        filled_cells = int(s.result_df[r_cols].notna().to_numpy().sum())
+        if total_cells > 0:
+            score_report += 15.0 * (filled_cells / total_cells)
+
+        # 考察 (15%)
+        # 文献値 (5%)
+        if s.lit_cu and s.lit_al and s.lit_sus:
+            score_report += 5.0
+        
+        # 引用 (2%)
+        if s.thermal_conductivity_ref:
+            score_report += 2.0
+        
+        # 本文 (8%)
+        if len(s.comparison_text) > 20: 
+            score_report += 8.0
+
+    elif s.exp_title == "実験② アルカリ型燃料電池の組み立て":
+        # 実験結果 (20%)
+        # 充電データあり (5%)
+        filled_charge = int(s.fc_charge_df[["充電時間(sec)", "充電電圧(V)", "開回路電圧(V)"]].notna().to_numpy().sum())
+        if filled_charge > 5: # ある程度埋まっていれば
+             score_report += 5.0
+
+        # 放電データ (15%)
+        # 3回分（各回 5%）。各回は電圧・電流の2項目 × 表の行数のうち入力済みの割合
+        # （データロガーから取り込んだ表は行数が多いので、各回の行数で割って1回分が5%を超えないようにする）
+        for df in [s.fc_discharge_1, s.fc_discharge_2, s.fc_discharge_3]:
+            slots = len(df) * 2
+            if slots > 0:
+                filled = int(df[["端子電圧(V)", "電流(mA)"]].notna().to_numpy().sum())
+                score_report += 5.0 * min(filled / slots, 1.0)
+
+        # 考察 (15%)
+        # 本文のみ (15%)
+        if len(s.fc_comparison_text) > 20:
+            score_report += 15.0
+
+    elif s.exp_title == "実験③ 水処理装置の設計と提案":
+         # 実験結果 (20%)
+         # 写真の有無 (10%)
+         photo_count = 0
+         for k in ["wt_original_water_photo", "wt_proto1_dev_photo", "wt_proto1_water_photo", 
+                   "wt_proto2_dev_photo", "wt_proto2_water_photo", "wt_coagulation_photo"]:
+             if s.get(k): photo_count += 1
+         
+         if photo_count >= 6: score_report += 10.0
+         elif photo_count >= 3: score_report += 5.0
+         
+         # 記述とデータ (10%)
+         item_count = 0
+         if len(s.wt_proto1_text) > 10: item_count += 1
+         if len(s.wt_proto2_text) > 10: item_count += 1
+         if len(s.wt_coagulation_text) > 10: item_count += 1
+         
+         # 清澄度
+         c_df = s.wt_clarity_df
+         try:
+             if c_df[["試作検討①", "試作検討②"]].iloc[0].notna().all():
+                 item_count += 1
+         except: pass
+             
+         score_report += 10.0 * (item_count / 4.0)
+         
+         # 考察 (15%)
+         if len(s.wt_comparison_text) > 20:
+             score_report += 15.0
+
+    return int(score_home), int(score_report), int(score_home + score_report), is_default_basic
@@ -0,0 +1,133 @@
+# -*- coding: utf-8 -*-
+"""測定値の表の型（実験ごとに1か所で宣言する）
+
+測定値の列はすべて float64 で持ち、空欄は NaN にする。文字列で持たないので、
+グラフ・派生列・達成率・発生エネルギーは pd.to_numeric で読み直さずにそのまま計算できる。
+
+保存データ（JSON）には NaN を null として書き出す（table_records）。
+以前の保存データは測定値が文字列（空欄は ""）なので、復元するときに
+coerce_table で一度だけ数値に変換する。
+"""
+from typing import NamedTuple
+
+import numpy as np
+import pandas as pd
+
+
+class Number(NamedTuple):
+    """数値の列（data_editor の入力の刻み・範囲）"""
+    step: float
+    min_value: float = None
+    max_value: float = None
+
+
+class TableSchema(NamedTuple):
+    """測定表1つ分の型
+
+    columns: 列名 → Number（宣言順が表の列順）
+    defaults: 既定値のある列（距離・放電時間など）。ほかの列は空欄（NaN）で始まる
+    index: 行ラベル（行数固定の表）。None なら 0, 1, ... の行番号
+    """
+    columns: dict
+    rows: int = 1
+    defaults: dict = {}
+    index: list = None
+
+
+MELTING_POINT_SCHEMA = TableSchema(
+    columns={"1回目(℃)": Number(0.1), "2回目(℃)": Number(0.1), "3回目(℃)": Number(0.1), "平均(℃)": Number(0.1)},
+    index=["融解温度(℃)"],
+)
+THERMAL_RESULT_SCHEMA = TableSchema(
+    columns={
+        "距離(cm)": Number(1, min_value=0),
+        "銅(sec)": Number(1, min_value=0),
+        "アルミ(sec)": Number(1, min_value=0),
+        "ステンレス(sec)": Number(1, min_value=0),
+    },
+    rows=6,
+    defaults={"距離(cm)": [2, 4, 6, 8, 10, 12]},
+)
+FC_CHARGE_SCHEMA = TableSchema(
+    columns={"充電時間(sec)": Number(1, min_value=0), "充電電圧(V)": Number(0.01), "開回路電圧(V)": Number(0.01)},
+    index=["1回目", "2回目", "3回目"],
+)
+# 「エネルギー(J)」列の代替として出力(mW)を使用し、面積でJを議論
+FC_DISCHARGE_SCHEMA = TableSchema(
+    columns={
+        "放電時間(分)": Number(1, min_value=0),
+        "放電時間(sec)": Number(1, min_value=0),
+        "端子電圧(V)": Number(0.01),
+        "電流(mA)": Number(0.1),
+        "出力(mW)": Number(0.01),
+    },
+    rows=4,
+    defaults={"放電時間(分)": [0, 5, 10, 15], "放電時間(sec)": [0, 300, 600, 900]},
+)
+WT_CLARITY_SCHEMA = TableSchema(
+    columns={
+        "浄化対象の水": Number(1, min_value=0, max_value=1000),
+        "試作検討①": Number(1, min_value=0, max_value=1000),
+        "試作検討②": Number(1, min_value=0, max_value=1000),
+    },
+    index=["清澄度"],
+)
+
+# セッションステートのキー → 表の型
+TABLE_SCHEMAS = {
+    "melting_point_df": MELTING_POINT_SCHEMA,
+    "result_df": THERMAL_RESULT_SCHEMA,
+    "fc_charge_df": FC_CHARGE_SCHEMA,
+    "fc_discharge_1": FC_DISCHARGE_SCHEMA,
+    "fc_discharge_2": FC_DISCHARGE_SCHEMA,
+    "fc_discharge_3": FC_DISCHARGE_SCHEMA,
+    "wt_clarity_df": WT_CLARITY_SCHEMA,
+}
+
+
+def empty_table(key):
+    """測定表の初期状態（既定値の列以外は空欄）"""
+    schema = TABLE_SCHEMAS[key]
+    rows = len(schema.index) if schema.index else schema.rows
+    data = {col: np.asarray(schema.defaults.get(col, [np.nan] * rows), dtype="float64") for col in schema.columns}
+    return pd.DataFrame(data, index=schema.index)
+
+
+def coerce_table(key, value):
+    """保存データ（行の辞書のリスト）や DataFrame を型どおりの測定表にする
+
+    文字列の測定値（以前の保存データ）は数値に、空欄や数値でない値は NaN にする。
+    足りない列は空欄で補い、行数固定の表は行ラベルを付け直す。
+    """
+    schema = TABLE_SCHEMAS[key]
+    df = value.copy() if isinstance(value, pd.DataFrame) else pd.DataFrame(value)
+    if df.empty and not len(df.columns):
+        return empty_table(key)
+    for col in schema.columns:
+        if col not in df.columns:
+            df[col] = np.nan
+        elif df[col].dtype != "float64":
+            df[col] = pd.to_numeric(df[col], errors="coerce").astype("float64")
+    df = df[list(schema.columns) + [c for c in df.columns if c not in schema.columns]]
+    if schema.index and len(df) == len(schema.index):
+        df.index = schema.index
+    return df
+
+
+def table_records(df):
+    """DataFrame を保存用の行の辞書のリストにする（NaN は null で書き出す）"""
+    return df.astype(object).where(df.notna(), None).to_dict(orient="records")
+
+
+def format_number(value):
+    """表示用の文字列（空欄は ""、整数値は小数点なし）"""
+    if value is None or (isinstance(value, float) and np.isnan(value)):
+        return ""
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return f"{value:g}" if isinstance(value, float) else str(value)
+
+
+def table_cells(df):
+    """PDFの表のセル（見出し行＋各行。数値は format_number で文字列にする）"""
+    return [df.columns.tolist()] + [[format_number(v) for v in row] for row in df.itertuples(index=False)]
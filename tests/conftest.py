@@ -0,0 +1,8 @@
+# -*- coding: utf-8 -*-
+"""テスト共通の設定（app.py と同じ階層のモジュールを import できるようにする）"""
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+"""自動保存（autosave.py）の書き込み・読み出し・写真の後片付け"""
+import json
+import sqlite3
+
+import pytest
+
+import autosave
+from autosave import AutosaveStore
+from photos import PHOTO_REF_PREFIX
+
+
+def ref_of(name):
+    return PHOTO_REF_PREFIX + name * 8
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    monkeypatch.setattr(autosave, "DEBOUNCE_SEC", 0.01)
+    return AutosaveStore(str(tmp_path))
+
+
+def photo_refs(store):
+    conn = sqlite3.connect(store.path)
+    try:
+        return {r for (r,) in conn.execute("SELECT ref FROM photos")}
+    finally:
+        conn.close()
+
+
+def test_round_trip(store):
+    store.submit("01", "実験①", {"student_name": json.dumps("山田"), "score": json.dumps(3)})
+    store.submit("01", "実験①", {"score": json.dumps(4)})
+    assert store.flush(5)
+    state, photos = store.load("01", "実験①")
+    assert state == {"student_name": "山田", "score": 4}
+    assert photos == {}
+    assert store.last_saved_at("01", "実験①") is not None
+    assert store.last_saved_at("02", "実験①") is None
+
+
+def test_flush_waits_for_every_submit(store):
+    # submit の直後に flush しても、必ずその値が書かれてから戻る
+    for i in range(50):
+        store.submit("01", "実験①", {"n": json.dumps(i)})
+        assert store.flush(5)
+        state, _ = store.load("01", "実験①")
+        assert state["n"] == i
+
+
+def test_replaced_photo_is_deleted(store):
+    a, b = ref_of("a"), ref_of("b")
+    store.submit("01", "実験①", {"photo": json.dumps(a)}, {a: b"A"})
+    assert store.flush(5)
+    assert photo_refs(store) == {a}
+    store.submit("01", "実験①", {"photo": json.dumps(b)}, {b: b"B"})
+    assert store.flush(5)
+    assert photo_refs(store) == {b}
+    state, photos = store.load("01", "実験①")
+    assert state["photo"] == b and photos == {b: b"B"}
+
+
+def test_shared_photo_is_kept(store):
+    # 同じ写真を別の学生の保存が参照していれば消さない
+    a, b = ref_of("a"), ref_of("b")
+    store.submit("01", "実験①", {"photo": json.dumps(a)}, {a: b"A"})
+    store.submit("02", "実験①", {"photo": json.dumps(a)}, {a: b"A"})
+    assert store.flush(5)
+    store.submit("01", "実験①", {"photo": json.dumps(b)}, {b: b"B"})
+    assert store.flush(5)
+    assert photo_refs(store) == {a, b}
+    _, photos = store.load("02", "実験①")
+    assert photos == {a: b"A"}
+
+
+def test_photo_replaced_within_one_batch_is_deleted(store, monkeypatch):
+    monkeypatch.setattr(autosave, "DEBOUNCE_SEC", 0.5)
+    a, b = ref_of("a"), ref_of("b")
+    store.submit("01", "実験①", {"photo": json.dumps(a)}, {a: b"A"})
+    store.submit("01", "実験①", {"photo": json.dumps(b)}, {b: b"B"})
+    assert store.flush(5)
+    assert photo_refs(store) == {b}
@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+"""派生列・集計値の式（derived.py）"""
+from graphlib import CycleError
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from derived import (
+    FC_CURRENT_COL, FC_POWER_COL, FC_TIME_COL, FC_VOLTAGE_COL, MELTING_AVG_COL, Formula, FormulaEngine,
+    derive_table, discharge_summary, thermal_fit,
+)
+from tables import empty_table
+
+nan = np.nan
+
+
+def test_melting_average_skips_blank_runs():
+    df = empty_table("melting_point_df")
+    df.iloc[0, :3] = [100.0, nan, 101.15]
+    out = derive_table("melting_point_df", df)
+    assert out[MELTING_AVG_COL].iloc[0] == pytest.approx(100.6)
+    assert np.isnan(derive_table("melting_point_df", empty_table("melting_point_df"))[MELTING_AVG_COL].iloc[0])
+
+
+def test_power_keeps_entered_value_when_inputs_are_blank():
+    df = empty_table("fc_discharge_1")
+    df[FC_VOLTAGE_COL] = [0.9, nan, 0.8, 0.7]
+    df[FC_CURRENT_COL] = [10.0, 20.0, nan, 5.0]
+    df[FC_POWER_COL] = [1.0, 2.0, 3.0, nan]
+    out = derive_table("fc_discharge_1", df)
+    assert out[FC_POWER_COL].tolist() == [9.0, 2.0, 3.0, 3.5]
+    # 元の表は書き換えない
+    assert df[FC_POWER_COL].iloc[0] == 1.0
+
+
+def test_only_affected_columns_are_recomputed():
+    df = empty_table("fc_discharge_1")
+    df[FC_VOLTAGE_COL] = 1.0
+    df[FC_CURRENT_COL] = 2.0
+    # 派生列に関係しない列の編集では計算せず、同じ表を返す
+    assert derive_table("fc_discharge_1", df, changed={FC_TIME_COL}) is df
+    assert derive_table("fc_discharge_1", df, changed={FC_CURRENT_COL})[FC_POWER_COL].tolist() == [2.0] * 4
+
+
+def test_affected_follows_derived_columns():
+    engine = FormulaEngine(
+        columns=[
+            Formula("b", ("a",), lambda a: a + 1),
+            Formula("c", ("b",), lambda b: b * 2),
+        ],
+        aggregates=[Formula("sum_c", ("c",), lambda c: float(np.nansum(c)))],
+    )
+    assert engine.affected({"a"}) == {"b", "c", "sum_c"}
+    assert engine.affected({"c"}) == {"sum_c"}
+    out = engine.derive(pd.DataFrame({"a": [1.0, 2.0], "b": nan, "c": nan}), changed={"a"})
+    assert out["c"].tolist() == [4.0, 6.0]
+
+
+def test_cyclic_formulas_are_rejected():
+    with pytest.raises(CycleError):
+        FormulaEngine(columns=[Formula("x", ("y",), lambda y: y), Formula("y", ("x",), lambda x: x)])
+
+
+def test_aggregate_is_cached_by_content():
+    calls = []
+
+    def total(a):
+        calls.append(1)
+        return float(np.nansum(a))
+
+    engine = FormulaEngine(aggregates=[Formula("test_total", ("a",), total)])
+    df = pd.DataFrame({"a": [1.0, 2.0]})
+    assert engine.aggregate(df, "test_total") == 3.0
+    assert engine.aggregate(df.copy(), "test_total") == 3.0
+    assert len(calls) == 1
+    assert engine.aggregate(pd.DataFrame({"a": [1.0, 5.0]}), "test_total") == 6.0
+    assert len(calls) == 2
+
+
+def test_discharge_summary_sorts_and_skips_blank_rows():
+    df = pd.DataFrame({
+        FC_TIME_COL: [600.0, 0.0, 300.0, 300.0, nan, 900.0],
+        FC_POWER_COL: [2.0, 4.0, 2.0, 4.0, 100.0, nan],
+    })
+    s = discharge_summary(df)
+    # 0秒: 4mW, 300秒: 3mW（平均）, 600秒: 2mW の台形則
+    assert s.energy_j == pytest.approx((3.5 * 300 + 2.5 * 300) / 1000)
+    assert s.peak_mw == 4.0
+    assert s.duration_s == 600.0
+    assert s.mean_mw == pytest.approx(s.energy_j * 1000 / 600)
+
+
+def test_thermal_fit_recovers_exact_line():
+    df = empty_table("result_df")
+    x = df["距離(cm)"].to_numpy()
+    df["銅(sec)"] = 5 + 2 * x ** 2
+    df["アルミ(sec)"] = [10.0, nan, nan, nan, nan, nan]  # 1点だけでは近似できない
+    fit = thermal_fit(df)
+    assert fit.slope[0] == pytest.approx(2)
+    assert fit.intercept[0] == pytest.approx(5)
+    assert fit.r2[0] == pytest.approx(1)
+    assert np.isnan(fit.slope[1]) and np.isnan(fit.slope[2])
@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+"""データロガーのCSVの取り込み（logger_import）"""
+import io
+
+import numpy as np
+import pytest
+
+from derived import discharge_summary
+from logger_import import (
+    DECIMATE_ROWS, LOG_KEYS, LoggerImportError, decode_log, full_table, import_logger_csv, minmax_decimate,
+)
+
+
+def discharge_csv(rows, encoding="cp932", preamble=True):
+    """1秒ごとの放電の記録（経過時間[分]・電圧(V)・電流(A)）"""
+    minutes = np.arange(rows) / 60
+    volts = 0.9 - 0.3 * minutes / max(minutes[-1], 1)
+    amps = 0.03 - 0.01 * minutes / max(minutes[-1], 1)
+    lines = ["データロガー 記録", "サンプリング間隔,1s", ""] if preamble else []
+    lines.append("経過時間[分],電圧(V),電流(A)")
+    lines += [f"{m:.5f},{v:.4f},{a:.5f}" for m, v, a in zip(minutes, volts, amps)]
+    return io.BytesIO(("\r\n".join(lines) + "\r\n").encode(encoding))
+
+
+def test_discharge_import_converts_units():
+    imported = import_logger_csv(discharge_csv(600), "fc_discharge_1")
+    full = decode_log(imported.log)
+    assert imported.rows == len(full) == 600
+    # 分→sec、A→mA、出力(mW)は派生列として計算される
+    assert full["放電時間(sec)"].iloc[-1] == pytest.approx(599, abs=1e-3)
+    assert full["放電時間(分)"].iloc[-1] == pytest.approx(599 / 60, abs=1e-4)
+    assert full["電流(mA)"].iloc[0] == pytest.approx(30.0)
+    assert full["出力(mW)"].iloc[0] == pytest.approx(0.9 * 30.0)
+    assert [col for _, col, _ in imported.mapping] == ["放電時間(sec)", "端子電圧(V)", "電流(mA)"]
+
+
+def test_utf8_without_preamble():
+    imported = import_logger_csv(discharge_csv(50, encoding="utf-8-sig", preamble=False), "fc_discharge_2")
+    assert imported.rows == 50
+    assert len(imported.table) == 50  # DECIMATE_ROWS 以下は間引かない
+
+
+def test_large_log_is_decimated_but_energy_uses_full_log():
+    imported = import_logger_csv(discharge_csv(20_000), "fc_discharge_1")
+    assert len(imported.table) <= DECIMATE_ROWS + 2
+    full = decode_log(imported.log)
+    state = {"fc_discharge_1": imported.table, LOG_KEYS["fc_discharge_1"]: "sha256:log"}
+    store = {"sha256:log": imported.log}
+    assert len(full_table(state, "fc_discharge_1", store)) == 20_000
+    # 間引いた表でも、全点の記録とほぼ同じ発生エネルギーになる
+    assert discharge_summary(imported.table).energy_j == pytest.approx(discharge_summary(full).energy_j, rel=1e-3)
+
+
+def test_full_table_without_log_is_the_table():
+    imported = import_logger_csv(discharge_csv(10), "fc_discharge_3")
+    state = {"fc_discharge_3": imported.table, LOG_KEYS["fc_discharge_3"]: None}
+    assert full_table(state, "fc_discharge_3", {}) is imported.table
+
+
+def test_melting_time_import():
+    csv = "distance_mm\tCu (s)\tAl (s)\tSUS304 (min)\n20\t10\t12\t1\n40\t25\t30\t2.5\n"
+    imported = import_logger_csv(io.BytesIO(csv.encode()), "result_df")
+    df = imported.table
+    assert df["距離(cm)"].tolist() == [2, 4]
+    assert df["銅(sec)"].tolist() == [10, 25]
+    assert df["ステンレス(sec)"].tolist() == [60, 150]
+
+
+def test_minmax_decimate_keeps_peaks():
+    imported = import_logger_csv(discharge_csv(5000), "fc_discharge_1")
+    full = decode_log(imported.log)
+    full.loc[1234, "出力(mW)"] = 999.0
+    thin = minmax_decimate(full, ["出力(mW)"])
+    assert thin["出力(mW)"].max() == 999.0
+    assert thin["放電時間(sec)"].iloc[0] == full["放電時間(sec)"].iloc[0]
+    assert thin["放電時間(sec)"].iloc[-1] == full["放電時間(sec)"].iloc[-1]
+
+
+@pytest.mark.parametrize("content", [
+    "時刻,温度\n1,2\n",           # 対応する列がない
+    "経過時間[分],電圧(V),電流(A)\n", # 数値の行がない
+])
+def test_unusable_csv(content):
+    with pytest.raises(LoggerImportError):
+        import_logger_csv(io.BytesIO(content.encode()), "fc_discharge_1")
@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+"""PDF作成の受付制御（pdf_jobs.PdfScheduler）"""
+import threading
+import time
+
+import pytest
+
+import pdf_jobs
+from pdf_jobs import PdfJob, PdfScheduler
+
+
+def wait_until(pred, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not pred():
+        if time.monotonic() > deadline:
+            raise AssertionError("時間内に条件を満たしませんでした")
+        time.sleep(0.01)
+
+
+@pytest.fixture
+def release(monkeypatch):
+    """render_report_pdf を、release がセットされるまで戻らない偽物に差し替える"""
+    event = threading.Event()
+
+    def fake_render(state, photos, progress=None, key=None):
+        progress("本文", 0.5)
+        event.wait(5)
+        if state.get("fail"):
+            raise ValueError("作成できない")
+        return b"%PDF-" + state["name"].encode()
+
+    monkeypatch.setattr(pdf_jobs, "render_report_pdf", fake_render)
+    yield event
+    event.set()
+
+
+def job(name, **state):
+    return PdfJob(f"{name}.pdf", {"name": name, **state}, {})
+
+
+def test_jobs_finish_in_order(release):
+    scheduler = PdfScheduler(1)
+    jobs = [scheduler.submit(job(f"j{i}")) for i in range(3)]
+    wait_until(lambda: jobs[0].status == "running")
+    assert [j.position() for j in jobs] == [0, 1, 2]
+    release.set()
+    wait_until(lambda: all(j.done() for j in jobs))
+    assert [j.result() for j in jobs] == [b"%PDF-j0", b"%PDF-j1", b"%PDF-j2"]
+    stats = scheduler.stats()
+    assert stats["done"] == 3 and stats["running"] == 0 and stats["queued"] == 0
+
+
+def test_failed_job_reports_error(release):
+    scheduler = PdfScheduler(1)
+    j = scheduler.submit(job("bad", fail=True))
+    release.set()
+    wait_until(j.done)
+    assert j.status == "failed"
+    with pytest.raises(ValueError):
+        j.result()
+
+
+def test_queue_timeout(release):
+    scheduler = PdfScheduler(1, queue_timeout=0.05)
+    first = scheduler.submit(job("first"))
+    wait_until(lambda: first.status == "running")
+    waiting = scheduler.submit(job("waiting"))
+    time.sleep(0.1)
+    assert waiting.done()
+    assert waiting.status == "timeout" and waiting.position() == 0
+    with pytest.raises(TimeoutError):
+        waiting.result()
+    stats = scheduler.stats()
+    assert stats["timeout"] == 1 and stats["queued"] == 0
+
+
+def test_render_timeout_keeps_slot_until_thread_returns(release):
+    scheduler = PdfScheduler(1, render_timeout=0.05)
+    slow = scheduler.submit(job("slow"))
+    wait_until(lambda: slow.status == "running")
+    time.sleep(0.1)
+    assert slow.done() and slow.status == "timeout"
+    # スレッドはまだ作成中なので、枠は空かない
+    stats = scheduler.stats()
+    assert stats["running"] == 1 and stats["abandoned"] == 1
+    nxt = scheduler.submit(job("next"))
+    assert nxt.position() == 1
+    release.set()
+    wait_until(nxt.done)
+    assert nxt.result() == b"%PDF-next"
+    assert slow.status == "timeout"
+    stats = scheduler.stats()
+    assert stats["running"] == 0 and stats["abandoned"] == 0 and stats["done"] == 1
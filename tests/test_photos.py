@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+"""写真の取り込み（photos.ingest_photo）"""
+from io import BytesIO
+
+import numpy as np
+from PIL import Image
+
+from photos import PHOTO_MAX_PX, ingest_photo
+
+
+def sample_image(width=900, height=600):
+    rng = np.random.default_rng(0)
+    y, x = np.mgrid[0:height, 0:width]
+    arr = np.stack([(x / 4) % 256, (y / 3) % 256, ((x + y) / 5) % 256], -1) + rng.normal(0, 8, (height, width, 3))
+    return Image.fromarray(np.clip(arr, 0, 255).astype("uint8"))
+
+
+def jpeg_bytes(img, **kwargs):
+    out = BytesIO()
+    img.save(out, format="JPEG", **kwargs)
+    return out.getvalue()
+
+
+def test_large_photo_is_downscaled():
+    result = ingest_photo(jpeg_bytes(sample_image(3000, 2000), quality=90))
+    assert max(result.width, result.height) == PHOTO_MAX_PX
+    assert result.stored_size < result.original_size
+
+
+def test_ingested_photo_is_kept_as_is():
+    # 取り込み済みの写真をもう一度取り込んでも再圧縮しない（保存・復元で劣化しない）
+    first = ingest_photo(jpeg_bytes(sample_image(3000, 2000), quality=90))
+    assert ingest_photo(first.data).data == first.data
+
+
+def test_small_but_heavy_jpeg_is_recompressed():
+    raw = jpeg_bytes(sample_image(), quality=100)
+    result = ingest_photo(raw)
+    assert (result.width, result.height) == (900, 600)
+    assert result.stored_size < len(raw) / 2
+
+
+def test_small_jpeg_with_exif_is_stripped_and_rotated():
+    exif = Image.Exif()
+    exif[0x0112] = 6  # 90度回転
+    exif[0x010F] = "Phone"
+    result = ingest_photo(jpeg_bytes(sample_image(), quality=80, exif=exif.tobytes()))
+    with Image.open(BytesIO(result.data)) as img:
+        assert img.size == (600, 900)
+        assert not img.info.get("exif")
@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+"""保存ファイルからのPDF作成（report_pdf）のコマンドライン"""
+import json
+
+import pytest
+
+import report_pdf
+from photos import PhotoStore
+
+THERMAL = "実験① 熱の可視化"
+
+
+def _write_json(path, data):
+    path.write_text(json.dumps(data, ensure_ascii=False), encoding="utf-8")
+    return path
+
+
+def incomplete_save():
+    """テーマの入力がほとんどない保存データ（以前のバージョンで保存したファイルなど）"""
+    return {
+        "global_info": {"student_id": "12", "student_name": "テスト", "last_exp_title": THERMAL},
+        "experiment_registry": {THERMAL: {"comparison_text": "銅がいちばん速く溶けた"}},
+    }
+
+
+def test_state_from_save_defaults_missing_keys():
+    s = report_pdf.state_from_save(incomplete_save(), PhotoStore())
+    for k in report_pdf.EXP_DATA_KEYS:
+        assert k in s
+    assert s.thermal_conductivity_ref == ""
+    assert s.apparatus_photo_data is None
+    assert s.result_df_log is None
+    assert list(s.result_df.columns)[0] == "距離(cm)"
+    assert s.comparison_text == "銅がいちばん速く溶けた"
+
+
+def test_render_incomplete_save(tmp_path):
+    save = _write_json(tmp_path / "old.json", incomplete_save())
+    out = tmp_path / "out.pdf"
+    assert report_pdf.main(["render", str(save), "-o", str(out)]) == 0
+    assert out.read_bytes().startswith(b"%PDF")
+
+
+@pytest.mark.parametrize("content", [
+    b"PK\x03\x04" + b"\x00" * 100,  # ZIPの先頭だけで末尾がない
+    b"\x00\x01not a save file",
+])
+def test_render_broken_file_reports_error(tmp_path, capsys, content):
+    save = tmp_path / "broken.zip"
+    save.write_bytes(content)
+    assert report_pdf.main(["render", str(save), "-o", str(tmp_path / "out.pdf")]) == 1
+    err = capsys.readouterr().err
+    assert err.startswith("エラー:")
+    assert "Traceback" not in err
+
+
+def test_render_unknown_title(tmp_path, capsys):
+    save = _write_json(tmp_path / "old.json", incomplete_save())
+    assert report_pdf.main(["render", str(save), "--title", "実験④"]) == 1
+    assert "実験④" in capsys.readouterr().err
@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+"""簡易自己評価（scoring.achievement_rate）"""
+import io
+
+import numpy as np
+
+from logger_import import import_logger_csv
+from photos import PhotoStore
+from report_pdf import state_from_save
+from scoring import QUESTION_DICT, achievement_rate, question_key
+
+FUEL_CELL = "実験② アルカリ型燃料電池の組み立て"
+
+
+def fuel_cell_state():
+    """基本情報・設問・考察・充電実験まで入力済みの実験②の状態（放電実験は未入力）"""
+    exp = {question_key(q): "回答 " + " ".join(words) for q, words in QUESTION_DICT[FUEL_CELL].items()}
+    exp["evaluation_method"] = "電圧と電流を測定した"
+    exp["fc_comparison_text"] = "回を重ねるごとに出力が下がった。電極の劣化が原因と考えられる。"
+    exp["fc_charge_df"] = [{"充電時間(sec)": 60, "充電電圧(V)": 3, "開回路電圧(V)": 1.2}] * 3
+    data = {
+        "global_info": {"student_id": "12", "student_name": "テスト", "last_exp_title": FUEL_CELL},
+        "experiment_registry": {FUEL_CELL: exp},
+    }
+    return state_from_save(data, PhotoStore())
+
+
+def logger_table(rows):
+    lines = ["経過時間[分],電圧(V),電流(A)"] + [f"{i / 60:.4f},{0.9 - i * 1e-5:.5f},0.03" for i in range(rows)]
+    return import_logger_csv(io.BytesIO("\n".join(lines).encode()), "fc_discharge_1").table
+
+
+def discharge_score(s):
+    """放電データの配点分（放電表以外が同じ状態との差）"""
+    empty = fuel_cell_state()
+    return achievement_rate(s)[1] - achievement_rate(empty)[1]
+
+
+def test_manual_discharge_sheets_full_score():
+    s = fuel_cell_state()
+    for k in ("fc_discharge_1", "fc_discharge_2", "fc_discharge_3"):
+        df = s[k].copy()
+        df["端子電圧(V)"] = [0.9, 0.8, 0.7, 0.6]
+        df["電流(mA)"] = [30, 28, 26, 24]
+        s[k] = df
+    assert discharge_score(s) == 15
+
+
+def test_imported_log_counts_as_one_sheet():
+    s = fuel_cell_state()
+    s["fc_discharge_1"] = logger_table(5000)
+    assert len(s.fc_discharge_1) > 4
+    # 取り込んだ1回分は、手入力の1回分（5%）と同じ配点まで
+    assert discharge_score(s) == 5
+
+
+def test_imported_logs_keep_score_within_100():
+    s = fuel_cell_state()
+    for k in ("fc_discharge_1", "fc_discharge_2", "fc_discharge_3"):
+        s[k] = logger_table(5000)
+    home, report, total, _ = achievement_rate(s)
+    assert report <= 50
+    assert total <= 100
+    assert discharge_score(s) == 15
+
+
+def test_partly_filled_log_scores_partly():
+    s = fuel_cell_state()
+    df = logger_table(100)
+    df.loc[df.index[: len(df) // 2], "電流(mA)"] = np.nan
+    s["fc_discharge_1"] = df
+    assert 0 < discharge_score(s) < 5